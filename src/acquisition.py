@@ -0,0 +1,161 @@
+"""Consumer thread draining the BrainFlow ring buffer during a sweep"""
+
+import logging
+import threading
+
+import numpy as np
+
+
+class SampleRing:
+    """
+    Preallocated ring holding the latest ``capacity`` samples of all board
+    rows. Samples are addressed by their absolute index since the start, so
+    readers can keep a cursor and ask for everything after it.
+    """
+
+    def __init__(self, n_rows, capacity):
+        self.capacity = capacity
+        self.n_written = 0
+        self.overruns = 0  # Reads that asked for samples already overwritten
+        self._data = np.zeros((n_rows, capacity))
+        self._lock = threading.Lock()
+
+    def write(self, data):
+        """Append board data of shape (n_rows, n_samples)."""
+        n = data.shape[1]
+        if n > self.capacity:
+            data = data[:, n - self.capacity :]
+        with self._lock:
+            start = (self.n_written + n - data.shape[1]) % self.capacity
+            first = min(data.shape[1], self.capacity - start)
+            self._data[:, start : start + first] = data[:, :first]
+            self._data[:, : data.shape[1] - first] = data[:, first:]
+            self.n_written += n
+
+    def _copy(self, start, stop):
+        i, j = start % self.capacity, stop % self.capacity
+        if stop - start == 0:
+            return self._data[:, :0].copy()
+        if i < j:
+            return self._data[:, i:j].copy()
+        return np.concatenate((self._data[:, i:], self._data[:, :j]), axis=1)
+
+    def read(self, since):
+        """
+        Samples from absolute index ``since`` up to now.
+
+        Returns
+        -------
+        data : ndarray, shape (n_rows, n_samples)
+        cursor : int
+            Absolute index to pass as ``since`` on the next call.
+        lost : int
+            Number of samples after ``since`` that were already overwritten.
+        """
+        with self._lock:
+            start = max(since, self.n_written - self.capacity)
+            lost = start - since
+            if lost > 0:
+                self.overruns += 1
+            return self._copy(start, self.n_written), self.n_written, lost
+
+    def latest(self, n):
+        """The last n samples (fewer if not that many were written)."""
+        with self._lock:
+            n = min(n, self.capacity, self.n_written)
+            return self._copy(self.n_written - n, self.n_written)
+
+
+class Acquisition:
+    """
+    The single consumer of the board's ring buffer. A background thread
+    drains it every ``interval`` seconds, which also keeps a BLE link busy,
+    into a ``SampleRing`` and, if given, the session file recorder.
+
+    ``drain`` can also be called directly, e.g. right before a condition
+    starts or ends. It only stages the samples in the recorder; the thread
+    writes them to the session file in whole chunks, outside the lock of
+    ``drain``, so a direct drain around a stimulus edge never waits for the
+    compression. The fill level of the board buffer is sampled at every
+    drain; a drain that finds it full counts as an overrun, as BrainFlow
+    then drops the oldest samples.
+    """
+
+    INTERVAL_SEC = 0.1
+    RING_SEC = 60
+    BOARD_BUFFER = 450000  # Samples, BrainFlow's default ring buffer size
+
+    def __init__(self, board_shim, recorder=None, interval=INTERVAL_SEC,
+                 ring_sec=RING_SEC, board_buffer=BOARD_BUFFER):
+        from brainflow.board_shim import BoardShim
+
+        board_id = board_shim.get_board_id()
+        self.board_shim = board_shim
+        self.recorder = recorder
+        self.interval = interval
+        self.board_buffer = board_buffer
+        self.sampling_rate = board_shim.get_sampling_rate(board_id)
+        self.ring = SampleRing(BoardShim.get_num_rows(board_id),
+                               int(ring_sec * self.sampling_rate))
+
+        self.n_drains = 0
+        self.fill_max = 0
+        self.board_overruns = 0
+        self.error = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        # Named after the starting thread, e.g. the rig of multi_rig.py
+        name = f"{threading.current_thread().name}-acquisition"
+        self._thread = threading.Thread(target=self._run, name=name,
+                                        daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.drain()
+                if self.recorder is not None:
+                    self.recorder.write_chunks()
+            except Exception as e:
+                logging.warning("Acquisition thread error: %s", e)
+                self.error = e
+                break
+
+    def drain(self):
+        """Move everything in the board's ring buffer into the ring."""
+        with self._lock:
+            fill = self.board_shim.get_board_data_count()
+            data = self.board_shim.get_board_data()
+            self.n_drains += 1
+            self.fill_max = max(self.fill_max, fill)
+            if fill >= self.board_buffer:
+                self.board_overruns += 1
+                logging.warning("Board buffer full, samples were dropped")
+            if data.shape[1]:
+                self.ring.write(data)
+                if self.recorder is not None:
+                    self.recorder.append(data)
+
+    def stop(self):
+        """Stop the thread and take what is left in the board buffer."""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.error is None:
+            try:
+                self.drain()
+            except Exception as e:
+                logging.warning("Acquisition final drain failed: %s", e)
+
+    def log_summary(self):
+        logging.info("Acquisition: %d samples in %d drains, board buffer fill "
+                     "max %d of %d, %d board overruns, %d ring overruns",
+                     self.ring.n_written, self.n_drains, self.fill_max,
+                     self.board_buffer, self.board_overruns,
+                     self.ring.overruns)
@@ -0,0 +1,112 @@
+"""Adaptive number of ON/OFF cycles per condition of a sweep"""
+
+import logging
+
+import numpy as np
+from scipy.stats import t as student_t
+
+
+class CycleStatistic:
+    """
+    ON-vs-OFF power of one condition, updated after every cycle.
+
+    Each cycle contributes the ratio of the ON power to the power of the OFF
+    period that follows it, in dB. The mean ratio and its confidence interval
+    (Student t) decide whether the condition has a clear response, is
+    clearly null, or needs more cycles.
+    """
+
+    def __init__(self, confidence, null_db):
+        self.confidence = confidence
+        self.null_db = null_db
+        self.ratios_db = []
+
+    def add(self, on_power, off_power):
+        self.ratios_db.append(10 * np.log10(on_power / off_power))
+
+    @property
+    def n(self):
+        return len(self.ratios_db)
+
+    @property
+    def mean_db(self):
+        return float(np.mean(self.ratios_db)) if self.ratios_db else np.nan
+
+    def half_width_db(self):
+        """Half width of the confidence interval of the mean, in dB."""
+        if self.n < 2:
+            return np.inf
+        sem = np.std(self.ratios_db, ddof=1) / np.sqrt(self.n)
+        return float(student_t.ppf(0.5 + self.confidence / 2, self.n - 1) * sem)
+
+    def verdict(self):
+        """"response", "null", or None while undecided."""
+        low = self.mean_db - self.half_width_db()
+        high = self.mean_db + self.half_width_db()
+        if low > 0:
+            return "response"
+        if -self.null_db < low and high < self.null_db:
+            return "null"
+        return None
+
+
+class AdaptiveSweep:
+    """
+    Decides per condition when enough cycles have been recorded, and skips
+    the remaining volumes of a channel/frequency once its response has
+    saturated.
+
+    A condition stops after at least ``min_cycles`` cycles once its
+    ``CycleStatistic`` has a verdict, and after ``max_cycles`` cycles in any
+    case. A response whose mean ON/OFF ratio grew less than
+    ``saturation_db`` over the response at the previous volume counts as
+    saturated.
+    """
+
+    def __init__(self, min_cycles, max_cycles, confidence=0.95, null_db=1.0,
+                 saturation_db=None):
+        self.min_cycles = min_cycles
+        self.max_cycles = max_cycles
+        self.confidence = confidence
+        self.null_db = null_db
+        self.saturation_db = saturation_db
+        self.results = []
+        self._saturated = set()
+        self._last_response = {}
+
+    def new_condition(self):
+        return CycleStatistic(self.confidence, self.null_db)
+
+    def done(self, statistic):
+        """Whether the condition can stop after its latest cycle."""
+        if statistic.n >= self.max_cycles:
+            return True
+        return statistic.n >= self.min_cycles and statistic.verdict() is not None
+
+    def saturated(self, channel, frequency):
+        return (channel, frequency) in self._saturated
+
+    def finish(self, label, channel, frequency, volume, statistic):
+        """Record the outcome of a condition and check for saturation."""
+        verdict = statistic.verdict()
+        self.results.append((label, statistic.n, statistic.mean_db,
+                             statistic.half_width_db(), verdict))
+        logging.info("Adaptive %s: %d cycles, ON/OFF %+.1f +- %.1f dB, %s",
+                     label, statistic.n, statistic.mean_db,
+                     statistic.half_width_db(), verdict or "undecided")
+
+        if verdict != "response" or self.saturation_db is None:
+            return
+        previous = self._last_response.get((channel, frequency))
+        self._last_response[(channel, frequency)] = statistic.mean_db
+        if previous is not None and statistic.mean_db < previous + self.saturation_db:
+            logging.info("Response of channel %d at %d Hz saturated at volume "
+                         "%d, skipping higher volumes", channel, frequency,
+                         volume)
+            self._saturated.add((channel, frequency))
+
+    def log_summary(self, n_skipped):
+        cycles = sum(n for _, n, _, _, _ in self.results)
+        logging.info("Adaptive: %d of %d cycles recorded, %d conditions "
+                     "skipped as saturated", cycles,
+                     self.max_cycles * len(self.results), n_skipped)
@@ -0,0 +1,142 @@
+"""Startup time of the command line scripts, to keep heavy imports deferred"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# Scripts whose --help, argument checks and file listing should start fast
+SCRIPTS = ["measure_report", "sweep_CH_Vol_Freq_diff_ON_OFF", "multi_rig", "v1"]
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)")
+
+
+def import_times(module):
+    """
+    Import module in a fresh interpreter with ``-X importtime``.
+
+    Returns
+    -------
+    total_s : float
+        Cumulative import time of module.
+    packages : dict
+        Cumulative import time in s per top-level package it pulled in.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SRC_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # Imports are listed after the imports they trigger, so the packages
+    # module pulled in are those since the previous top-level import
+    total_s, packages = 0.0, {}
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME.match(line)
+        if match is None:
+            continue
+        cumulative = int(match.group(2)) / 1e6
+        indent, name = len(match.group(3)), match.group(4)
+        if name == module:
+            total_s = cumulative
+            break
+        if indent == 0:
+            packages = {}
+        elif "." not in name:
+            packages[name] = max(packages.get(name, 0.0), cumulative)
+
+    return total_s, packages
+
+
+def help_time(script):
+    """Wall time of ``python script.py --help`` in a fresh interpreter."""
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, f"{script}.py", "--help"],
+        cwd=SRC_DIR,
+        capture_output=True,
+        check=True,
+    )
+    return time.perf_counter() - start
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Measure the import time and --help latency of the scripts."
+    )
+    parser.add_argument(
+        "scripts",
+        nargs="*",
+        default=SCRIPTS,
+        help=f"Scripts to measure, without .py (default: {' '.join(SCRIPTS)})",
+    )
+    parser.add_argument(
+        "-n",
+        "--repeat",
+        type=int,
+        default=5,
+        help="Runs per script, the median is reported (default: 5)",
+    )
+    parser.add_argument(
+        "-o", "--output", type=str, help="Also write the results to this JSON file"
+    )
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        help="Exit with status 1 if a script takes longer than this for --help",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbosity",
+        type=str,
+        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+        default="INFO",
+        help="Logging verbosity level (default: INFO).",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(
+        level=getattr(logging, args.verbosity),
+        format="[%(asctime)s] %(levelname)s: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+
+    results = {}
+    for script in args.scripts:
+        imports = [import_times(script) for _ in range(args.repeat)]
+        packages = imports[-1][1]
+        results[script] = {
+            "import_s": float(np.median([total for total, _ in imports])),
+            "help_s": float(np.median([help_time(script) for _ in range(args.repeat)])),
+            "slowest_packages": dict(sorted(packages.items(), key=lambda p: -p[1])[:5]),
+        }
+
+    print(f"{'script':<32} {'import s':>9} {'--help s':>9}  slowest imports")
+    for script, r in results.items():
+        slowest = ", ".join(f"{k} {v:.3f}" for k, v in r["slowest_packages"].items())
+        print(f"{script:<32} {r['import_s']:>9.3f} {r['help_s']:>9.3f}  {slowest}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        logging.info("Results written to %s", args.output)
+
+    if args.max_seconds is not None:
+        slow = [s for s, r in results.items() if r["help_s"] > args.max_seconds]
+        if slow:
+            logging.error("Slower than %.2f s: %s", args.max_seconds, ", ".join(slow))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
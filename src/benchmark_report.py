@@ -0,0 +1,363 @@
+"""Benchmark of the measure_report.py stages on synthetic recordings"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import mne  # noqa: E402
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from live_analysis import BOARD_CHANNELS  # noqa: E402
+from measure_report import PLOTS, process_file  # noqa: E402
+from signal_quality import MAX_FLAT_S, MAX_SATURATION  # noqa: E402
+from stage_timer import StageTimer  # noqa: E402
+
+# CSV layout of the BrainFlow recordings read by measure_report.py
+BOARDS = {
+    "freeeeg32": {
+        "sfreq": 512,
+        "n_columns": 35,
+        "eeg_columns": range(1, 33),
+        "timestamp_column": 33,
+        "event_column": 34,
+        "channels": BOARD_CHANNELS["FREEEEG32_BOARD"],
+        "mentalab": False,
+    },
+    "mentalab": {
+        "sfreq": 1000,
+        "n_columns": 12,
+        "eeg_columns": range(1, 9),
+        "timestamp_column": 10,
+        "event_column": 11,
+        "channels": BOARD_CHANNELS["EXPLORE_8_CHAN_BOARD"],
+        "mentalab": True,
+    },
+}
+
+ON, OFF = 1, 11
+NOISE_UV = 5.0
+MAINS_UV = 2.0
+RESPONSE_UV = 2.0
+RESPONSE_HZ = 40
+CHUNK_SEC = 60  # Recordings are generated and written minute by minute
+
+
+def write_recording(path, board, duration, cycle, seed=0):
+    """
+    Write a synthetic BrainFlow CSV recording of duration seconds.
+
+    Markers alternate between OFF and ON every cycle seconds, starting with
+    OFF after the first cycle. Every EEG channel holds noise and mains hum;
+    during ON a response at RESPONSE_HZ is added to C3 and subtracted from
+    C4. Mentalab timestamps get Bluetooth-like jitter, with an occasional
+    pair of samples swapped, so resampling has work to do.
+
+    Returns
+    -------
+    int
+        Number of markers written.
+    """
+    layout = BOARDS[board]
+    sfreq = layout["sfreq"]
+    eeg = list(layout["eeg_columns"])
+    c3, c4 = layout["channels"]["C3"], layout["channels"]["C4"]
+    n_samples = int(duration * sfreq)
+    cycle_samples = max(1, int(cycle * sfreq))
+    rng = np.random.default_rng(seed)
+    t0 = 1.7e9
+    n_markers = 0
+
+    with open(path, "w") as f:
+        for start in range(0, n_samples, CHUNK_SEC * sfreq):
+            idx = np.arange(start, min(start + CHUNK_SEC * sfreq, n_samples))
+            t = idx / sfreq
+            data = np.zeros((len(idx), layout["n_columns"]))
+            data[:, 0] = idx % 256  # Package counter
+            data[:, eeg] = rng.normal(0, NOISE_UV, (len(idx), len(eeg)))
+            data[:, eeg] += MAINS_UV * np.sin(2 * np.pi * 50 * t)[:, None]
+
+            period = idx // cycle_samples
+            on = (period > 0) & (period % 2 == 0)
+            response = on * RESPONSE_UV * np.sin(2 * np.pi * RESPONSE_HZ * t)
+            data[:, c3] += response
+            data[:, c4] -= response
+
+            boundary = (idx % cycle_samples == 0) & (period > 0)
+            data[boundary, layout["event_column"]] = np.where(on[boundary], ON, OFF)
+            n_markers += int(boundary.sum())
+
+            timestamps = t0 + t
+            if layout["mentalab"]:
+                timestamps += rng.normal(0, 0.1 / sfreq, len(idx))
+                swap = np.flatnonzero(rng.random(len(idx) - 1) < 1 / sfreq)
+                timestamps[swap], timestamps[swap + 1] = (
+                    timestamps[swap + 1],
+                    timestamps[swap],
+                )
+            data[:, layout["timestamp_column"]] = timestamps
+
+            np.savetxt(f, data, fmt="%.6f", delimiter="\t")
+
+    return n_markers
+
+
+def run_once(cfg, path, trace_memory):
+    """Process a recording as measure_report.py does, timing each stage."""
+    timer = StageTimer(trace_memory)
+    start = time.perf_counter()
+    try:
+        process_file(cfg, path, timer)
+    finally:
+        timer.stop()
+    return timer.records, time.perf_counter() - start
+
+
+def benchmark(board, duration, cycle, args, data_dir, out_dir):
+    """Generate one recording and benchmark its processing."""
+    layout = BOARDS[board]
+    path = os.path.join(data_dir, f"{board}_{duration:g}s_cycle{cycle:g}s.csv")
+    start = time.perf_counter()
+    n_markers = write_recording(path, board, duration, cycle, args.seed)
+    generate_s = time.perf_counter() - start
+    logging.info(
+        "Generated %s (%.1f MB) in %.1f s",
+        path,
+        os.path.getsize(path) / 1e6,
+        generate_s,
+    )
+
+    cfg = SimpleNamespace(
+        mentalab=layout["mentalab"],
+        resample=layout["mentalab"],
+        output_dir=os.path.join(out_dir, ""),
+        cache=False,
+        cache_dir=None,
+        stream=False,
+        summary=False,
+        plots=PLOTS,
+        max_saturation=MAX_SATURATION,
+        max_flat=MAX_FLAT_S,
+        max_line_noise=None,
+        max_bad_channels=None,
+        exclude_bad=False,
+    )
+
+    stages = {}
+    totals = []
+    for _ in range(args.repeat):
+        records, total = run_once(cfg, path, trace_memory=False)
+        totals.append(total)
+        for record in records:
+            stage = stages.setdefault(record.stage, {"wall_s": [], "cpu_s": []})
+            stage["wall_s"].append(record.wall_s)
+            stage["cpu_s"].append(record.cpu_s)
+
+    for stage in stages.values():
+        stage["median_s"] = float(np.median(stage["wall_s"]))
+        stage["min_s"] = float(np.min(stage["wall_s"]))
+        stage["median_cpu_s"] = float(np.median(stage["cpu_s"]))
+
+    peak_mb = None
+    if args.memory:
+        records, _ = run_once(cfg, path, trace_memory=True)
+        for record in records:
+            stages[record.stage]["peak_mb"] = record.peak_bytes / 1e6
+            stages[record.stage]["delta_mb"] = record.delta_bytes / 1e6
+        peak_mb = max(record.peak_bytes for record in records) / 1e6
+
+    return {
+        "board": board,
+        "duration_s": duration,
+        "cycle_s": cycle,
+        "sfreq": layout["sfreq"],
+        "n_samples": int(duration * layout["sfreq"]),
+        "n_markers": n_markers,
+        "file_mb": os.path.getsize(path) / 1e6,
+        "generate_s": generate_s,
+        "total_s": float(np.median(totals)),
+        "peak_mb": peak_mb,
+        "stages": stages,
+    }
+
+
+def environment():
+    import scipy
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "pandas": pd.__version__,
+        "mne": mne.__version__,
+        "matplotlib": matplotlib.__version__,
+    }
+
+
+def summary_table(runs, baseline=None):
+    """Median seconds (and peak MB) per run and stage, with the speedup over
+    the matching run of a baseline result if given."""
+    reference = {}
+    for run in (baseline or {}).get("runs", []):
+        reference[(run["board"], run["duration_s"], run["cycle_s"])] = run
+
+    rows = []
+    for run in runs:
+        before = reference.get((run["board"], run["duration_s"], run["cycle_s"]))
+        stages = dict(run["stages"], total={"median_s": run["total_s"]})
+        stages["total"]["peak_mb"] = run["peak_mb"]
+        for stage, result in stages.items():
+            row = {
+                "board": run["board"],
+                "duration_s": run["duration_s"],
+                "stage": stage,
+                "median_s": result["median_s"],
+                "peak_mb": result.get("peak_mb"),
+            }
+            if before is not None:
+                if stage == "total":
+                    old = before["total_s"]
+                else:
+                    old = before["stages"].get(stage, {}).get("median_s")
+                row["speedup"] = old / result["median_s"] if old else np.nan
+            rows.append(row)
+
+    return pd.DataFrame(rows)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the measure_report.py stages on synthetic recordings."
+    )
+    parser.add_argument("output", help="JSON file the results are written to")
+    parser.add_argument(
+        "-b",
+        "--boards",
+        nargs="+",
+        choices=list(BOARDS),
+        default=list(BOARDS),
+        help="Recording formats to benchmark (default: all)",
+    )
+    parser.add_argument(
+        "-d",
+        "--durations",
+        nargs="+",
+        type=float,
+        default=[600],
+        help="Recording durations in seconds (default: 600)",
+    )
+    parser.add_argument(
+        "-c",
+        "--cycle",
+        type=float,
+        default=10,
+        help="Seconds between ON/OFF markers (default: 10)",
+    )
+    parser.add_argument(
+        "-n",
+        "--repeat",
+        type=int,
+        default=3,
+        help="Timed runs per recording, the median is reported (default: 3)",
+    )
+    parser.add_argument(
+        "--no-memory",
+        dest="memory",
+        action="store_false",
+        help="Skip the extra run that traces peak memory per stage",
+    )
+    parser.add_argument(
+        "--data-dir",
+        help="Keep the synthetic recordings and plots in this directory "
+        "(default: a temporary directory, removed afterwards)",
+    )
+    parser.add_argument(
+        "--baseline",
+        help="Earlier JSON result to report the speedup per stage against",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument(
+        "-v",
+        "--verbosity",
+        type=str,
+        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+        default="INFO",
+        help="Logging verbosity level (default: INFO).",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(
+        level=getattr(logging, args.verbosity),
+        format="[%(asctime)s] %(levelname)s: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    if args.repeat < 1:
+        logging.error("Number of runs must be at least 1, got %d", args.repeat)
+        sys.exit(1)
+    if min(args.durations) < 4 * args.cycle:
+        # measure_report.py needs an ON epoch followed by an OFF marker
+        logging.error("Durations must be at least 4 cycles of %g s", args.cycle)
+        sys.exit(1)
+    mne.viz.set_browser_backend("matplotlib")
+    mne.set_log_level("WARNING")
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="measure_benchmark_")
+    out_dir = os.path.join(data_dir, "out")
+    os.makedirs(out_dir, exist_ok=True)
+
+    runs = []
+    try:
+        for board in args.boards:
+            for duration in args.durations:
+                runs.append(
+                    benchmark(board, duration, args.cycle, args, data_dir, out_dir)
+                )
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir)
+
+    result = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "environment": environment(),
+        "settings": {
+            "repeat": args.repeat,
+            "memory": args.memory,
+            "cycle_s": args.cycle,
+            "seed": args.seed,
+        },
+        "runs": runs,
+    }
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+    logging.info("Results written to %s", args.output)
+
+    with pd.option_context(
+        "display.width", 120, "display.float_format", "{:.3f}".format
+    ):
+        print(summary_table(runs, baseline).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""Virtual clock, simulated VHP and synthetic board for dry runs of a sweep
+
+In a dry run every wait of the sweep advances a virtual clock instead of
+sleeping, the VHP is replaced by a pseudo-terminal that speaks its serial
+protocol, and the EEG board by a generator that adds a response at the
+stimulation frequency to C3 and C4 while the VHP is streaming. A whole sweep
+runs in seconds and writes the same CSV or session files as a real one.
+"""
+
+import logging
+import os
+import pty
+import threading
+import time
+import tty
+
+import numpy as np
+
+from live_analysis import BOARD_CHANNELS
+
+
+class VirtualClock:
+    """
+    Clock that only advances when ``sleep`` is called. Callbacks registered
+    with ``on_advance`` run after every advance, e.g. to generate samples.
+    """
+
+    def __init__(self):
+        self.t = 0.0
+        self._callbacks = []
+
+    def now(self):
+        return self.t
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.t += seconds
+        for callback in self._callbacks:
+            callback()
+
+    def on_advance(self, callback):
+        self._callbacks.append(callback)
+
+
+class FakeVHP:
+    """
+    VHP firmware simulated behind a pseudo-terminal. Every command line is
+    acknowledged with one reply line, ``S`` and ``X`` with several. The
+    stimulation state is kept for the synthetic board.
+    """
+
+    FIRMWARE = "F2Heal VHP dry run"
+
+    def __init__(self):
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)  # Slave kept open, so the port never hangs up
+        self.port = os.ttyname(self._slave)
+
+        self.params = {"C": 0, "V": 0, "F": 0, "D": 0, "Y": 0, "P": 0, "Q": 0,
+                       "J": 0, "M": 0}
+        self.streaming = False
+        self.commands = []
+        self._lock = threading.Lock()
+        name = f"{threading.current_thread().name}-fake-vhp"
+        threading.Thread(target=self._serve, name=name, daemon=True).start()
+
+    def state(self):
+        """(streaming, channel, frequency, volume) of the stimulation."""
+        with self._lock:
+            return (self.streaming, self.params["C"], self.params["F"],
+                    self.params["V"])
+
+    def _reply(self, command):
+        with self._lock:
+            self.commands.append(command)
+            key, value = command[:1], command[1:]
+            if key in self.params and value.lstrip("-").isdigit():
+                self.params[key] = int(value)
+                return [f"{key}={value}"]
+            if command in ("1", "0"):
+                self.streaming = command == "1"
+                return ["Stream " + ("started" if self.streaming else "stopped")]
+            if command == "S":
+                return [self.FIRMWARE, "Stream " + str(int(self.streaming))]
+            if command == "X":
+                return [f"{k}={v}" for k, v in self.params.items()]
+            return [f"Unknown command {command}"]
+
+    def _serve(self):
+        buffer = b""
+        while True:
+            try:
+                buffer += os.read(self._master, 1024)
+            except OSError:
+                return
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                command = line.decode("utf-8", errors="ignore").strip()
+                if command:
+                    reply = "".join(f"{r}\r\n" for r in self._reply(command))
+                    os.write(self._master, reply.encode("utf-8"))
+
+
+class SyntheticBoard:
+    """
+    Stand-in for a ``BoardShim`` with the data layout of BrainFlow board
+    ``board_id``, generating samples as the virtual clock advances.
+
+    Every EEG channel gets noise and a little mains hum. While the VHP
+    streams, a sine at its frequency is added to C3 and subtracted from C4;
+    its amplitude grows with the volume up to ``SATURATION_VOLUME``. Markers
+    and file streamers behave as in BrainFlow.
+
+    Samples are generated at the rate measure_report.py assumes for the
+    board, which for the Mentalab Explore is not BrainFlow's nominal rate;
+    ``get_sampling_rate`` returns it for the rest of the sweep.
+    """
+
+    # Boards that measure_report.py processes at another rate than BrainFlow's
+    SAMPLING_RATES = {"EXPLORE_8_CHAN_BOARD": 1000}
+
+    NOISE_UV = 5.0
+    MAINS_UV = 2.0
+    RESPONSE_UV = 2.0
+    SATURATION_VOLUME = 60
+
+    def __init__(self, board_id, clock, vhp, channels=None, seed=0):
+        from brainflow.board_shim import BoardIds, BoardShim
+
+        self.board_id = board_id
+        self.clock = clock
+        self.vhp = vhp
+        self.sampling_rate = self.SAMPLING_RATES.get(
+            BoardIds(board_id).name, BoardShim.get_sampling_rate(board_id))
+        self.n_rows = BoardShim.get_num_rows(board_id)
+        self.eeg_rows = BoardShim.get_eeg_channels(board_id)
+        self.timestamp_row = BoardShim.get_timestamp_channel(board_id)
+        self.marker_row = BoardShim.get_marker_channel(board_id)
+        channels = (channels or BOARD_CHANNELS.get(BoardIds(board_id).name)
+                    or {"C3": self.eeg_rows[0], "C4": self.eeg_rows[1]})
+        self.c3, self.c4 = channels["C3"], channels["C4"]
+
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self._prepared = False
+        self._streaming = False
+        self._t0 = 0.0
+        self._unix_t0 = 0.0
+        self._n_generated = 0
+        self._buffer = []
+        self._marker = None
+        self._streamers = {}
+        clock.on_advance(self._generate)
+
+    def get_board_id(self):
+        return self.board_id
+
+    def get_sampling_rate(self, board_id):
+        return self.sampling_rate
+
+    def prepare_session(self):
+        self._prepared = True
+
+    def is_prepared(self):
+        return self._prepared
+
+    def release_session(self):
+        self.stop_stream()
+        self._prepared = False
+
+    def start_stream(self, buffer_size=450000):
+        with self._lock:
+            self._streaming = True
+            self._t0 = self.clock.now()
+            self._unix_t0 = time.time()
+            self._n_generated = 0
+
+    def stop_stream(self):
+        self._generate()
+        with self._lock:
+            self._streaming = False
+
+    def insert_marker(self, value):
+        self._generate()
+        with self._lock:
+            self._marker = value  # Lands on the next sample, as in BrainFlow
+
+    def add_streamer(self, streamer_params):
+        path, mode = streamer_params[len("file://"):].rsplit(":", 1)
+        self._generate()
+        with self._lock:
+            self._streamers[streamer_params] = open(path, mode)
+
+    def delete_streamer(self, streamer_params):
+        self._generate()
+        with self._lock:
+            self._streamers.pop(streamer_params).close()
+
+    def get_board_data_count(self):
+        self._generate()
+        with self._lock:
+            return sum(block.shape[1] for block in self._buffer)
+
+    def get_board_data(self):
+        self._generate()
+        with self._lock:
+            if not self._buffer:
+                return np.zeros((self.n_rows, 0))
+            data = np.concatenate(self._buffer, axis=1)
+            self._buffer = []
+            return data
+
+    def _generate(self):
+        """Generate the samples up to the current time of the clock."""
+        with self._lock:
+            if not self._streaming:
+                return
+            n_due = int((self.clock.now() - self._t0) * self.sampling_rate)
+            n = n_due - self._n_generated
+            if n <= 0:
+                return
+
+            t = (self._n_generated + np.arange(n)) / self.sampling_rate
+            data = np.zeros((self.n_rows, n))
+            data[0] = (self._n_generated + np.arange(n)) % 256  # Package counter
+            data[self.eeg_rows] = self._rng.normal(0, self.NOISE_UV,
+                                                   (len(self.eeg_rows), n))
+            data[self.eeg_rows] += self.MAINS_UV * np.sin(2 * np.pi * 50 * t)
+
+            streaming, _, frequency, volume = self.vhp.state()
+            if streaming and frequency > 0:
+                gain = min(volume, self.SATURATION_VOLUME) / self.SATURATION_VOLUME
+                response = self.RESPONSE_UV * gain * np.sin(2 * np.pi * frequency * t)
+                data[self.c3] += response
+                data[self.c4] -= response
+
+            data[self.timestamp_row] = self._unix_t0 + t
+            if self._marker is not None:
+                data[self.marker_row, 0] = self._marker
+                self._marker = None
+
+            self._n_generated = n_due
+            self._buffer.append(data)
+            for f in self._streamers.values():
+                np.savetxt(f, data.T, fmt="%.6f", delimiter="\t")
+
+
+def log_dry_run(clock, vhp, started):
+    """Log how much faster than real time the dry run was."""
+    elapsed = time.perf_counter() - started
+    logging.info("Dry run: %.1f s of sweep in %.1f s, %d VHP commands",
+                 clock.now(), elapsed, len(vhp.commands))
@@ -0,0 +1,800 @@
+"""Loading, filtering and plotting of a single recording for measure_report.py
+
+Kept apart from the command line handling in measure_report.py, so MNE,
+matplotlib, pandas and SciPy are only imported once a file is processed.
+"""
+
+import logging
+import os
+from collections import deque
+
+import matplotlib.pyplot as plt
+import mne
+import numpy as np
+import pandas as pd
+
+from envelope_plot import plot_envelope
+from marker_epochs import MarkerEpochs
+from recording_cache import RecordingCache
+from session_file import SessionReader, SessionSource
+from signal_quality import SignalQuality
+from stage_timer import stage
+from streaming import (
+    EpochPSDStats,
+    StreamingFIR,
+    WelchAccumulator,
+    design_filter_bank,
+    fir_filter,
+)
+
+
+def output_base(cfg, filename):
+    """Path prefix of the output files of a recording."""
+    if isinstance(filename, SessionSource):
+        return cfg.output_dir + filename.condition
+    return cfg.output_dir + os.path.splitext(os.path.basename(filename))[0]
+
+
+class EEGCSVLoader:
+    """Loads EEG data from a FreeEEG32 CSV and converts to MNE Raw object."""
+
+    CHANNEL_TYPES = ["eeg"] * 8 + ["stim"]
+    CHANNEL_COLUMNS = list(range(1, 9))
+    NOTCH_FREQS = [50, 100, 150]
+    EVENT_ID = {"ON": 1, "OFF": 11}
+    DPI = 300
+    TIMESERIES_SEC = 300
+    GAP_FACTOR = 2  # Timestamp intervals above this times the median are gaps
+
+    def __init__(self, cfg, filename, fmin, fmax, stages=None):
+        self.filename = filename
+        self.fmin = fmin
+        self.fmax = fmax
+        self.stages = stages  # e.g. a StageTimer, called with the stage name
+
+        self.mentalab = cfg.mentalab
+        self.resample = cfg.resample
+        self.quality_limits = (cfg.max_saturation, cfg.max_flat, cfg.max_line_noise)
+        self.max_bad_channels = cfg.max_bad_channels
+        self.exclude_bad = cfg.exclude_bad
+        self.bads = {}  # Reasons per bad EEG channel
+        self.skipped = False  # Too many bad channels to be processed
+
+        self.out_base = output_base(cfg, filename)
+        self.artifacts = []  # Output files written so far
+        if isinstance(filename, SessionSource):
+            self.session = SessionReader(filename.path)
+            self.cache = None  # Already stored in binary form
+        else:
+            self.session = None
+            self.cache = RecordingCache(cfg.cache_dir) if cfg.cache else None
+
+        if self.mentalab:
+            self.channel_names = [
+                "CP3",
+                "CP4",
+                "C2",
+                "C6",
+                "C1",
+                "C4",
+                "C3",
+                "C5",
+                "STI 014",
+            ]
+
+            self.sfreq = 1000
+            self.rail_uv = 400000
+            self.timestamp_column = 10
+            self.event_column = 11
+        else:  # FreeEEG32 config
+            self.channel_names = [
+                "T7",
+                "T8",
+                "C3",
+                "C4",
+                "FC3",
+                "FC4",
+                "CP3",
+                "CP4",
+                "STI 014",
+            ]
+            self.sfreq = 512
+            self.rail_uv = 312500
+            self.timestamp_column = 33
+            self.event_column = 34
+
+        with self._stage("load"):
+            self._load()
+
+    def _used_columns(self):
+        return self.CHANNEL_COLUMNS + [self.timestamp_column, self.event_column]
+
+    def _cache_layout(self):
+        return (
+            f"c{self.CHANNEL_COLUMNS[0]}-{self.CHANNEL_COLUMNS[-1]}"
+            f"_t{self.timestamp_column}_e{self.event_column}"
+        )
+
+    def _read_columns(self):
+        """
+        Return the EEG channels, timestamps and markers of the recording, from
+        the binary cache when it is up to date, otherwise parsed from the CSV.
+        """
+        if self.session is not None:
+            data = self.session.read(self.filename.condition, self._used_columns())
+            return data[:, :-2], data[:, -2], data[:, -1]
+
+        if self.cache is not None:
+            cached = self.cache.load(self.filename, self._cache_layout())
+            if cached is not None:
+                return cached
+
+        data = pd.read_csv(
+            self.filename,
+            header=None,
+            delimiter="\t",
+            usecols=self._used_columns(),
+        )
+        channels = data[self.CHANNEL_COLUMNS].to_numpy()  # (n_samples, n_channels)
+        timestamps = data[self.timestamp_column].to_numpy()
+        markers = data[self.event_column].to_numpy()
+
+        if self.cache is not None:
+            self.cache.store(
+                self.filename, self._cache_layout(), channels, timestamps, markers
+            )
+
+        return channels, timestamps, markers
+
+    def _output(self, suffix):
+        """Path of an output file of this recording, added to artifacts."""
+        fname = self.out_base + suffix
+        self.artifacts.append(fname)
+        return fname
+
+    def _stage(self, name):
+        return stage(self.stages, name)
+
+    def _new_quality(self):
+        return SignalQuality(self.channel_names[:-1], self.sfreq, self.rail_uv)
+
+    def _screen(self, quality):
+        """
+        Find the bad channels of the scanned recording, write its quality
+        table as CSV and decide whether it is worth processing: not if more
+        than max_bad_channels are bad or, with exclude_bad, if no channel is
+        good.
+        """
+        name = os.path.basename(self.out_base)
+        self.bads = quality.bad_channels(*self.quality_limits)
+        quality.log_summary(name, self.bads)
+
+        n_bad = len(self.bads)
+        self.skipped = (self.exclude_bad and n_bad == len(quality.ch_names)) or (
+            self.max_bad_channels is not None and n_bad > self.max_bad_channels
+        )
+        if self.skipped:
+            logging.warning("%s: skipped, %d bad channel(s)", name, n_bad)
+
+        table = pd.DataFrame(quality.table())
+        table["bad"] = table["channel"].isin(list(self.bads))
+        table["reasons"] = [
+            "; ".join(self.bads.get(channel, [])) for channel in table["channel"]
+        ]
+        table["skipped"] = self.skipped
+        table.to_csv(self._output("_quality.csv"), index=False)
+
+    def _load(self):
+        """Read CSV, create MNE Raw object, filter and store as .raw."""
+        with self._stage("parse"):
+            channels, timestamps, events_column = self._read_columns()
+
+        # Screened on the samples as recorded, before anything is filtered
+        with self._stage("quality"):
+            quality = self._new_quality()
+            quality.add(channels)
+            self._screen(quality)
+        if self.skipped:
+            return
+
+        if self.mentalab and self.resample:
+            with self._stage("resample"):
+                channels, timestamps, events_column = self._resample_data(
+                    channels, timestamps, events_column
+                )
+
+        with self._stage("stim"):
+            eeg_data = channels.T / 1e6  # Convert µV to V, (n_channels, n_samples)
+
+            # Stim channel
+            marker_idx = np.flatnonzero(events_column)
+            stim_data = self._fill_stim_channel(events_column, marker_idx)
+
+            all_data = np.vstack((eeg_data, stim_data[np.newaxis, :]))
+
+            info = mne.create_info(self.channel_names, self.sfreq, self.CHANNEL_TYPES)
+            if self.exclude_bad:  # Otherwise only reported
+                info["bads"] = list(self.bads)
+            raw = mne.io.RawArray(all_data, info, verbose=False)
+            raw.set_montage("standard_1020", match_case=False)
+
+        # Band-pass and notch filtering in one pass
+        with self._stage("filter"):
+            self._filter_raw(raw)
+
+        # Bipolar derivation
+        with self._stage("bipolar"):
+            raw_bipolar = mne.set_bipolar_reference(
+                raw,
+                anode="C3",
+                cathode="C4",
+                ch_name="C3-C4",
+                drop_refs=False,
+                on_bad="ignore",  # C3-C4 becomes bad, already logged
+                verbose=False,
+            )
+
+        self.raw = raw_bipolar
+
+        with self._stage("find_events"):
+            self.events = self._marker_steps(
+                events_column[marker_idx], marker_idx, len(events_column)
+            )
+            self.marker_epochs = MarkerEpochs(self.events)
+
+    def _filter_raw(self, raw):
+        """
+        Filter all EEG channels of raw, also those in ``info["bads"]``, as
+        ``raw.filter(fmin, fmax)`` followed by
+        ``raw.notch_filter(NOTCH_FREQS, method="fir")`` would, with their
+        combined kernel from the filter bank in a single pass.
+        """
+        h = design_filter_bank(
+            self.sfreq, self.fmin, self.fmax, tuple(self.NOTCH_FREQS)
+        )
+        picks = mne.pick_types(raw.info, eeg=True, exclude=[])
+        raw.apply_function(lambda x: fir_filter(h, x), picks=picks, channel_wise=False)
+        with raw.info._unlock():  # Recorded as raw.filter does
+            raw.info["highpass"] = float(self.fmin)
+            raw.info["lowpass"] = float(self.fmax)
+
+    @staticmethod
+    def _fill_stim_channel(events_column, marker_idx):
+        """Forward-fill the sparse marker column: every sample holds the value of
+        the most recent non-zero marker (0 before the first one)."""
+        last_marker = np.zeros(len(events_column), dtype=np.intp)
+        last_marker[marker_idx] = marker_idx
+        np.maximum.accumulate(last_marker, out=last_marker)
+
+        return events_column[last_marker].astype(float)
+
+    @staticmethod
+    def _marker_steps(values, marker_idx, n_samples, shortest_event=2):
+        """
+        Build the event table straight from the non-zero markers.
+
+        Equivalent to ``mne.find_events(raw, output="step", consecutive=True)``
+        on the forward-filled stim channel, without scanning every sample.
+
+        Parameters
+        ----------
+        values : ndarray
+            Marker values at ``marker_idx``.
+        marker_idx : ndarray
+            Sample indices of the non-zero markers, ascending.
+        n_samples : int
+            Length of the recording in samples.
+        shortest_event : int
+            Minimum number of samples between steps, as in MNE.
+
+        Returns
+        -------
+        ndarray, shape (n_events, 3)
+            Rows of ``[sample, previous value, new value]``.
+        """
+        values = np.abs(values.astype(np.int64))
+        previous = np.concatenate(([0], values[:-1]))
+
+        # A step is a marker that changes the held value; like MNE, a marker on
+        # the very first sample is the initial value and not an event.
+        is_step = (values != previous) & (marker_idx > 0)
+        steps = np.column_stack(
+            (marker_idx[is_step], previous[is_step], values[is_step])
+        ).astype(np.int64)
+
+        if len(values) == 0 or not np.any(steps[:, 2] > 0):
+            return np.empty((0, 3), dtype=np.int64)
+
+        # Channel returns to 0 past the end of the recording
+        steps = np.vstack((steps, [n_samples, values[-1], 0]))
+
+        n_short_events = np.sum(np.diff(steps[:, 0]) < shortest_event)
+        if n_short_events > 0:
+            raise ValueError(
+                f"You have {n_short_events} events shorter than the shortest_event."
+            )
+
+        return steps
+
+    def _resample_data(self, values, timestamps, events):
+        """
+        Resample a Mentalab recording onto a uniform grid at sfreq.
+
+        Samples are put in timestamp order and duplicated timestamps are
+        dropped, so reordered packets from Bluetooth dropouts do not corrupt the
+        interpolation. All channels are interpolated linearly in one pass and
+        every marker is moved to the nearest grid point. Gaps are bridged by
+        the interpolation; their statistics are logged and kept in
+        ``timestamp_stats``.
+        """
+        order = np.argsort(timestamps, kind="stable")
+        sorted_ts = timestamps[order]
+        unique = np.concatenate(([True], np.diff(sorted_ts) > 0))
+        sorted_ts = sorted_ts[unique]
+        sorted_values = values[order[unique]]
+
+        self.timestamp_stats = self._timestamp_stats(timestamps, sorted_ts)
+
+        uniform_timestamps = np.arange(sorted_ts[0], sorted_ts[-1], 1 / self.sfreq)
+        if len(uniform_timestamps) < 2:
+            raise ValueError(f"{self.filename}: recording too short to resample")
+
+        # Enclosing original samples and interpolation weight per grid point
+        right = np.searchsorted(sorted_ts, uniform_timestamps, side="right")
+        right = np.clip(right, 1, len(sorted_ts) - 1)
+        left = right - 1
+        weight = (uniform_timestamps - sorted_ts[left]) / (
+            sorted_ts[right] - sorted_ts[left]
+        )
+        interp_values = sorted_values[left]
+        interp_values += weight[:, None] * (sorted_values[right] - interp_values)
+
+        # Nearest grid point per marker, ties go to the earlier one
+        marker_idx = np.flatnonzero(events)
+        marker_ts = timestamps[marker_idx]
+        nearest = np.searchsorted(uniform_timestamps, marker_ts)
+        nearest = np.clip(nearest, 1, len(uniform_timestamps) - 1)
+        nearest -= np.abs(uniform_timestamps[nearest - 1] - marker_ts) <= np.abs(
+            uniform_timestamps[nearest] - marker_ts
+        )
+
+        interp_events = np.zeros_like(uniform_timestamps)
+        interp_events[nearest] = events[marker_idx]
+
+        return interp_values, uniform_timestamps, interp_events
+
+    def _timestamp_stats(self, timestamps, sorted_ts):
+        """Count non-monotonic steps, duplicates and gaps in the timestamps."""
+        intervals = np.diff(sorted_ts)
+        nominal = float(np.median(intervals)) if len(intervals) else 0.0
+        gaps = intervals[intervals > self.GAP_FACTOR * nominal]
+
+        stats = {
+            "backward_steps": int(np.sum(np.diff(timestamps) < 0)),
+            "duplicates": len(timestamps) - len(sorted_ts),
+            "median_interval": nominal,
+            "gaps": len(gaps),
+            "gap_time": float(np.sum(gaps - nominal)),
+            "max_gap": float(gaps.max()) if len(gaps) else 0.0,
+        }
+
+        if stats["backward_steps"] or stats["gaps"]:
+            log = logging.info
+        else:
+            log = logging.debug
+        log(
+            "%s: %d backward timestamp step(s), %d duplicate(s), %d gap(s) "
+            "missing %.3f s in total (longest %.3f s)",
+            self.filename,
+            stats["backward_steps"],
+            stats["duplicates"],
+            stats["gaps"],
+            stats["gap_time"],
+            stats["max_gap"],
+        )
+
+        return stats
+
+    def get_events(self):
+        return self.events
+
+    def have_onoff_events(self):
+        """Returns true if complete ON(1) or OFF(11) epochs are found in raw"""
+        return bool(self.marker_epochs.accepted.any())
+
+    def _write_epoch_qa(self):
+        """Log the epochs found and write the duration check of every marker
+        span as CSV"""
+        name = os.path.basename(self.out_base)
+        self.marker_epochs.log_summary(name, self.sfreq)
+        pd.DataFrame(self.marker_epochs.qa(self.sfreq)).to_csv(
+            self._output("_epochs_QA.csv"), index=False
+        )
+
+    def plot_timeseries(self):
+        """Save the first TIMESERIES_SEC of the EEG channels, with the ON/OFF
+        markers, as an envelope plot"""
+        fname = self._output("_timeseries.png")
+        picks = mne.pick_types(self.raw.info, eeg=True)
+        stop = min(self.raw.n_times, int(self.TIMESERIES_SEC * self.sfreq))
+        plot_envelope(
+            fname,
+            self.raw.get_data(picks, stop=stop),
+            self.sfreq,
+            [self.raw.ch_names[i] for i in picks],
+            self.events,
+            self.EVENT_ID,
+            scaling=100e-6,
+            dpi=self.DPI,
+        )
+
+    def plot_psd(self):
+        """Save Raw PSD to file"""
+        fname = self._output("_PSD.png")
+        with self._stage("psd"):
+            psd = self.raw.compute_psd(
+                fmin=self.fmin * 0.8, fmax=self.fmax * 1.2, verbose=False
+            )
+        with self._stage("psd_figure"):
+            psd_fig = psd.plot(show=False)
+            psd_fig.savefig(fname, dpi=self.DPI)
+            plt.close(psd_fig)
+
+    def _plot_epochs_timeseries(self, epochs):
+        fname = self._output("_epochs_timeseries.png")
+        with self._stage("epochs_timeseries_figure"):
+            browser = epochs.plot(
+                scalings={"eeg": 100e-6},
+                show=False,
+                event_id=self.EVENT_ID,
+                events=True,
+            )
+            browser.figure.savefig(fname, dpi=self.DPI)
+            plt.close(browser.figure)
+
+    def _plot_epochs_psd(self, epochs, stitle=""):
+        # epochs, output_fname, fmin=0, fmax=40,
+        #         picks=None, average_psd=True, spatial_colors=True,
+        #         show_plot=False, fig_size=(10, 8)):
+        """
+        Generates a two-subplot figure showing PSDs for "ON" and "OFF" epochs
+        and saves it to a file.
+        """
+        fname = self._output("_" + stitle + "_epochs_PSD.png")
+        stage = "_".join(filter(None, ["epochs_psd", stitle]))
+        with self._stage(stage):
+            psd_on = epochs["ON"].compute_psd(fmin=self.fmin, fmax=self.fmax)
+            psd_off = epochs["OFF"].compute_psd(fmin=self.fmin, fmax=self.fmax)
+
+        with self._stage(stage + "_figure"):
+            self._plot_on_off_psd(fname, epochs, psd_on, psd_off, stitle)
+
+    def _plot_on_off_psd(self, fname, epochs, psd_on, psd_off, stitle):
+        fig, axes = plt.subplots(nrows=2, ncols=1, figsize=(10, 8), sharex=True)
+
+        psd_on.plot(
+            axes=axes[0],
+            average=False,
+            spatial_colors=True,
+            show=False,
+        )
+        axes[0].set_title(f"PSD: ON {stitle} Epochs (N={len(epochs['ON'])})")
+
+        psd_off.plot(
+            axes=axes[1],
+            average=False,
+            spatial_colors=True,
+            show=False,
+        )
+        axes[1].set_title(f"PSD: OFF {stitle} Epochs (N={len(epochs['OFF'])})")
+
+        plt.tight_layout(
+            rect=[0, 0.03, 1, 0.97]
+        )  # Adjust rect to make space for suptitle if needed
+        plt.savefig(fname, dpi=self.DPI)
+
+        plt.close(fig)
+
+    def plot_epochs(self):
+        self._write_epoch_qa()
+        with self._stage("epochs"):
+            epochs = mne.Epochs(
+                self.raw,
+                events=self.marker_epochs.events(),
+                tmin=0,
+                tmax=self.marker_epochs.tmax(self.sfreq),
+                event_id=self.EVENT_ID,
+                preload=True,
+                baseline=None,
+            )
+
+        self._plot_epochs_timeseries(epochs)
+        self._plot_epochs_psd(epochs)
+        if "C3-C4" not in self.raw.info["bads"]:
+            self._plot_epochs_psd(epochs.pick(["C3-C4"]), "C3-C4")
+
+    def onoff_epochs(self):
+        """
+        Equal-length ON and OFF epochs of the EEG channels (including C3-C4)
+        for the sweep summary, see ``MarkerEpochs.epochs``.
+
+        Returns
+        -------
+        ch_names : list of str
+        epochs : ndarray, shape (n_epochs, n_channels, n_samples)
+        labels : ndarray of int
+        """
+        picks = mne.pick_types(self.raw.info, eeg=True)
+        epochs, labels = self.marker_epochs.epochs(self.raw.get_data(picks))
+
+        return [self.raw.ch_names[i] for i in picks], epochs, labels
+
+
+class EEGCSVStreamer(EEGCSVLoader):
+    """
+    Processes a recording in chunks of ``chunk_size`` samples, so memory use
+    does not grow with the length of the recording.
+
+    Band-pass, notch and bipolar derivation are applied incrementally with the
+    same combined FIR kernel as the in-memory path and the edge padding of
+    MNE. Only Welch PSD statistics are kept: over the whole recording, and
+    per accepted ON/OFF epoch of ``MarkerEpochs``. The markers are read ahead
+    of the EEG, so the epochs have the same start and length as those of the
+    in-memory path. Of the filtered signal only the first TIMESERIES_SEC are
+    kept, for the timeseries plot.
+
+    The signal quality is scanned in the same pass, so with exclude_bad the
+    bad channels are only left out of the plots and tables, and a skipped
+    recording is still read and filtered in full.
+    """
+
+    RAW_N_FFT = 2048  # MNE defaults of Raw.compute_psd and psd_array_welch
+    EPOCH_N_FFT = 256
+
+    def __init__(self, cfg, filename, fmin, fmax, stages=None):
+        self.chunk_size = cfg.chunk_size
+        super().__init__(cfg, filename, fmin, fmax, stages)
+
+    def _iter_chunks(self):
+        """Yield chunks of the EEG channels, from the cache if available."""
+        if self.session is not None:
+            yield from self.session.iter_chunks(
+                self.filename.condition, self.CHANNEL_COLUMNS
+            )
+            return
+
+        cached = None
+        if self.cache is not None:
+            cached = self.cache.load(self.filename, self._cache_layout())
+
+        if cached is not None:
+            channels = cached[0]
+            for start in range(0, len(channels), self.chunk_size):
+                yield np.asarray(channels[start : start + self.chunk_size])
+            return
+
+        reader = pd.read_csv(
+            self.filename,
+            header=None,
+            delimiter="\t",
+            usecols=self.CHANNEL_COLUMNS,
+            chunksize=self.chunk_size,
+        )
+        for data in reader:
+            yield data[self.CHANNEL_COLUMNS].to_numpy()
+
+    def _load(self):
+        """Filter the recording chunk by chunk and accumulate PSD statistics."""
+        self.psd_names = self.channel_names[:-1] + ["C3-C4"]
+        self._bipolar = [self.channel_names.index(ch) for ch in ("C3", "C4")]
+
+        fir = StreamingFIR(
+            design_filter_bank(
+                self.sfreq, self.fmin, self.fmax, tuple(self.NOTCH_FREQS)
+            )
+        )
+        quality = self._new_quality()
+        self.psd_all = WelchAccumulator(self.sfreq, len(self.psd_names), self.RAW_N_FFT)
+        self.epoch_freqs = np.fft.rfftfreq(self.EPOCH_N_FFT, 1 / self.sfreq)
+        self.epoch_stats = EpochPSDStats()
+
+        # Epochs are known before the first chunk is filtered, so each one is
+        # cut exactly as MarkerEpochs cuts it for the in-memory path
+        marker_idx, marker_values, n_samples = self._read_markers()
+        self.events = self._marker_steps(marker_values, marker_idx, n_samples)
+        self.marker_epochs = MarkerEpochs(self.events)
+        n_epoch = self.marker_epochs.n_samples
+        self._windows = deque(  # (start, stop, label) not yet fully filtered
+            (start, start + n_epoch, label)
+            for start, _, label in self.marker_epochs.events()
+        )
+        self._n_filtered = 0
+        self._head = []  # Filtered chunks of the first TIMESERIES_SEC
+        self._epoch = None
+
+        for channels in self._iter_chunks():
+            quality.add(channels)
+            self._consume(fir.process(channels.T / 1e6))
+
+        self._consume(fir.finish())
+        self._screen(quality)
+
+    def _read_markers(self):
+        """
+        Sample indices and values of the non-zero markers, and the length of
+        the recording: from the session index, the cache, or only the marker
+        column of the CSV.
+        """
+        if self.session is not None:
+            condition = self.session.condition(self.filename.condition)
+            markers = np.reshape(condition["markers"], (-1, 2))
+            return markers[:, 0].astype(np.int64), markers[:, 1], condition["n_samples"]
+
+        if self.cache is not None:
+            cached = self.cache.load(self.filename, self._cache_layout())
+            if cached is not None:
+                markers = np.asarray(cached[2])
+                nz = np.flatnonzero(markers)
+                return nz, markers[nz], len(markers)
+
+        marker_idx, marker_values = [np.empty(0, dtype=np.int64)], [np.empty(0)]
+        n_samples = 0
+        reader = pd.read_csv(
+            self.filename,
+            header=None,
+            delimiter="\t",
+            usecols=[self.event_column],
+            chunksize=self.chunk_size,
+        )
+        for data in reader:
+            markers = data[self.event_column].to_numpy()
+            nz = np.flatnonzero(markers)
+            marker_idx.append(nz + n_samples)
+            marker_values.append(markers[nz])
+            n_samples += len(markers)
+
+        return np.concatenate(marker_idx), np.concatenate(marker_values), n_samples
+
+    def _consume(self, filtered):
+        """Add a chunk of filtered EEG to the recording and epoch PSDs."""
+        if filtered.size == 0:
+            return
+
+        c3, c4 = self._bipolar
+        data = np.vstack((filtered, filtered[c3] - filtered[c4]))
+        self.psd_all.add(data)
+
+        n_head = int(self.TIMESERIES_SEC * self.sfreq) - self._n_filtered
+        if n_head > 0:
+            self._head.append(data[:, :n_head])
+
+        start = self._n_filtered
+        self._n_filtered += data.shape[1]
+        while self._windows and self._windows[0][0] < self._n_filtered:
+            first, stop, label = self._windows[0]
+            if self._epoch is None:
+                self._epoch = WelchAccumulator(
+                    self.sfreq, len(self.psd_names), self.EPOCH_N_FFT
+                )
+            self._epoch.add(data[:, max(first - start, 0) : stop - start])
+            if stop > self._n_filtered:
+                break  # Continues in the next chunk
+
+            self._windows.popleft()
+            if self._epoch.n_segments:
+                self.epoch_stats.add(label, self._epoch.psd())
+            self._epoch = None
+
+    def _good_picks(self):
+        """Indices in psd_names of the channels to plot: with exclude_bad only
+        the good ones, C3-C4 only if both C3 and C4 are good."""
+        bads = set(self.bads) if self.exclude_bad else set()
+        if bads & {"C3", "C4"}:
+            bads.add("C3-C4")
+        return [i for i, name in enumerate(self.psd_names) if name not in bads]
+
+    def _plot_psd_lines(self, ax, freqs, psd, picks, fmin, fmax, title):
+        mask = (freqs >= fmin) & (freqs <= fmax)
+        for pick in picks:
+            ax.plot(
+                freqs[mask],
+                10 * np.log10(psd[pick, mask] * 1e12),  # V²/Hz to dB(µV²/Hz)
+                label=self.psd_names[pick],
+                linewidth=0.8,
+            )
+        ax.set_ylabel("µV²/Hz (dB)")
+        ax.set_title(title)
+        ax.legend(fontsize="small", ncol=3)
+
+    def plot_timeseries(self):
+        picks = self._good_picks()
+        plot_envelope(
+            self._output("_timeseries.png"),
+            np.concatenate(self._head, axis=1)[picks],
+            self.sfreq,
+            [self.psd_names[i] for i in picks],
+            self.events,
+            self.EVENT_ID,
+            scaling=100e-6,
+            dpi=self.DPI,
+        )
+
+    def plot_psd(self):
+        """Save Welch PSD of the whole recording to file"""
+        fname = self._output("_PSD.png")
+        fig, ax = plt.subplots(figsize=(10, 5))
+        self._plot_psd_lines(
+            ax,
+            self.psd_all.freqs,
+            self.psd_all.psd(),
+            self._good_picks(),
+            self.fmin * 0.8,
+            self.fmax * 1.2,
+            f"PSD ({self.psd_all.n_segments} segments)",
+        )
+        ax.set_xlabel("Frequency (Hz)")
+        fig.savefig(fname, dpi=self.DPI)
+        plt.close(fig)
+
+    def _plot_epochs_psd(self, picks, stitle=""):
+        """Two-subplot figure of the mean ON and OFF epoch PSDs"""
+        fname = self._output("_" + stitle + "_epochs_PSD.png")
+        fig, axes = plt.subplots(nrows=2, ncols=1, figsize=(10, 8), sharex=True)
+
+        for ax, (name, value) in zip(axes, self.EVENT_ID.items()):
+            if value not in self.epoch_stats.count:
+                ax.set_title(f"PSD: {name} {stitle} Epochs (N=0)")
+                continue
+            self._plot_psd_lines(
+                ax,
+                self.epoch_freqs,
+                self.epoch_stats.mean(value),
+                picks,
+                self.fmin,
+                self.fmax,
+                f"PSD: {name} {stitle} Epochs (N={self.epoch_stats.count[value]})",
+            )
+        axes[1].set_xlabel("Frequency (Hz)")
+
+        plt.tight_layout(rect=[0, 0.03, 1, 0.97])
+        plt.savefig(fname, dpi=self.DPI)
+        plt.close(fig)
+
+    def _write_epoch_stats(self):
+        """Write mean and standard deviation of the epoch PSDs as CSV"""
+        fname = self.out_base + "_epochs_PSD.csv"
+        freqs = self.epoch_freqs
+        mask = (freqs >= self.fmin) & (freqs <= self.fmax)
+
+        rows = []
+        for name, value in self.EVENT_ID.items():
+            if value not in self.epoch_stats.count:
+                continue
+            mean = self.epoch_stats.mean(value)
+            std = self.epoch_stats.std(value)
+            for pick in self._good_picks():
+                rows.append(
+                    pd.DataFrame(
+                        {
+                            "condition": name,
+                            "channel": self.psd_names[pick],
+                            "freq": freqs[mask],
+                            "n_epochs": self.epoch_stats.count[value],
+                            "psd_mean": mean[pick, mask],
+                            "psd_std": std[pick, mask],
+                        }
+                    )
+                )
+
+        if rows:
+            pd.concat(rows).to_csv(fname, index=False)
+            self.artifacts.append(fname)
+
+    def plot_epochs(self):
+        self._write_epoch_qa()
+        self._write_epoch_stats()
+        picks = self._good_picks()
+        self._plot_epochs_psd(picks)
+        bipolar = self.psd_names.index("C3-C4")
+        if bipolar in picks:
+            self._plot_epochs_psd([bipolar], "C3-C4")
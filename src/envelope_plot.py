@@ -0,0 +1,109 @@
+"""Timeseries plots of long recordings as per-pixel min/max envelopes"""
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+MARKER_COLORS = {"ON": "tab:green", "OFF": "tab:red"}
+
+
+def minmax_envelope(data, n_bins):
+    """
+    Minimum and maximum of data per bin of (nearly) equal numbers of samples.
+
+    Parameters
+    ----------
+    data : ndarray, shape (n_channels, n_samples)
+    n_bins : int
+
+    Returns
+    -------
+    starts : ndarray, shape (n_bins,)
+        First sample of each bin.
+    low, high : ndarray, shape (n_channels, n_bins)
+    """
+    n_bins = max(1, min(n_bins, data.shape[1]))
+    starts = np.linspace(0, data.shape[1], n_bins, endpoint=False).astype(np.intp)
+    low = np.minimum.reduceat(data, starts, axis=1)
+    high = np.maximum.reduceat(data, starts, axis=1)
+
+    return starts, low, high
+
+
+def plot_envelope(
+    fname,
+    data,
+    sfreq,
+    ch_names,
+    events=None,
+    event_id=None,
+    scaling=100e-6,
+    dpi=300,
+    figsize=(12, 8),
+):
+    """
+    Save a stacked timeseries plot of data, drawn as the min/max envelope per
+    pixel column with the Agg backend. Every pixel shows the full range of
+    the samples behind it, as a line plot of all samples would, at a fraction
+    of the drawing cost.
+
+    Parameters
+    ----------
+    fname : str
+    data : ndarray, shape (n_channels, n_samples)
+        In V.
+    sfreq : float
+    ch_names : list of str
+    events : ndarray, shape (n_events, 3), optional
+        Marker steps; those with a value of event_id are drawn as vertical
+        lines.
+    event_id : dict, optional
+        E.g. ``{"ON": 1, "OFF": 11}``.
+    scaling : float
+        Amplitude in V of half the distance between two channels, as the
+        scalings of ``raw.plot``.
+    """
+    n_channels, n_samples = data.shape
+    fig = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_axes([0.08, 0.08, 0.9, 0.88])
+
+    n_bins = int(ax.get_position().width * figsize[0] * dpi)
+    offsets = -2.0 * np.arange(n_channels)
+    if n_samples > 2 * n_bins:
+        starts, low, high = minmax_envelope(data, n_bins)
+        t = starts / sfreq
+        for i in range(n_channels):
+            ax.fill_between(
+                t,
+                low[i] / scaling + offsets[i],
+                high[i] / scaling + offsets[i],
+                step="post",
+                color="k",
+                linewidth=0.3,
+            )
+    else:
+        t = np.arange(n_samples) / sfreq
+        ax.plot(t, data.T / scaling + offsets, color="k", linewidth=0.3)
+
+    for name, value in (event_id or {}).items():
+        if events is None:
+            break
+        samples = events[(events[:, 2] == value) & (events[:, 0] < n_samples), 0]
+        ax.vlines(
+            samples / sfreq,
+            offsets[-1] - 1.5,
+            1.5,
+            color=MARKER_COLORS.get(name, "tab:blue"),
+            linewidth=0.5,
+            label=f"{name} ({value})",
+        )
+
+    ax.set_yticks(offsets, ch_names)
+    ax.set_ylim(offsets[-1] - 1.5, 1.5)
+    ax.set_xlim(0, n_samples / sfreq)
+    ax.set_xlabel("Time (s)")
+    ax.set_title(f"Scale: {scaling * 1e6:g} µV")
+    if event_id and events is not None:
+        ax.legend(loc="upper right", fontsize="small")
+    fig.savefig(fname)
@@ -0,0 +1,209 @@
+"""Spectral feedback on every condition while a sweep is running"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy.signal import welch
+
+from streaming import design_filter_bank, fir_filter
+
+# Board rows of C3 and C4, in the channel order used by measure_report.py
+BOARD_CHANNELS = {
+    "FREEEEG32_BOARD": {"C3": 3, "C4": 4},
+    "EXPLORE_8_CHAN_BOARD": {"C3": 7, "C4": 6},
+}
+
+
+class LiveAnalysis:
+    """
+    Compares ON and OFF epochs of each condition at the stimulation
+    frequency, right after the condition was recorded.
+
+    The data of a condition is band-passed and notch filtered as in
+    measure_report.py, cut into epochs from each ON/OFF marker to the next
+    marker, and the Welch PSD of C3, C4 and C3-C4 is averaged per epoch type.
+    Reported are the ON/OFF power ratio at the stimulation frequency and the
+    SNR of the ON power against the neighbouring frequency bins, both in dB.
+
+    Conditions are analysed one after another in a background thread, so the
+    sweep timing is not affected.
+    """
+
+    FMIN = 10  # Band-pass of measure_report.py, widened for higher frequencies
+    FMAX = 100
+    NOTCH_FREQS = [50, 100, 150]
+    EVENT_ID = {"ON": 1, "OFF": 11}
+    NEIGHBOURS_HZ = (2, 5)  # Bins this far from the frequency are the noise
+
+    def __init__(self, sfreq, marker_row, channels):
+        self.sfreq = sfreq
+        self.marker_row = marker_row
+        self.channels = channels  # {"C3": row, "C4": row}
+        self.results = []
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix=f"{threading.current_thread().name}-live",
+        )
+        self._futures = []
+
+    @classmethod
+    def for_board(cls, board_id, channels=None, sfreq=None):
+        """Analysis for BrainFlow board ``board_id``, C3/C4 rows by board name,
+        at BrainFlow's sampling rate of the board unless sfreq is given."""
+        from brainflow.board_shim import BoardIds, BoardShim
+
+        channels = channels or BOARD_CHANNELS.get(BoardIds(board_id).name)
+        if channels is None:
+            raise ValueError(f"No C3/C4 rows known for board {BoardIds(board_id).name}")
+
+        return cls(
+            sfreq or BoardShim.get_sampling_rate(board_id),
+            BoardShim.get_marker_channel(board_id),
+            channels,
+        )
+
+    def _filter(self, x, frequency):
+        """Band-pass and notch filter x, passing frequency."""
+        nyquist = self.sfreq / 2
+        h_freq = min(max(self.FMAX, 1.5 * frequency), 0.9 * nyquist)
+        notch = tuple(f for f in self.NOTCH_FREQS if f < nyquist - 1)
+        return fir_filter(design_filter_bank(self.sfreq, self.FMIN, h_freq, notch), x)
+
+    def analyse(self, data, frequency):
+        """
+        Analyse the board data of one condition.
+
+        Parameters
+        ----------
+        data : ndarray, shape (n_rows, n_samples)
+            Board data of the condition, including its marker row.
+        frequency : float
+            Stimulation frequency in Hz.
+
+        Returns
+        -------
+        dict
+            Per channel (C3, C4, C3-C4): ``on``, ``off`` (power at the
+            frequency), ``on_off_db``, ``snr_db``, and the epoch counts
+            ``n_on`` and ``n_off``.
+        """
+        c3, c4 = data[self.channels["C3"]], data[self.channels["C4"]]
+        signals = self._filter(np.vstack((c3, c4, c3 - c4)), frequency)
+
+        markers = data[self.marker_row]
+        onsets = np.flatnonzero(np.isin(markers, list(self.EVENT_ID.values())))
+        bounds = np.append(onsets, data.shape[1])
+        epochs = {kind: [] for kind in self.EVENT_ID}
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            kind = "ON" if markers[start] == self.EVENT_ID["ON"] else "OFF"
+            epochs[kind].append((start, stop))
+
+        lengths = [stop - start for e in epochs.values() for start, stop in e]
+        if not epochs["ON"] or not epochs["OFF"] or min(lengths) < 2:
+            raise ValueError("Condition has no complete ON and OFF epochs")
+
+        nperseg = min(int(self.sfreq), min(lengths))
+        nfft = max(nperseg, int(self.sfreq))
+        psd = {}
+        for kind, spans in epochs.items():
+            psds = []
+            for start, stop in spans:
+                freqs, p = welch(
+                    signals[:, start:stop], self.sfreq, nperseg=nperseg, nfft=nfft
+                )
+                psds.append(p)
+            psd[kind] = np.mean(psds, axis=0)
+
+        distance = np.abs(freqs - frequency)
+        neighbours = (distance >= self.NEIGHBOURS_HZ[0]) & (
+            distance <= self.NEIGHBOURS_HZ[1]
+        )
+        result = {}
+        for i, name in enumerate(["C3", "C4", "C3-C4"]):
+            on = np.interp(frequency, freqs, psd["ON"][i])
+            off = np.interp(frequency, freqs, psd["OFF"][i])
+            noise = psd["ON"][i][neighbours].mean()
+            result[name] = {
+                "on": on,
+                "off": off,
+                "on_off_db": 10 * np.log10(on / off),
+                "snr_db": 10 * np.log10(on / noise),
+                "n_on": len(epochs["ON"]),
+                "n_off": len(epochs["OFF"]),
+            }
+        return result
+
+    def cycle_power(self, data, frequency):
+        """
+        C3-C4 power at frequency in the last ON epoch of data and in the OFF
+        epoch after it, up to the end of data. No filtering is needed for a
+        single frequency bin.
+
+        Returns
+        -------
+        on_power, off_power : float
+        """
+        markers = data[self.marker_row]
+        on = np.flatnonzero(markers == self.EVENT_ID["ON"])
+        off = np.flatnonzero(markers == self.EVENT_ID["OFF"])
+        if not on.size or not off.size or off[-1] < on[-1]:
+            raise ValueError("No complete ON/OFF cycle")
+
+        bipolar = data[self.channels["C3"]] - data[self.channels["C4"]]
+        power = []
+        for start, stop in ((on[-1], off[-1]), (off[-1], data.shape[1])):
+            if stop - start < 2:
+                raise ValueError("Epoch too short")
+            nperseg = min(int(self.sfreq), stop - start)
+            freqs, p = welch(
+                bipolar[start:stop],
+                self.sfreq,
+                nperseg=nperseg,
+                nfft=max(nperseg, int(self.sfreq)),
+            )
+            power.append(np.interp(frequency, freqs, p))
+        return power[0], power[1]
+
+    def _run(self, label, data, frequency):
+        try:
+            result = self.analyse(data, frequency)
+        except ValueError as e:
+            logging.warning("Live %s: %s", label, e)
+            return
+        self.results.append((label, frequency, result))
+        logging.info(
+            "Live %s @ %g Hz: %s",
+            label,
+            frequency,
+            " | ".join(
+                f"{name} ON/OFF {r['on_off_db']:+.1f} dB SNR {r['snr_db']:+.1f} dB"
+                for name, r in result.items()
+            ),
+        )
+
+    def submit(self, label, data, frequency):
+        """Queue the board data of a finished condition for analysis."""
+        self._futures.append(self._executor.submit(self._run, label, data, frequency))
+
+    def close(self):
+        """Wait for queued conditions and log the table of all results."""
+        for future in self._futures:
+            future.result()
+        self._executor.shutdown()
+        if not self.results:
+            return
+
+        lines = [
+            f"{'condition':<24} {'channel':<6} {'ON/OFF dB':>9} {'SNR dB':>7} "
+            f"{'epochs':>6}"
+        ]
+        for label, _, result in self.results:
+            for name, r in result.items():
+                lines.append(
+                    f"{label:<24} {name:<6} {r['on_off_db']:>+9.1f} "
+                    f"{r['snr_db']:>+7.1f} {r['n_on']:>3}/{r['n_off']:<2}"
+                )
+        logging.info("Live analysis per condition:\n%s", "\n".join(lines))
@@ -0,0 +1,165 @@
+"""ON/OFF epochs of a recording, derived from the order of its markers"""
+
+import logging
+
+import numpy as np
+
+ON, OFF = 1, 11
+VHP_OFF, VHP_ON, BASELINE = 3, 33, 333  # Baseline markers of the sweep
+END = 0  # Held value after the last step: the recording ended
+
+# Marker values that properly end a span starting at each marker
+PARTNERS = {
+    ON: (OFF,),
+    OFF: (ON, END),  # The last OFF period lasts until the recording stops
+    VHP_OFF: (VHP_ON,),
+    VHP_ON: (BASELINE, END),
+    BASELINE: (ON,),
+}
+DURATION_TOLERANCE = 0.1  # Shortest epoch accepted, relative to the median
+
+
+class MarkerEpochs:
+    """
+    Splits a recording into spans from every marker step to the next one,
+    as in the event table of ``EEGCSVLoader._marker_steps``.
+
+    Each ON (1) span is paired with the OFF (11) marker that should follow
+    it, and each OFF span with the next ON marker or the end of the
+    recording. Spans of the baseline markers, 3 (VHP off), 33 (VHP on) and
+    333 (baseline before the first stimulus), are never epochs; they end an
+    epoch running into them, which then counts as unpaired.
+
+    An ON or OFF span is accepted if it is paired and not shorter than its
+    kind's median duration by more than ``tolerance``. All accepted epochs
+    get the length of the shortest accepted one, in samples, so none runs
+    into the next marker.
+    """
+
+    def __init__(self, events, tolerance=DURATION_TOLERANCE):
+        events = np.asarray(events, dtype=np.int64).reshape(-1, 3)
+        self.start = events[:-1, 0]
+        self.stop = events[1:, 0]
+        self.value = events[:-1, 2]
+        self.next_value = events[1:, 2]
+        self.duration = self.stop - self.start
+
+        self.paired = np.zeros(len(self.value), dtype=bool)
+        for value, partners in PARTNERS.items():
+            self.paired |= (self.value == value) & np.isin(self.next_value, partners)
+
+        self.is_onoff = np.isin(self.value, (ON, OFF))
+        self.nominal = {}
+        self.short = np.zeros(len(self.value), dtype=bool)
+        for value in (ON, OFF):
+            kind = self.paired & (self.value == value)
+            if kind.any():
+                self.nominal[value] = int(np.median(self.duration[kind]))
+                minimum = (1 - tolerance) * self.nominal[value]
+                self.short |= kind & (self.duration < minimum)
+
+        self.accepted = self.is_onoff & self.paired & ~self.short
+        self.n_samples = (
+            int(self.duration[self.accepted].min()) if self.accepted.any() else 0
+        )
+
+    def events(self):
+        """MNE events ``[sample, 0, value]`` of the accepted epochs."""
+        starts = self.start[self.accepted]
+        return np.column_stack(
+            (starts, np.zeros_like(starts), self.value[self.accepted])
+        )
+
+    def tmax(self, sfreq):
+        """tmax of ``mne.Epochs`` with tmin=0 for epochs of n_samples."""
+        return (self.n_samples - 1) / sfreq
+
+    def epochs(self, data, n_samples=None):
+        """
+        Cut the accepted epochs out of data.
+
+        Parameters
+        ----------
+        data : ndarray, shape (n_channels, n_samples)
+        n_samples : int, optional
+            Epoch length, by default n_samples of the shortest epoch.
+
+        Returns
+        -------
+        epochs : ndarray, shape (n_epochs, n_channels, n_samples)
+        labels : ndarray of int
+            Marker value (1 or 11) per epoch.
+        """
+        n_samples = self.n_samples if n_samples is None else n_samples
+        starts = self.start[self.accepted]
+        keep = starts + n_samples <= data.shape[1]
+        starts, labels = starts[keep], self.value[self.accepted][keep]
+
+        idx = starts[:, None] + np.arange(n_samples)  # (n_epochs, n_samples)
+        return data[:, idx].transpose(1, 0, 2), labels
+
+    def qa(self, sfreq):
+        """
+        Duration check of every span.
+
+        Returns
+        -------
+        list of dict
+            Per span: its ``marker`` and ``next_marker``, ``start_s``,
+            ``duration_s``, ``deviation_s`` from the median of its kind (ON
+            and OFF only) and ``status``: ``ok``, ``short``, ``unpaired`` or
+            ``baseline``.
+        """
+        rows = []
+        for i in range(len(self.value)):
+            value = int(self.value[i])
+            if not self.is_onoff[i]:
+                status = "baseline"
+            elif not self.paired[i]:
+                status = "unpaired"
+            elif self.short[i]:
+                status = "short"
+            else:
+                status = "ok"
+            nominal = self.nominal.get(value)
+            rows.append(
+                {
+                    "marker": value,
+                    "next_marker": int(self.next_value[i]),
+                    "start_s": float(self.start[i] / sfreq),
+                    "duration_s": float(self.duration[i] / sfreq),
+                    "deviation_s": (
+                        float((self.duration[i] - nominal) / sfreq)
+                        if nominal is not None
+                        else np.nan
+                    ),
+                    "status": status,
+                }
+            )
+
+        return rows
+
+    def log_summary(self, name, sfreq):
+        """Log the epoch counts and length, and warn about rejected epochs."""
+        counts = {
+            label: int(np.sum(self.accepted & (self.value == value)))
+            for label, value in (("ON", ON), ("OFF", OFF))
+        }
+        logging.info(
+            "%s: %d ON and %d OFF epochs of %.3f s",
+            name,
+            counts["ON"],
+            counts["OFF"],
+            self.n_samples / sfreq,
+        )
+        rejected = self.is_onoff & ~self.accepted
+        for i in np.flatnonzero(rejected):
+            logging.warning(
+                "%s: %s epoch at %.3f s of %.3f s is %s (followed by marker %d)",
+                name,
+                "ON" if self.value[i] == ON else "OFF",
+                self.start[i] / sfreq,
+                self.duration[i] / sfreq,
+                "too short" if self.paired[i] else "unpaired",
+                self.next_value[i],
+            )
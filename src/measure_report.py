@@ -1,14 +1,34 @@
 """Intended for reporting on results from MeasureSync"""
 
 import argparse
+import copy
+import cProfile
 import logging
 import os
+import signal
 import sys
-
-import matplotlib.pyplot as plt
-import mne
-import numpy as np
-import pandas as pd
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from multiprocessing import get_context
+
+from recording_cache import RecordingCache
+from recording_watcher import RecordingWatcher
+from report_manifest import ReportManifest
+from session_file import EXTENSION as SESSION_EXTENSION
+from session_file import SessionReader, SessionSource
+from signal_quality import MAX_FLAT_S, MAX_SATURATION
+from stage_timer import StageTimer, stage
+from timing_log import SUFFIX as TIMING_SUFFIX
+
+# MNE, matplotlib, pandas and SciPy take seconds to import. They are only
+# imported once a file is processed (eeg_loader.py) or a table written, so
+# --help and the checks of the arguments respond immediately.
+
+PLOTS = ["timeseries", "psd", "epochs"]
+FMIN, FMAX = 10, 100  # Band-pass of the EEG channels in Hz
+POLL_SEC = 2  # Interval of looking for finished recordings in watch mode
 
 
 class Config:
@@ -21,6 +41,24 @@ class Config:
         self.verbosity = args.verbosity
         self.mentalab = args.mentalab
         self.resample = args.resample
+        self.cache = not args.no_cache
+        self.clear_cache = args.clear_cache
+        self.jobs = args.jobs
+        self.stream = args.stream
+        self.chunk_size = args.chunk_size
+        self.profile = args.profile
+        self.cprofile = args.cprofile
+        self.summary = args.summary
+        self.plots = args.plots
+        self.force = args.force
+        self.watch = args.watch
+        self.settle = args.settle
+        self.idle = args.idle
+        self.max_saturation = args.max_saturation
+        self.max_flat = args.max_flat
+        self.max_line_noise = args.max_line_noise
+        self.max_bad_channels = args.max_bad_channels
+        self.exclude_bad = args.exclude_bad
 
         self.setup_logging()
         self._validate_and_prepare()
@@ -57,39 +95,171 @@ class Config:
             action="store_true",
             help="Resample Mentalab based on timestamp",
         )
+        parser.add_argument(
+            "--no-cache",
+            action="store_true",
+            help="Always parse the CSV files, bypassing the binary cache",
+        )
+        parser.add_argument(
+            "--clear-cache",
+            action="store_true",
+            help="Remove the binary cache in output_dir before processing",
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            default=1,
+            help="Number of files processed in parallel (default: 1)",
+        )
+        parser.add_argument(
+            "-s",
+            "--stream",
+            action="store_true",
+            help="Process recordings in chunks with bounded memory (PSD only)",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=65536,
+            help="Samples per chunk in streaming mode (default: 65536)",
+        )
+        parser.add_argument(
+            "--profile",
+            action="store_true",
+            help="Write wall time, CPU time and memory per file and stage to "
+            "output_dir/profile_*.csv",
+        )
+        parser.add_argument(
+            "--cprofile",
+            action="store_true",
+            help="Write a cProfile dump per file to output_dir (*.prof)",
+        )
+        parser.add_argument(
+            "--plots",
+            type=Config._plot_list,
+            default=PLOTS,
+            help="Comma separated plots made per file, out of "
+            f"{','.join(PLOTS)} (default: all)",
+        )
+        parser.add_argument(
+            "--summary",
+            action="store_true",
+            help="Write ON/OFF band power of all c{ch}_f{freq}_v{vol} conditions "
+            "to output_dir/sweep_summary.csv, with heatmaps",
+        )
+        parser.add_argument(
+            "-f",
+            "--force",
+            action="store_true",
+            help="Process all files, also those whose output in output_dir is "
+            "up to date",
+        )
+        parser.add_argument(
+            "-w",
+            "--watch",
+            action="store_true",
+            help="Keep watching for recordings of file_base and process each as "
+            "soon as it is finished, until Ctrl+C or --idle",
+        )
+        parser.add_argument(
+            "--settle",
+            type=float,
+            default=10,
+            help="Seconds a CSV without sweep progress manifest must stay "
+            "unchanged to count as finished in watch mode (default: 10)",
+        )
+        parser.add_argument(
+            "--idle",
+            type=float,
+            help="Stop watching after this many seconds without a new finished "
+            "recording (default: watch until Ctrl+C)",
+        )
+        parser.add_argument(
+            "--max-saturation",
+            type=float,
+            default=MAX_SATURATION,
+            help="Channels with a larger share of samples at the rail of the "
+            f"board are bad (default: {MAX_SATURATION})",
+        )
+        parser.add_argument(
+            "--max-flat",
+            type=float,
+            default=MAX_FLAT_S,
+            help="Channels that stay constant for this many seconds are bad "
+            f"(default: {MAX_FLAT_S})",
+        )
+        parser.add_argument(
+            "--max-line-noise",
+            type=float,
+            help="Channels with a larger share of their 1-100 Hz power at 50 Hz "
+            "are bad (default: not checked)",
+        )
+        parser.add_argument(
+            "--exclude-bad",
+            action="store_true",
+            help="Leave bad channels out of the plots, PSDs and summary, and "
+            "skip recordings without any good channel (default: only report them)",
+        )
+        parser.add_argument(
+            "--max-bad-channels",
+            type=int,
+            help="Skip recordings with more bad channels, before filtering "
+            "(default: none are skipped)",
+        )
 
         return parser.parse_args()
 
+    @staticmethod
+    def _plot_list(value):
+        plots = [p.strip() for p in value.split(",") if p.strip()]
+        unknown = [p for p in plots if p not in PLOTS]
+        if unknown:
+            raise argparse.ArgumentTypeError(
+                f"unknown plot(s) {', '.join(unknown)}, choose from {', '.join(PLOTS)}"
+            )
+        return plots
+
     def setup_logging(self):
         """Set up the logging configuration."""
-        numeric_level = getattr(logging, self.verbosity.upper(), None)
+        self.configure_logging(self.verbosity)
+        logging.info("Starting program.")
+
+    @staticmethod
+    def configure_logging(verbosity):
+        """Configure the root logger, also used by worker processes."""
+        numeric_level = getattr(logging, verbosity.upper(), None)
         if not isinstance(numeric_level, int):
-            raise ValueError(f"Invalid log level: {self.verbosity}")
+            raise ValueError(f"Invalid log level: {verbosity}")
         logging.basicConfig(
             level=numeric_level,
             format="[%(asctime)s] %(levelname)s: %(message)s",
             datefmt="%Y-%m-%d %H:%M:%S",
         )
-        logging.info("Starting program.")
 
-    def get_matching_csv_files(self):
+    def get_matching_csv_files(self, warn=True):
         """
         Return a list of CSV files in the directory containing file_base that start with
         the same base name (excluding directory) and have a .csv extension.
 
+        Session files (.msync) matching the base name contribute one
+        SessionSource per completely recorded condition.
+
         Parameters
         ----------
-        file_base : str
-            The base path (possibly including directory) to match files against.
+        warn : bool
+            Log a warning if nothing matches.
 
         Returns
         -------
-        list of str
-            Sorted list of full paths to matching CSV files.
+        list of str or SessionSource
+            Sorted list of full paths to matching CSV files, followed by the
+            conditions of matching session files.
         """
         directory = os.path.dirname(self.file_base) or "."
         base_prefix = os.path.basename(self.file_base)
         found_files = []
+        found_sessions = []
 
         if not os.path.isdir(directory):
             logging.error("Directory '%s' does not exist.", directory)
@@ -97,11 +267,26 @@ class Config:
 
         try:
             for fname in os.listdir(directory):
+                if fname.endswith(TIMING_SUFFIX):
+                    continue  # Timing log of the sweep, not a recording
                 if fname.startswith(base_prefix) and fname.lower().endswith(".csv"):
                     full_path = os.path.join(directory, fname)
                     found_files.append(full_path)
                     found_files.sort()
-            if not found_files:
+                elif fname.startswith(base_prefix) and fname.endswith(
+                    SESSION_EXTENSION
+                ):
+                    found_sessions.append(os.path.join(directory, fname))
+            for session in sorted(found_sessions):
+                try:
+                    conditions = SessionReader(session).conditions
+                except (OSError, ValueError) as exc:
+                    logging.warning("Skipping session file %s: %s", session, exc)
+                    continue
+                found_files.extend(
+                    SessionSource(session, condition) for condition in conditions
+                )
+            if not found_files and warn:
                 logging.warning(
                     "No matching CSV files found for file base '%s'.", self.file_base
                 )
@@ -117,7 +302,35 @@ class Config:
     def _validate_and_prepare(self):
         """Validate input file and output directory, create output dir if needed."""
 
-        if not self.get_matching_csv_files():
+        if self.watch:
+            if not os.path.isdir(os.path.dirname(self.file_base) or "."):
+                logging.error("Directory of '%s' does not exist.", self.file_base)
+                sys.exit(1)
+        elif not self.get_matching_csv_files():
+            sys.exit(1)
+
+        if self.jobs < 1:
+            logging.error("Number of jobs must be at least 1, got %d", self.jobs)
+            sys.exit(1)
+
+        if self.stream and self.resample:
+            logging.error("Streaming mode does not support resampling")
+            sys.exit(1)
+
+        if self.stream and self.summary:
+            logging.error("Streaming mode does not support the sweep summary")
+            sys.exit(1)
+
+        if self.settle < 0 or (self.idle is not None and self.idle <= 0):
+            logging.error("--settle must be at least 0 and --idle above 0")
+            sys.exit(1)
+
+        if self.max_bad_channels is not None and self.max_bad_channels < 0:
+            logging.error("--max-bad-channels must be at least 0")
+            sys.exit(1)
+
+        if self.chunk_size < 1:
+            logging.error("Chunk size must be at least 1, got %d", self.chunk_size)
             sys.exit(1)
 
         if not os.path.isdir(self.output_dir):
@@ -128,252 +341,394 @@ class Config:
                 logging.error("Could not create output directory: %s", e)
                 sys.exit(1)
 
+        self.cache_dir = os.path.join(self.output_dir, RecordingCache.DIRNAME)
+        if self.clear_cache:
+            RecordingCache(self.cache_dir).clear()
 
-class EEGCSVLoader:
-    """Loads EEG data from a FreeEEG32 CSV and converts to MNE Raw object."""
-
-    CHANNEL_TYPES = ["eeg"] * 8 + ["stim"]
-    EVENT_ID = {"ON": 1, "OFF": 11}
-    DPI = 300
-
-    def __init__(self, cfg, filename, fmin, fmax):
-        self.filename = filename
-        self.fmin = fmin
-        self.fmax = fmax
-
-        self.out_base = cfg.output_dir + os.path.splitext(os.path.basename(filename))[0]
-        self.mentalab = cfg.mentalab
-        self.resample = cfg.resample
-
-        if self.mentalab:
-            self.channel_names = [
-                "CP3",
-                "CP4",
-                "C2",
-                "C6",
-                "C1",
-                "C4",
-                "C3",
-                "C5",
-                "STI 014",
-            ]
-
-            self.sfreq = 1000
-            self.event_column = 11
-        else:  # FreeEEG32 config
-            self.channel_names = [
-                "T7",
-                "T8",
-                "C3",
-                "C4",
-                "FC3",
-                "FC4",
-                "CP3",
-                "CP4",
-                "STI 014",
-            ]
-            self.sfreq = 512
-            self.event_column = 34
-
-        self._load()
-
-    def _load(self):
-        """Read CSV, create MNE Raw object, filter and store as .raw."""
-        data = pd.read_csv(self.filename, header=None, delimiter="\t")
-
-        if self.mentalab and self.resample:
-            data = self._resample_data(data)
-
-        eeg_data = data.iloc[:, 1:9].to_numpy().T  # shape: (n_channels, n_samples)
-        eeg_data = eeg_data / 1e6  # Convert µV to V
-
-        # Stim channel
-        stim_data = np.zeros((1, eeg_data.shape[1]))
-        events_column = data.iloc[:, self.event_column].to_numpy()
-
-        last_value = 0
-        for idx, value in enumerate(events_column):
-            if value != 0:
-                stim_data[0, idx] = value
-                last_value = value
-            else:
-                stim_data[0, idx] = last_value
-
-        all_data = np.vstack((eeg_data, stim_data))
-
-        info = mne.create_info(self.channel_names, self.sfreq, self.CHANNEL_TYPES)
-        raw = mne.io.RawArray(all_data, info, verbose=False)
-        raw.set_montage("standard_1020", match_case=False)
-
-        # Filtering
-        raw.filter(l_freq=self.fmin, h_freq=self.fmax, verbose=False)
-        raw.notch_filter(freqs=[50, 100, 150], picks="eeg", method="fir", verbose=False)
-
-        # Bipolar derivation
-        raw_bipolar = mne.set_bipolar_reference(
-            raw,
-            anode="C3",
-            cathode="C4",
-            ch_name="C3-C4",
-            drop_refs=False,
-            verbose=False,
-        )
-
-        self.raw = raw_bipolar
 
-        self.events = mne.find_events(
-            raw, stim_channel="STI 014", output="step", consecutive=True, verbose=False
-        )
+FileResult = namedtuple("FileResult", ["error", "records", "summary", "artifacts"])
 
-    def _resample_data(self, df):
-        """Resample data from Mentablab recording"""
-        values = df.iloc[:, 1:10].values  # columns 2-10
-        timestamps = df.iloc[:, 10].values  # column 11
-        events = df.iloc[:, 11].values  # column 12
+# Stages of process_file that enclose other stages
+ENCLOSING_STAGES = ["load", "plot_psd", "plot_epochs"]
 
-        uniform_timestamps = np.arange(timestamps[0], timestamps[-1], 1 / self.sfreq)
 
-        interp_values = np.empty((len(uniform_timestamps), values.shape[1]))
-        for c in range(values.shape[1]):
-            interp_values[:, c] = np.interp(
-                uniform_timestamps, timestamps, values[:, c]
-            )
+def process_file(cfg, fname, stages=None):
+    """
+    Generate all plots for a single recording, timing its stages if a
+    StageTimer is given.
 
-        interp_events = np.zeros_like(uniform_timestamps)
-        event_indices = np.where(events != 0)[0]
-        for idx in event_indices:
-            orig_time = timestamps[idx]
-            # Find the nearest uniform grid index
-            new_idx = np.abs(uniform_timestamps - orig_time).argmin()
-            interp_events[new_idx] = events[idx]
-
-        # Assemble the result DataFrame
-        result_df = pd.DataFrame(
-            np.hstack(
-                [
-                    uniform_timestamps[:, None],
-                    interp_values,
-                    uniform_timestamps[:, None],
-                    interp_events[:, None],
-                ]
-            ),
-            columns=["dummy"]
-            + [f"val{i}" for i in range(1, 10)]
-            + ["timestamp", "event"],
-        )
+    Returns
+    -------
+    artifacts : list of str
+        Output files written.
+    summary : dict or None
+        With cfg.summary, the ON/OFF epochs of a sweep condition for
+        ``sweep_summary.summarize``, else None.
+    """
+    from eeg_loader import EEGCSVLoader, EEGCSVStreamer
+    from sweep_summary import parse_condition
 
-        return result_df
+    logging.info("Opening %s", fname)
 
-    def get_events(self):
-        return self.events
+    loader = EEGCSVStreamer if cfg.stream else EEGCSVLoader
+    rcsv = loader(cfg, fname, FMIN, FMAX, stages)
+    if rcsv.skipped:  # Too many bad channels, only the quality table
+        return rcsv.artifacts, None
+    if "timeseries" in cfg.plots:
+        with stage(stages, "plot_timeseries"):
+            rcsv.plot_timeseries()
+    if "psd" in cfg.plots:
+        with stage(stages, "plot_psd"):
+            rcsv.plot_psd()
 
-    def have_onoff_events(self):
-        """Returns true if ON(1) or OFF(11) events are found in raw"""
-        last_col = self.events[:, -1]
+    if not rcsv.have_onoff_events():
+        return rcsv.artifacts, None
 
-        mask = np.isin(last_col, list(self.EVENT_ID.values()))
+    if "epochs" in cfg.plots:
+        with stage(stages, "plot_epochs"):
+            rcsv.plot_epochs()
 
-        return np.any(mask)
+    condition = parse_condition(os.path.basename(rcsv.out_base))
+    if not cfg.summary or condition is None:
+        return rcsv.artifacts, None
+    with stage(stages, "summary_epochs"):
+        ch_names, epochs, labels = rcsv.onoff_epochs()
+    return rcsv.artifacts, dict(
+        condition,
+        name=os.path.basename(rcsv.out_base),
+        sfreq=rcsv.sfreq,
+        ch_names=ch_names,
+        epochs=epochs,
+        labels=labels,
+    )
+
+
+def _process_file_isolated(cfg, fname):
+    """
+    Run process_file, returning the error message instead of raising.
+
+    Returns
+    -------
+    FileResult
+        The error message or None, the StageRecords if cfg.profile is set
+        (else empty), and the summary epochs and output files returned by
+        process_file.
+    """
+    timer = StageTimer(trace_memory=True) if cfg.profile else None
+    profiler = cProfile.Profile() if cfg.cprofile else None
+    error = summary = None
+    artifacts = []
+    try:
+        if profiler is not None:
+            profiler.enable()
+        artifacts, summary = process_file(cfg, fname, timer)
+    except Exception as exc:
+        logging.exception("Processing %s failed", fname)
+        error = f"{type(exc).__name__}: {exc}"
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            from eeg_loader import output_base
+
+            profiler.dump_stats(output_base(cfg, fname) + ".prof")
+            artifacts = list(artifacts) + [output_base(cfg, fname) + ".prof"]
+        if timer is not None:
+            timer.stop()
+
+    records = timer.records if timer is not None else []
+    return FileResult(error, records, summary, artifacts)
+
+
+def _init_worker(verbosity, ignore_interrupt=False):
+    """Headless plotting and logging setup for pool worker processes."""
+    import matplotlib
+    import mne
+
+    if ignore_interrupt:  # Ctrl+C is handled by the main process
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+    matplotlib.use("Agg")
+    mne.viz.set_browser_backend("matplotlib")
+    Config.configure_logging(verbosity)
+
+
+def _pool(cfg, max_workers, ignore_interrupt=False):
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(cfg.verbosity, ignore_interrupt),
+    )
+
+
+def _result(future):
+    try:
+        return future.result()
+    except Exception as exc:  # worker died, e.g. out of memory
+        return FileResult(f"{type(exc).__name__}: {exc}", [], None, [])
+
+
+def _run_parallel(cfg, fnames):
+    """Process files in a pool of cfg.jobs worker processes."""
+    results = {}
+    with _pool(cfg, min(cfg.jobs, len(fnames))) as pool:
+        futures = {
+            pool.submit(_process_file_isolated, cfg, fname): fname for fname in fnames
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = _result(future)
+
+    return results
+
+
+def write_profile(cfg, results):
+    """
+    Write the stage timing of all files to a CSV table in the output directory
+    and log the slowest stages.
+    """
+    rows = [
+        {
+            "file": str(fname),
+            "stage": record.stage,
+            "wall_s": record.wall_s,
+            "cpu_s": record.cpu_s,
+            "mem_delta_mb": record.delta_bytes / 1e6,
+            "mem_peak_mb": record.peak_bytes / 1e6,
+        }
+        for fname, result in results.items()
+        for record in result.records
+    ]
+    if not rows:
+        return
+
+    import pandas as pd
+
+    table = pd.DataFrame(rows)
+    fname = os.path.join(
+        cfg.output_dir, f"profile_{datetime.now().strftime('%y%m%d-%H%M%S')}.csv"
+    )
+    table.to_csv(fname, index=False)
+    logging.info("Stage timing written to %s", fname)
+
+    slowest = table[~table["stage"].isin(ENCLOSING_STAGES)].nlargest(5, "wall_s")
+    with pd.option_context(
+        "display.width", 160, "display.float_format", "{:.3f}".format
+    ):
+        logging.info("Slowest stages:\n%s", slowest.to_string(index=False))
+
+
+def analysis_config(cfg):
+    """Settings that determine the output of a file, part of the manifest."""
+    return {
+        "fmin": FMIN,
+        "fmax": FMAX,
+        "board": "mentalab" if cfg.mentalab else "freeeeg32",
+        "resample": cfg.resample,
+        "stream": cfg.stream,
+        "plots": sorted(cfg.plots),
+        "quality": [
+            cfg.max_saturation,
+            cfg.max_flat,
+            cfg.max_line_noise,
+            cfg.max_bad_channels,
+            cfg.exclude_bad,
+        ],
+    }
+
+
+def write_quality(cfg, fnames):
+    """
+    Collect the quality tables of all recordings, also those up to date,
+    into output_dir/signal_quality.csv and log the bad channels per
+    recording.
+    """
+    import pandas as pd
+    from eeg_loader import output_base
+
+    tables = []
+    for fname in fnames:
+        try:
+            table = pd.read_csv(output_base(cfg, fname) + "_quality.csv")
+        except FileNotFoundError:
+            continue  # Failed before its quality scan
+        table.insert(0, "recording", os.path.basename(output_base(cfg, fname)))
+        tables.append(table)
+    if not tables:
+        return
+
+    table = pd.concat(tables, ignore_index=True)
+    fname = os.path.join(cfg.output_dir, "signal_quality.csv")
+    table.to_csv(fname, index=False)
+
+    per_file = table.groupby("recording", sort=False).agg(
+        bad=("bad", "sum"), skipped=("skipped", "first")
+    )
+    logging.info(
+        "Signal quality of %d recording(s) written to %s: %d with bad channels, "
+        "%d skipped",
+        len(per_file),
+        fname,
+        int((per_file["bad"] > 0).sum()),
+        int(per_file["skipped"].sum()),
+    )
+    bad = table[table["bad"]]
+    if not bad.empty:
+        logging.info(
+            "Bad channels:\n%s",
+            bad.groupby("recording", sort=False)["channel"].agg(", ".join).to_string(),
+        )
 
-    def _calc_onoff_duration(self):
-        """Lazy estimate of the duration by counting samples between second and
-        third events. Alternatively could go reading the metadata"""
-        sdiff = self.events[2, 0] - self.events[1, 0]
 
-        return int(sdiff / self.sfreq)
+def _run(cfg, fnames):
+    if cfg.jobs > 1 and fnames:
+        return _run_parallel(cfg, fnames)
+    return {fname: _process_file_isolated(cfg, fname) for fname in fnames}
 
-    def plot_timeseries(self):
-        """Save the Raw plot to file"""
-        fname = self.out_base + "_timeseries.png"
-        browser = self.raw.plot(
-            scalings={"eeg": 100e-6}, show=False, verbose=False, duration=300
-        )
-        browser.figure.savefig(fname, dpi=self.DPI)
-        plt.close(browser.figure)
-
-    def plot_psd(self):
-        """Save Raw PSD to file"""
-        fname = self.out_base + "_PSD.png"
-        psd = self.raw.compute_psd(
-            fmin=self.fmin * 0.8, fmax=self.fmax * 1.2, verbose=False
-        )
-        psd_fig = psd.plot(show=False)
-        psd_fig.savefig(fname, dpi=self.DPI)
-        plt.close(psd_fig)
-
-    def _plot_epochs_timeseries(self, epochs):
-        fname = self.out_base + "_epochs_timeseries.png"
-        browser = epochs.plot(
-            scalings={"eeg": 100e-6}, show=False, event_id=self.EVENT_ID, events=True
-        )
-        browser.figure.savefig(fname, dpi=self.DPI)
-        plt.close(browser.figure)
 
-    def _plot_epochs_psd(self, epochs, stitle=""):
-        # epochs, output_fname, fmin=0, fmax=40,
-        #         picks=None, average_psd=True, spatial_colors=True,
-        #         show_plot=False, fig_size=(10, 8)):
-        """
-        Generates a two-subplot figure showing PSDs for "ON" and "OFF" epochs
-        and saves it to a file.
-        """
-        fname = self.out_base + "_" + stitle + "_epochs_PSD.png"
-        psd_on = epochs["ON"].compute_psd(fmin=self.fmin, fmax=self.fmax)
-        psd_off = epochs["OFF"].compute_psd(fmin=self.fmin, fmax=self.fmax)
+def _record(manifest, config_hash, fname, result):
+    if result.error is None:
+        manifest.update(fname, config_hash, result.artifacts)
+    else:
+        manifest.remove(fname)
 
-        fig, axes = plt.subplots(nrows=2, ncols=1, figsize=(10, 8), sharex=True)
 
-        psd_on.plot(
-            axes=axes[0],
-            average=False,
-            spatial_colors=True,
-            show=False,
-        )
-        axes[0].set_title(f"PSD: ON {stitle} Epochs (N={len(epochs["ON"])})")
+def watch(cfg, manifest, config_hash):
+    """
+    Process the recordings of cfg.file_base as soon as they are finished, in
+    a pool of cfg.jobs background processes, until interrupted with Ctrl+C
+    or idle for cfg.idle seconds. Recordings still being processed then are
+    finished first.
 
-        psd_off.plot(
-            axes=axes[1],
-            average=False,
-            spatial_colors=True,
-            show=False,
-        )
-        axes[1].set_title(f"PSD: OFF {stitle} Epochs (N={len(epochs["OFF"])})")
-
-        plt.tight_layout(
-            rect=[0, 0.03, 1, 0.97]
-        )  # Adjust rect to make space for suptitle if needed
-        plt.savefig(fname, dpi=self.DPI)
-
-        plt.close(fig)
-
-    def plot_epochs(self):
-        epochs = mne.Epochs(
-            self.raw,
-            events=self.events,
-            tmin=0,
-            tmax=self._calc_onoff_duration(),
-            event_id=self.EVENT_ID,
-            preload=True,
-            baseline=None,
-        )
+    Returns
+    -------
+    dict
+        FileResult per processed recording.
+    """
+    watcher = RecordingWatcher(cfg.file_base, cfg.settle)
+    results, running, seen = {}, {}, set()
+    last_new = time.monotonic()
+    logging.info("Watching %s* for finished recordings", cfg.file_base)
 
-        self._plot_epochs_timeseries(epochs)
-        self._plot_epochs_psd(epochs)
-        self._plot_epochs_psd(epochs.pick(["C3-C4"]), "C3-C4")
+    with _pool(cfg, cfg.jobs, ignore_interrupt=True) as pool:
+        try:
+            while True:
+                fnames = cfg.get_matching_csv_files(warn=False)
+                for fname in watcher.finished(fnames):
+                    if fname in seen:
+                        continue
+                    seen.add(fname)
+                    if not cfg.force and manifest.is_current(fname, config_hash):
+                        logging.debug("%s is up to date", fname)
+                        continue
+                    logging.info("Finished recording %s, queued", fname)
+                    running[pool.submit(_process_file_isolated, cfg, fname)] = fname
+                    last_new = time.monotonic()
+
+                for future in [f for f in running if f.done()]:
+                    fname = running.pop(future)
+                    results[fname] = _result(future)
+                    _record(manifest, config_hash, fname, results[fname])
+                    manifest.save()
+
+                idle = time.monotonic() - last_new
+                if cfg.idle is not None and not running and idle >= cfg.idle:
+                    logging.info("No new recordings for %.0f s", idle)
+                    break
+                time.sleep(POLL_SEC)
+        except KeyboardInterrupt:
+            logging.info("Stopped watching, finishing %d queued file(s)", len(running))
+
+        for future in as_completed(running):
+            fname = running[future]
+            results[fname] = _result(future)
+            _record(manifest, config_hash, fname, results[fname])
+        manifest.save()
+
+    return results
+
+
+def _summary_epochs(cfg, fnames):
+    """
+    Load the sweep conditions among fnames for the summary only, without
+    plotting, profiling or recording them in the manifest.
+    """
+    from eeg_loader import output_base
+    from sweep_summary import parse_condition
+
+    conditions = [
+        fname
+        for fname in fnames
+        if parse_condition(os.path.basename(output_base(cfg, fname))) is not None
+    ]
+    if not conditions:
+        return {}
+    logging.info("Loading %d up to date condition(s) for the summary", len(conditions))
+
+    summary_cfg = copy.copy(cfg)
+    summary_cfg.plots = []
+    summary_cfg.profile = summary_cfg.cprofile = False
+    return _run(summary_cfg, conditions)
 
 
 def main():
     cfg = Config()  # Everything is parsed and set up inside Config()
 
-    for fname in cfg.get_matching_csv_files():
-        logging.info("Opening %s", fname)
-
-        rcsv = EEGCSVLoader(cfg, fname, 10, 100)
-        rcsv.plot_timeseries()
-        rcsv.plot_psd()
+    manifest = ReportManifest(cfg.output_dir)
+    config_hash = ReportManifest.config_hash(analysis_config(cfg))
+    if cfg.watch:
+        results = watch(cfg, manifest, config_hash)
+        fnames = list(results) + [
+            f for f in cfg.get_matching_csv_files(warn=False) if f not in results
+        ]
+    else:
+        fnames = cfg.get_matching_csv_files()
+        todo = [
+            f for f in fnames if cfg.force or not manifest.is_current(f, config_hash)
+        ]
+        if len(todo) < len(fnames):
+            logging.info(
+                "Skipping %d file(s) with up to date output (use --force to redo them)",
+                len(fnames) - len(todo),
+            )
+        results = _run(cfg, todo)
+        for fname, result in results.items():
+            _record(manifest, config_hash, fname, result)
+        if results:
+            manifest.save()
+    skipped = [f for f in fnames if f not in results]
+
+    if cfg.profile:
+        write_profile(cfg, results)
+    write_quality(cfg, fnames)
+
+    errors = {fname: result.error for fname, result in results.items()}
+    if cfg.summary:
+        from sweep_summary import write_summary
+
+        summaries = {**results, **_summary_epochs(cfg, skipped)}
+        errors.update((fname, result.error) for fname, result in summaries.items())
+        write_summary(
+            [
+                summaries[f].summary
+                for f in fnames
+                if f in summaries and summaries[f].summary is not None
+            ],
+            os.path.join(cfg.output_dir, "sweep_summary"),
+        )
 
-        if rcsv.have_onoff_events():
-            rcsv.plot_epochs()
+    failed = [fname for fname in fnames if errors.get(fname) is not None]
+    n_failed = len([fname for fname in failed if fname in results])
+    logging.info(
+        "Processed %d file(s): %d succeeded, %d failed, %d up to date",
+        len(results),
+        len(results) - n_failed,
+        n_failed,
+        len(skipped),
+    )
+    for fname in failed:
+        logging.error("Failed: %s (%s)", fname, errors[fname])
+
+    if failed:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+"""Runs the sweeps of several EEG/VHP rigs on one host at the same time"""
+
+import argparse
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import numpy as np
+
+from sweep_CH_Vol_Freq_diff_ON_OFF import Config, parse_yaml_file, run_sweep
+
+RIG_NAME = re.compile(r"^[A-Za-z0-9-]+$")
+
+
+class RigStopped(Exception):
+    """Raised inside a rig's sweep when the operator stops all rigs."""
+
+
+class Rig(threading.Thread):
+    """
+    Runs the sweep of one measurement/device configuration pair in its own
+    thread, with its own board, VHP port, scheduler and progress manifest.
+
+    Its files in *Recordings* carry the rig name after the timestamp. An
+    exception ends only this rig; it is kept in ``stats["error"]``.
+    """
+
+    def __init__(self, name, args, config, stop):
+        super().__init__(name=name, daemon=True)
+        self.args = args
+        self.config = config
+        self.stop = stop
+        self.stats = {"error": None}
+        self.started = self.finished = None
+
+    def _sleep(self, seconds):
+        if self.stop.wait(max(seconds, 0)):
+            raise RigStopped("stopped by the operator")
+
+    def run(self):
+        self.started = time.perf_counter()
+        try:
+            logging.info("Config loaded: %s", self.config)
+            self.stats = run_sweep(self.args, self.config, self._sleep)
+        except BaseException as e:
+            logging.error("Rig %s failed", self.name, exc_info=True)
+            self.stats = {"error": f"{type(e).__name__}: {e}"}
+        finally:
+            self.finished = time.perf_counter()
+
+    def summary(self):
+        """Throughput and timing of the sweep, one row of the rig table."""
+        stats = self.stats
+        wall = (self.finished or time.perf_counter()) - self.started
+        late = [x for kind in stats.get("jitter", {}).values() for x in kind]
+        late = np.array(late) * 1000
+        sfreq = stats.get("sfreq")
+        return {
+            "rig": self.name,
+            "conditions": stats.get("conditions", 0),
+            "skipped": stats.get("skipped", 0),
+            "wall_s": wall,
+            "conditions_per_h": stats.get("conditions", 0) * 3600 / wall,
+            "samples": stats.get("samples", 0),
+            "samples_per_s": stats.get("samples", 0) / wall,
+            "sfreq": sfreq,
+            "board_overruns": stats.get("board_overruns", 0),
+            "edges": len(late),
+            "late_mean_ms": late.mean() if len(late) else np.nan,
+            "late_p99_ms": np.percentile(late, 99) if len(late) else np.nan,
+            "late_max_ms": late.max() if len(late) else np.nan,
+        }
+
+
+def parse_cmdline():
+    parser = argparse.ArgumentParser(
+        description="Run the EEG/VHP sweeps of several rigs concurrently")
+    parser.add_argument('rigs', type=str,
+                        help="YAML file with a Rigs section mapping every rig "
+                        "name to its Measure and Device configuration")
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help="verbose level, up until 5 allowed")
+    parser.add_argument('-s', '--session-file', action='store_true',
+                        help="Record one binary session file per rig")
+    parser.add_argument('-l', '--live', action='store_true',
+                        help="Log the ON/OFF response of every condition as "
+                        "soon as it is done")
+    parser.add_argument('-a', '--adaptive', action='store_true',
+                        help="Stop repeating a condition once its response "
+                        "has converged")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Run every rig on a virtual clock against a "
+                        "simulated VHP and a synthetic board")
+    return parser.parse_args()
+
+
+def load_rigs(args):
+    """
+    Per rig the arguments and Config of its sweep, as parse_cmdline of the
+    sweep script would give them.
+
+    Raises ValueError for an invalid rig name or two rigs sharing a board
+    or VHP port.
+    """
+    rigs_conf = parse_yaml_file(args.rigs)
+    base = os.path.dirname(os.path.abspath(args.rigs))
+    rigs = {}
+    for name, rig in rigs_conf['Rigs'].items():
+        if not RIG_NAME.match(str(name)):
+            raise ValueError(f"Rig name {name!r} must consist of letters, "
+                             "digits and dashes")
+        rig_args = SimpleNamespace(
+            measureconf=os.path.join(base, rig['Measure']),
+            deviceconf=os.path.join(base, rig['Device']),
+            verbose=args.verbose, session_file=args.session_file,
+            live=args.live, adaptive=args.adaptive, dry_run=args.dry_run,
+            resume=rig.get('Resume'), rig=str(name))
+        config = Config(parse_yaml_file(rig_args.measureconf),
+                        parse_yaml_file(rig_args.deviceconf), rig_args)
+        rigs[str(name)] = (rig_args, config)
+
+    if not args.dry_run:  # Simulated rigs get their own devices
+        for key in ("serial_port", "board_serial", "board_mac"):
+            used = {}
+            for name, (_, config) in rigs.items():
+                value = getattr(config, key)
+                if value and value in used:
+                    raise ValueError(f"Rigs {used[value]} and {name} share "
+                                     f"{key} {value}")
+                used[value] = name
+
+    return rigs
+
+
+def setup_logging(args, timestamp):
+    """Console and consolidated session log of all rigs, tagged by thread"""
+    os.makedirs("./Recordings", exist_ok=True)
+    fname = f"./Recordings/{timestamp}_rigs.log"
+    formatter = logging.Formatter(
+        "[%(asctime)s] [%(threadName)s] [%(levelname)s] %(message)s")
+    root = logging.getLogger()
+    root.setLevel(args.verbose * 10)
+    for handler in (logging.StreamHandler(), logging.FileHandler(fname)):
+        handler.setFormatter(formatter)
+        root.addHandler(handler)
+
+    return fname
+
+
+def log_summary(rigs):
+    logging.info("%-12s %-6s %5s %5s %8s %7s %10s %6s %8s %6s %23s", "rig",
+                 "status", "cond", "skip", "wall s", "cond/h", "samples/s",
+                 "sfreq", "overruns", "edges", "late mean/p99/max ms")
+    for rig in rigs:
+        row = rig.summary()
+        status = "done" if rig.stats["error"] is None else "FAILED"
+        logging.info("%-12s %-6s %5d %5d %8.1f %7.1f %10.1f %6s %8d %6d "
+                     "%7.3f %7.3f %7.3f", row["rig"], status,
+                     row["conditions"], row["skipped"], row["wall_s"],
+                     row["conditions_per_h"], row["samples_per_s"],
+                     row["sfreq"], row["board_overruns"], row["edges"],
+                     row["late_mean_ms"], row["late_p99_ms"],
+                     row["late_max_ms"])
+        if rig.stats["error"] is not None:
+            logging.error("Rig %s: %s", rig.name, rig.stats["error"])
+
+
+def main():
+    args = parse_cmdline()
+    try:
+        rigs = load_rigs(args)
+    except ValueError as e:
+        raise SystemExit(f"Error: {e}")
+    timestamp = datetime.now().strftime("%y%m%d-%H%M")
+    log_file = setup_logging(args, timestamp)
+
+    from brainflow.board_shim import BoardShim
+    BoardShim.enable_dev_board_logger()
+
+    stop = threading.Event()
+    threads = [Rig(name, rig_args, config, stop)
+               for name, (rig_args, config) in rigs.items()]
+    logging.info("Starting %d rig(s): %s, log in %s", len(threads),
+                 ", ".join(rigs), log_file)
+    for thread in threads:
+        thread.start()
+
+    try:
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(0.5)
+    except KeyboardInterrupt:
+        logging.warning("Stopping all rigs")
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    log_summary(threads)
+    if any(thread.stats["error"] is not None for thread in threads):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Binary columnar cache for parsed BrainFlow CSV recordings"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+
+
+class RecordingCache:
+    """
+    Stores the columns of a BrainFlow CSV that the report actually uses as
+    .npy files, so later runs can memory-map them instead of re-parsing text.
+
+    Every recording gets its own entry directory, named after the recording
+    and a hash of its absolute path and column layout. The entry is valid as
+    long as the size and mtime of the CSV match the ones stored in its
+    metadata; otherwise it is rebuilt on the next store.
+    """
+
+    DIRNAME = ".csvcache"
+    VERSION = 1
+    ARRAYS = ("channels", "timestamps", "markers")
+    META = "meta.json"
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def clear(self):
+        """Remove all cached recordings."""
+        if os.path.isdir(self.cache_dir):
+            shutil.rmtree(self.cache_dir)
+            logging.info("Cleared cache %s", self.cache_dir)
+
+    def _entry_dir(self, filename, layout):
+        key = f"{os.path.abspath(filename)}|{layout}".encode("utf-8")
+        digest = hashlib.sha1(key).hexdigest()[:12]
+        stem = os.path.splitext(os.path.basename(filename))[0]
+
+        return os.path.join(self.cache_dir, f"{stem}-{digest}")
+
+    def _signature(self, filename, layout):
+        st = os.stat(filename)
+
+        return {
+            "version": self.VERSION,
+            "path": os.path.abspath(filename),
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "layout": layout,
+        }
+
+    def load(self, filename, layout):
+        """
+        Return the cached columns of a recording.
+
+        Parameters
+        ----------
+        filename : str
+            Path of the source CSV.
+        layout : str
+            Description of the selected columns, part of the cache key.
+
+        Returns
+        -------
+        tuple of ndarray or None
+            Read-only memory-mapped ``(channels, timestamps, markers)``, or None
+            when there is no valid entry for the current file.
+        """
+        entry = self._entry_dir(filename, layout)
+        try:
+            with open(os.path.join(entry, self.META), "r") as f:
+                meta = json.load(f)
+            if meta != self._signature(filename, layout):
+                logging.debug("Cache entry %s is stale", entry)
+                return None
+            arrays = tuple(
+                np.load(os.path.join(entry, name + ".npy"), mmap_mode="r")
+                for name in self.ARRAYS
+            )
+        except (OSError, ValueError) as exc:
+            logging.debug("No usable cache entry for %s: %s", filename, exc)
+            return None
+
+        logging.debug("Loaded %s from cache %s", filename, entry)
+        return arrays
+
+    def store(self, filename, layout, channels, timestamps, markers):
+        """Write the parsed columns of a recording, replacing any old entry."""
+        entry = self._entry_dir(filename, layout)
+        tmp_entry = f"{entry}.tmp{os.getpid()}"
+
+        try:
+            os.makedirs(tmp_entry, exist_ok=True)
+            for name, array in zip(self.ARRAYS, (channels, timestamps, markers)):
+                np.save(os.path.join(tmp_entry, name + ".npy"), array)
+            with open(os.path.join(tmp_entry, self.META), "w") as f:
+                json.dump(self._signature(filename, layout), f)
+
+            if os.path.isdir(entry):
+                shutil.rmtree(entry)
+            os.replace(tmp_entry, entry)
+            logging.debug("Cached %s in %s", filename, entry)
+        except OSError as exc:
+            logging.warning("Could not cache %s: %s", filename, exc)
+            shutil.rmtree(tmp_entry, ignore_errors=True)
@@ -0,0 +1,84 @@
+"""Detection of finished recordings while a sweep is still running"""
+
+import glob
+import logging
+import os
+import time
+
+from session_file import SessionSource
+from sweep_progress import SweepProgress
+
+PROGRESS_SUFFIX = "_progress.json"
+
+
+class RecordingWatcher:
+    """
+    Tells which recordings of file_base are finished, so they can be
+    processed while the sweep records the next condition.
+
+    - Conditions in a session file are finished once they are complete in
+      its index.
+    - CSV recordings of a sweep with a progress manifest are finished once
+      the manifest lists them as completed, i.e. after their streamer was
+      removed.
+    - Other CSV recordings are finished once their size and modification
+      time did not change for settle_s seconds.
+    """
+
+    def __init__(self, file_base, settle_s):
+        self.directory = os.path.dirname(file_base) or "."
+        self.prefix = os.path.basename(file_base)
+        self.settle_s = settle_s
+        self._states = {}  # CSV path -> (size, mtime_ns, first seen in this state)
+
+    def _progress(self):
+        """Completed conditions and the file name prefixes of the sweeps
+        with a progress manifest."""
+        pattern = os.path.join(glob.escape(self.directory), "*" + PROGRESS_SUFFIX)
+        completed, prefixes = set(), []
+        for path in glob.glob(pattern):
+            sweep = os.path.basename(path)[: -len(PROGRESS_SUFFIX)]
+            if not (sweep.startswith(self.prefix) or self.prefix.startswith(sweep)):
+                continue
+            try:
+                progress = SweepProgress.load(path)
+            except (OSError, ValueError, KeyError) as exc:
+                logging.debug("Cannot read progress manifest %s: %s", path, exc)
+                continue
+            completed.update(progress.completed)
+            prefixes.append(f"{progress.timestamp}_{progress.board_id}")
+
+        return completed, prefixes
+
+    def _is_settled(self, fname, now):
+        try:
+            st = os.stat(fname)
+        except OSError:
+            self._states.pop(fname, None)
+            return False
+        state = (st.st_size, st.st_mtime_ns)
+        previous = self._states.get(fname)
+        if previous is None or previous[:2] != state:
+            self._states[fname] = state + (now,)
+            return False
+
+        return st.st_size > 0 and now - previous[2] >= self.settle_s
+
+    def finished(self, fnames, now=None):
+        """The recordings among fnames (as from get_matching_csv_files) that
+        are finished."""
+        now = time.monotonic() if now is None else now
+        completed, prefixes = self._progress()
+        ready = []
+        for fname in fnames:
+            if isinstance(fname, SessionSource):
+                ready.append(fname)
+                continue
+            stem = os.path.splitext(os.path.basename(fname))[0]
+            if any(stem.startswith(prefix) for prefix in prefixes):
+                if stem in completed:
+                    ready.append(fname)
+            elif self._is_settled(fname, now):
+                ready.append(fname)
+
+        return ready
@@ -0,0 +1,113 @@
+"""Manifest of the reported recordings, for incremental measure_report.py runs"""
+
+import hashlib
+import json
+import logging
+import os
+
+from session_file import SessionReader, SessionSource
+
+
+class ReportManifest:
+    """
+    Maps every processed recording to the output files it produced, in a JSON
+    file in the output directory.
+
+    An entry holds the signature of the input (absolute path, size and mtime
+    of a CSV; the index entry of a session file condition) and a hash of the
+    analysis configuration. A recording is up to date as long as both match
+    and all its output files still exist; otherwise it is processed again.
+    """
+
+    FILENAME = "report_manifest.json"
+    VERSION = 1
+
+    def __init__(self, output_dir):
+        self.path = os.path.join(output_dir, self.FILENAME)
+        self.entries = {}
+        try:
+            with open(self.path, "r") as f:
+                manifest = json.load(f)
+            if manifest.get("version") == self.VERSION:
+                self.entries = manifest["entries"]
+            else:
+                logging.info("Ignoring manifest %s of another version", self.path)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as exc:
+            logging.warning("Ignoring unreadable manifest %s: %s", self.path, exc)
+
+    @staticmethod
+    def config_hash(config):
+        """Short hash of the analysis settings (a JSON serializable dict)."""
+        text = json.dumps(config, sort_keys=True)
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+
+    @staticmethod
+    def _signature(filename):
+        if isinstance(filename, SessionSource):
+            reader = SessionReader(filename.path)
+            try:
+                condition = json.dumps(reader.condition(filename.condition))
+            finally:
+                reader.close()
+            return {
+                "path": os.path.abspath(filename.path),
+                "condition": filename.condition,
+                "digest": hashlib.sha1(condition.encode("utf-8")).hexdigest(),
+            }
+
+        st = os.stat(filename)
+        return {
+            "path": os.path.abspath(filename),
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+        }
+
+    def is_current(self, filename, config_hash):
+        """Whether filename was processed with this configuration, has not
+        changed since and all its output files exist."""
+        entry = self.entries.get(str(filename))
+        if entry is None:
+            return False
+        try:
+            signature = self._signature(filename)
+        except (OSError, ValueError, KeyError) as exc:
+            logging.debug("Cannot check %s: %s", filename, exc)
+            return False
+        if entry["input"] != signature:
+            logging.debug("%s changed since the last report", filename)
+            return False
+        if entry["config"] != config_hash:
+            logging.debug("%s was reported with another configuration", filename)
+            return False
+        missing = [a for a in entry["artifacts"] if not os.path.exists(a)]
+        if missing:
+            logging.debug("Output of %s is missing: %s", filename, missing)
+            return False
+
+        return True
+
+    def update(self, filename, config_hash, artifacts):
+        """Record the output files of a successfully processed recording."""
+        self.entries[str(filename)] = {
+            "input": self._signature(filename),
+            "config": config_hash,
+            "artifacts": sorted(os.path.abspath(a) for a in artifacts),
+        }
+
+    def remove(self, filename):
+        """Forget filename, e.g. after it failed, so it is processed again."""
+        self.entries.pop(str(filename), None)
+
+    def save(self):
+        """Write the manifest, replacing the previous one in a single step."""
+        tmp_path = f"{self.path}.tmp{os.getpid()}"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(
+                    {"version": self.VERSION, "entries": self.entries}, f, indent=1
+                )
+            os.replace(tmp_path, self.path)
+        except OSError as exc:
+            logging.warning("Could not write manifest %s: %s", self.path, exc)
@@ -0,0 +1,86 @@
+"""Deadline based timing of the stimulation edges of a sweep"""
+
+import logging
+import time
+
+import numpy as np
+
+
+class DeadlineScheduler:
+    """
+    Plans absolute deadlines for all conditions of a sweep up front and fires
+    actions against them, so delays of serial writes or marker insertion do
+    not add up over the sweep.
+
+    Each condition gets ``setup_time`` seconds for its serial setup and
+    starting the recording, then ``prestart`` seconds of baseline, followed by
+    ``number`` ON/OFF cycles. The lateness of every fired edge is logged and
+    kept in ``jitter`` per edge kind.
+
+    The clock and sleep functions can be replaced, e.g. by a virtual clock,
+    which should use ``spin=0``.
+    """
+
+    SPIN_SEC = 0.002  # Busy-wait this long before a deadline for precision
+
+    def __init__(self, clock=time.perf_counter, sleep=time.sleep,
+                 spin=SPIN_SEC):
+        self.clock = clock
+        self.sleep = sleep
+        self.spin = spin
+        self.jitter = {}
+
+    def plan(self, n_conditions, setup_time, prestart, duration_on,
+             duration_off, number, t0=None):
+        """
+        Compute the deadlines of all conditions.
+
+        Returns
+        -------
+        list of dict
+            Per condition: ``setup`` and ``start`` deadlines, ``edges`` as a
+            list of (deadline, kind, cycle) with kind "ON" or "OFF", and the
+            ``end`` deadline, which is also the next condition's setup.
+        """
+        t = self.clock() if t0 is None else t0
+        period = duration_on + duration_off
+        conditions = []
+        for _ in range(n_conditions):
+            start = t + setup_time
+            first_on = start + prestart
+            edges = []
+            for cycle in range(number):
+                edges.append((first_on + cycle * period, "ON", cycle))
+                edges.append((first_on + cycle * period + duration_on, "OFF",
+                              cycle))
+            end = first_on + number * period
+            conditions.append({"setup": t, "start": start, "edges": edges,
+                               "end": end})
+            t = end
+
+        return conditions
+
+    def wait_until(self, deadline):
+        """Sleep until shortly before the deadline, then spin to it."""
+        remaining = deadline - self.clock()
+        if remaining > self.spin:
+            self.sleep(remaining - self.spin)
+        while self.spin and self.clock() < deadline:
+            pass
+
+    def fire(self, deadline, kind, action, label=""):
+        """Wait for the deadline, run action and record how late it started."""
+        self.wait_until(deadline)
+        late = self.clock() - deadline
+        action()
+
+        self.jitter.setdefault(kind, []).append(late)
+        logging.info("Edge %s %s late by %.3f ms", kind, label, late * 1000)
+        return late
+
+    def log_summary(self):
+        for kind, late in self.jitter.items():
+            late = np.array(late) * 1000
+            logging.info("Edge %s: %d edges, lateness mean %.3f p99 %.3f max "
+                         "%.3f ms", kind, len(late), late.mean(),
+                         np.percentile(late, 99), late.max())
@@ -0,0 +1,420 @@
+"""Single-file binary container for all conditions of a measurement sweep
+
+Layout of a session file::
+
+    MAGIC, version               header
+    JSON index                   file layout, metadata, conditions so far
+    index offset (u64), MAGIC    footer
+    zlib(float32 rows), zlib(float64 timestamps), ...      data chunks
+    JSON record                  one condition, offset of the previous record
+    record offset (u64), MAGIC   footer
+    ...
+
+The full index is only written when a file is created or reopened. When a
+condition begins or ends, a record with just that condition (its parameters,
+chunk offsets and markers) is appended after its data, so the file only
+grows: nothing written before is overwritten, and an interrupted sweep still
+leaves a readable file in which only the open condition is lost. The
+footer at the end points to the last record; a reader follows the chain of
+records back to the index, a later record of a condition replacing an
+earlier one. Conditions that were not finished are marked as incomplete.
+
+The trade-off: the begin record of every condition stays in the file
+after its end record supersedes it, and opening a file parses one record
+per condition begin and end. Both grow linearly with the number of
+conditions, where rewriting the whole index each time would leave a dead
+copy of a growing index per condition. ``SessionWriter.reopen`` writes a
+single full index again.
+"""
+
+import json
+import mmap
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+MAGIC = b"MSYNCSES"
+VERSION = 1
+EXTENSION = ".msync"
+
+_HEADER = struct.Struct("<8sI")
+_FOOTER = struct.Struct("<Q8s")
+
+
+class SessionWriter:
+    """
+    Writes BrainFlow board data of consecutive conditions into one session
+    file. Rows are stored as float32, except the timestamp row which keeps
+    float64 precision.
+
+    ``append`` and ``drain`` may be called from several threads; they move
+    board data into the current condition, or discard it between conditions.
+    The samples are staged in memory and only compressed and written in
+    blocks of CHUNK_SAMPLES, by ``write_chunks`` (also called by ``drain``),
+    and the rest at ``end_condition``. Staging is cheap and never waits for
+    a block being compressed, so callers that must not be delayed can
+    append while another thread writes.
+    """
+
+    CHUNK_SAMPLES = 65536
+    COMPRESSION_LEVEL = 1
+
+    def __init__(self, path, n_rows, timestamp_row, marker_row, metadata=None):
+        self._init_index(
+            path,
+            {
+                "version": VERSION,
+                "n_rows": n_rows,
+                "timestamp_row": timestamp_row,
+                "marker_row": marker_row,
+                "metadata": metadata or {},
+                "conditions": [],
+            },
+        )
+
+        self._file = open(path, "wb")
+        self._file.write(_HEADER.pack(MAGIC, VERSION))
+        self._data_end = self._file.tell()
+        self._write_index()
+
+    def _init_index(self, path, index):
+        self.path = path
+        self.n_rows = index["n_rows"]
+        self.timestamp_row = index["timestamp_row"]
+        self.marker_row = index["marker_row"]
+        self._data_rows = [r for r in range(self.n_rows) if r != self.timestamp_row]
+
+        self._lock = threading.Lock()  # Condition state and staged samples
+        self._write_lock = threading.Lock()  # File, taken before _lock
+        self._condition = None
+        self._index = index
+        self._staged = []
+        self._n_staged = 0
+
+    @classmethod
+    def for_board(cls, path, board_id, metadata=None):
+        """Writer with the row layout of BrainFlow board ``board_id``; keys
+        given in metadata take precedence over those of the board."""
+        from brainflow.board_shim import BoardIds, BoardShim
+
+        metadata = {
+            "board_id": BoardIds(board_id).name,
+            "sampling_rate": BoardShim.get_sampling_rate(board_id),
+            "eeg_channels": BoardShim.get_eeg_channels(board_id),
+            **(metadata or {}),
+        }
+
+        return cls(
+            path,
+            BoardShim.get_num_rows(board_id),
+            BoardShim.get_timestamp_channel(board_id),
+            BoardShim.get_marker_channel(board_id),
+            metadata,
+        )
+
+    @classmethod
+    def reopen(cls, path):
+        """
+        Continue writing an existing session file, e.g. to resume a sweep.
+
+        Conditions that are incomplete, or whose data does not decompress,
+        are dropped from the index; their names are kept in ``dropped``.
+        """
+        reader = SessionReader(path)
+        index = reader.index
+        kept, dropped = [], []
+        data_end = _HEADER.size
+        for condition in index["conditions"]:
+            if condition["complete"] and reader.verify(condition["name"]):
+                kept.append(condition)
+                for _, d_off, d_len, t_off, t_len in condition["chunks"]:
+                    data_end = max(data_end, d_off + d_len, t_off + t_len)
+            else:
+                dropped.append(condition["name"])
+        reader.close()
+        index["conditions"] = kept
+
+        writer = cls.__new__(cls)
+        writer._init_index(path, index)
+        writer.dropped = dropped
+        writer._file = open(path, "r+b")
+        writer._data_end = data_end
+        writer._write_index()  # Also drops the records and data of the rest
+
+        return writer
+
+    @property
+    def conditions(self):
+        """Names of the completely recorded conditions."""
+        return [c["name"] for c in self._index["conditions"] if c["complete"]]
+
+    def __del__(self):
+        self.close()
+
+    def _write_index(self):
+        """Write the full index after the data, cutting off anything beyond."""
+        self._write_json(self._data_end, self._index)
+        self._file.truncate()
+
+    def _write_record(self, condition):
+        """Append a record of condition, chained to the previous record."""
+        record = {"previous": self._last_record, "condition": condition}
+        self._write_json(max(self._data_end, self._index_end), record)
+
+    def _write_json(self, offset, obj):
+        blob = json.dumps(obj).encode("utf-8")
+        self._file.seek(offset)
+        self._file.write(blob)
+        self._file.write(_FOOTER.pack(offset, MAGIC))
+        self._file.flush()
+        self._last_record = [offset, len(blob)]
+        self._index_end = self._file.tell()
+
+    def _write_blob(self, array):
+        blob = zlib.compress(
+            np.ascontiguousarray(array).tobytes(), self.COMPRESSION_LEVEL
+        )
+        # Never over the last record, which is the one read after a crash
+        offset = max(self._data_end, self._index_end)
+        self._file.seek(offset)
+        self._file.write(blob)
+        self._data_end = offset + len(blob)
+
+        return [offset, len(blob)]
+
+    def begin_condition(self, name, **params):
+        """Start a new condition; params (e.g. channel, frequency) go in the index."""
+        with self._write_lock, self._lock:
+            if self._condition is not None:
+                raise RuntimeError(f"Condition {self._condition['name']} still open")
+            self._condition = {
+                "name": name,
+                "params": params,
+                "n_samples": 0,
+                "chunks": [],
+                "markers": [],
+                "complete": False,
+            }
+            self._index["conditions"].append(self._condition)
+            self._write_record(self._condition)
+
+    def _append(self, data):
+        start = self._condition["n_samples"]
+        markers = data[self.marker_row]
+        nz = np.flatnonzero(markers)
+        self._condition["markers"].extend(
+            [int(start + i), float(markers[i])] for i in nz
+        )
+        self._condition["n_samples"] += data.shape[1]
+        self._staged.append(data)
+        self._n_staged += data.shape[1]
+
+    def _take_staged(self, n_samples):
+        """Remove the first n_samples staged samples and return them."""
+        staged = np.concatenate(self._staged, axis=1)
+        self._staged = [staged[:, n_samples:]] if n_samples < staged.shape[1] else []
+        self._n_staged -= n_samples
+        return staged[:, :n_samples]
+
+    def _write_chunks(self, condition, data):
+        for first in range(0, data.shape[1], self.CHUNK_SAMPLES):
+            block = data[:, first : first + self.CHUNK_SAMPLES]
+            chunk = (
+                [block.shape[1]]
+                + self._write_blob(block[self._data_rows].astype(np.float32))
+                + self._write_blob(block[self.timestamp_row].astype(np.float64))
+            )
+            with self._lock:
+                condition["chunks"].append(chunk)
+
+    def append(self, data):
+        """Stage board data of shape (n_rows, n_samples) in the open condition."""
+        with self._lock:
+            if self._condition is not None and data.shape[1]:
+                self._append(data)
+
+    def write_chunks(self):
+        """Compress and write the staged samples that fill whole chunks."""
+        with self._write_lock:
+            with self._lock:
+                n = self._n_staged // self.CHUNK_SAMPLES * self.CHUNK_SAMPLES
+                if n == 0:
+                    return
+                condition, data = self._condition, self._take_staged(n)
+            self._write_chunks(condition, data)
+
+    def drain(self, board_shim):
+        """Move everything in the board's ring buffer into the session."""
+        self.append(board_shim.get_board_data())
+        self.write_chunks()
+
+    def end_condition(self):
+        """Write the rest of the open condition and make it visible in the
+        index."""
+        with self._write_lock:
+            with self._lock:  # Data appended from now on is discarded
+                condition, self._condition = self._condition, None
+                data = self._take_staged(self._n_staged) if self._n_staged else None
+            if data is not None:
+                self._write_chunks(condition, data)
+            with self._lock:
+                condition["complete"] = True
+                self._write_record(condition)
+
+    def close(self):
+        with self._write_lock, self._lock:
+            if getattr(self, "_file", None) is not None and not self._file.closed:
+                if self._condition is not None:  # Chunks written so far
+                    self._write_record(self._condition)
+                self._file.close()
+
+
+class SessionReader:
+    """
+    Memory-maps a session file and decompresses only the chunks of the
+    condition that is asked for.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._mm) < _HEADER.size + _FOOTER.size:
+            raise ValueError(f"{path} is not a readable session file")
+        magic, version = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version > VERSION:
+            raise ValueError(f"{path} is not a readable session file")
+
+        self.index = self._read_index()
+        self.n_rows = self.index["n_rows"]
+        self.timestamp_row = self.index["timestamp_row"]
+        self.marker_row = self.index["marker_row"]
+        self._data_rows = [r for r in range(self.n_rows) if r != self.timestamp_row]
+        self._conditions = {c["name"]: c for c in self.index["conditions"]}
+
+    def _read_index(self):
+        """
+        The index with the conditions of all records chained to the record of
+        the footer at the end of the file or, while a condition is being
+        written or after a crash, to the last record before its data.
+        """
+        record = self._last_record()
+        records = []
+        while "conditions" not in record:
+            records.append(record["condition"])
+            offset, length = record["previous"]
+            record = json.loads(self._mm[offset : offset + length].decode("utf-8"))
+
+        # Recording order, with the last record of every condition
+        conditions = {c["name"]: c for c in record["conditions"]}
+        for condition in reversed(records):
+            conditions[condition["name"]] = condition
+        record["conditions"] = list(conditions.values())
+        return record
+
+    def _last_record(self):
+        end = len(self._mm)
+        while end >= _HEADER.size + _FOOTER.size:
+            offset, magic = _FOOTER.unpack_from(self._mm, end - _FOOTER.size)
+            if magic == MAGIC and _HEADER.size <= offset <= end - _FOOTER.size:
+                try:
+                    record = json.loads(
+                        self._mm[offset : end - _FOOTER.size].decode("utf-8")
+                    )
+                except ValueError:  # MAGIC by chance inside compressed data
+                    record = None
+                if isinstance(record, dict) and (
+                    "conditions" in record or "previous" in record
+                ):
+                    return record
+            end = self._mm.rfind(MAGIC, _HEADER.size, end - 1) + len(MAGIC)
+
+        raise ValueError(f"{self.path} is not a readable session file")
+
+    def close(self):
+        self._mm.close()
+
+    @property
+    def conditions(self):
+        """Names of the completely recorded conditions, in recording order."""
+        return [name for name, c in self._conditions.items() if c["complete"]]
+
+    def condition(self, name):
+        """Index entry (params, n_samples, markers) of a condition."""
+        return self._conditions[name]
+
+    def _blob(self, offset, length, dtype):
+        return np.frombuffer(
+            zlib.decompress(self._mm[offset : offset + length]), dtype=dtype
+        )
+
+    def verify(self, name):
+        """Whether all chunks of a condition decompress to their expected size."""
+        n_data_rows = len(self._data_rows)
+        chunks = self._conditions[name]["chunks"]
+        try:
+            for n_samples, d_off, d_len, t_off, t_len in chunks:
+                data = self._blob(d_off, d_len, np.float32)
+                timestamps = self._blob(t_off, t_len, np.float64)
+                if data.size != n_samples * n_data_rows or timestamps.size != n_samples:
+                    return False
+        except (zlib.error, ValueError):
+            return False
+
+        return True
+
+    def iter_chunks(self, name, rows):
+        """
+        Yield the stored chunks of a condition.
+
+        Parameters
+        ----------
+        name : str
+            Condition name.
+        rows : list of int
+            Board data rows to return; the timestamp row may be included.
+
+        Yields
+        ------
+        ndarray, shape (n_samples, len(rows))
+            Float64 chunk in the column layout of a BrainFlow CSV.
+        """
+        for n_samples, d_off, d_len, t_off, t_len in self._conditions[name]["chunks"]:
+            data = self._blob(d_off, d_len, np.float32).reshape(-1, n_samples)
+            columns = []
+            for row in rows:
+                if row == self.timestamp_row:
+                    columns.append(self._blob(t_off, t_len, np.float64))
+                else:
+                    columns.append(data[self._data_rows.index(row)])
+            yield np.column_stack(columns).astype(np.float64)
+
+    def read(self, name, rows):
+        """All samples of a condition, shape (n_samples, len(rows))."""
+        chunks = list(self.iter_chunks(name, rows))
+        if not chunks:
+            return np.empty((0, len(rows)))
+        return np.concatenate(chunks)
+
+
+class SessionSource:
+    """A condition inside a session file, used where a CSV path is expected."""
+
+    def __init__(self, path, condition):
+        self.path = path
+        self.condition = condition
+
+    def __str__(self):
+        return f"{self.path}#{self.condition}"
+
+    def __repr__(self):
+        return f"SessionSource({self.path!r}, {self.condition!r})"
+
+    def __eq__(self, other):
+        return isinstance(other, SessionSource) and str(self) == str(other)
+
+    def __hash__(self):
+        return hash(str(self))
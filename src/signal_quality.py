@@ -0,0 +1,154 @@
+"""Signal quality scan of the raw EEG channels, before any filtering"""
+
+import logging
+
+import numpy as np
+
+SATURATION = 0.999  # Share of the board's rail from which a sample is clipped
+LINE_FREQ = 50  # Hz, mains
+LINE_WIDTH = 1  # Hz on either side of LINE_FREQ
+BROADBAND = (1, 100)  # Hz, reference band of the line noise ratio
+N_FFT = 512
+BLOCK = 65536  # Samples scanned at once, bounds the temporary arrays
+
+# Default limits of a good channel
+MAX_SATURATION = 0.01  # Share of the samples at the rail
+MAX_FLAT_S = 1.0  # Longest span without any change
+
+
+class SignalQuality:
+    """
+    Per-channel quality of a recording, scanned in chunks of raw samples in
+    µV as read from the file, so a saturated or dead channel is found before
+    it is filtered and plotted.
+
+    - ``saturation``: share of the samples at the rail of the board
+      (|x| >= SATURATION * rail_uv), e.g. 312499.99 µV of the FreeEEG32 or
+      -400000.05 µV of the Mentalab.
+    - ``flat_s``: longest span of identical consecutive samples, and
+      ``flat``: share of the samples in such spans.
+    - ``variance``: in µV².
+    - ``line_noise``: share of the BROADBAND power within LINE_WIDTH of
+      LINE_FREQ, from a Welch PSD of the unfiltered channel.
+    """
+
+    def __init__(self, ch_names, sfreq, rail_uv):
+        self.ch_names = list(ch_names)
+        self.sfreq = sfreq
+        self.rail_uv = rail_uv
+
+        n_channels = len(self.ch_names)
+        self.n_samples = 0
+        self._saturated = np.zeros(n_channels, dtype=np.int64)
+        self._flat = np.zeros(n_channels, dtype=np.int64)
+        self._longest_run = np.zeros(n_channels, dtype=np.int64)
+        self._run = np.zeros(n_channels, dtype=np.int64)  # Run at the chunk end
+        self._last = None
+        self._mean = np.zeros(n_channels)
+        self._m2 = np.zeros(n_channels)
+        # Imported here: streaming.py loads MNE and SciPy, and measure_report.py
+        # reads the limits above before it processes anything
+        from streaming import WelchAccumulator
+
+        self._welch = WelchAccumulator(sfreq, n_channels, N_FFT)
+
+    def add(self, data):
+        """Add a chunk of shape (n_samples, n_channels) in µV."""
+        data = np.asarray(data, dtype=np.float64)
+        for start in range(0, len(data), BLOCK):
+            self._add_block(data[start : start + BLOCK])
+
+    def _add_block(self, data):
+        n = len(data)
+
+        self._saturated += np.sum(np.abs(data) >= SATURATION * self.rail_uv, axis=0)
+
+        # Length of the run of identical samples ending at every sample: the
+        # distance to the last change, carried over from the previous chunk
+        previous = data[:1] if self._last is None else self._last
+        same = np.diff(data, axis=0, prepend=previous) == 0
+        if self._last is None:
+            same[0] = False
+        idx = np.arange(1, n + 1)[:, None]
+        last_change = np.where(same, 0, idx)
+        np.maximum.accumulate(last_change, axis=0, out=last_change)
+        run = idx - last_change + np.where(last_change == 0, self._run, 0)
+        self._flat += np.sum(same, axis=0)
+        self._longest_run = np.maximum(self._longest_run, run.max(axis=0))
+        self._run = run[-1]
+        self._last = data[-1:]
+
+        # Chunk mean and M2 merged into the running ones (Chan et al.)
+        mean = data.mean(axis=0)
+        m2 = np.sum((data - mean) ** 2, axis=0)
+        total = self.n_samples + n
+        delta = mean - self._mean
+        self._mean += delta * n / total
+        self._m2 += m2 + delta**2 * self.n_samples * n / total
+        self.n_samples = total
+
+        self._welch.add(data.T)
+
+    def table(self):
+        """
+        Quality per channel.
+
+        Returns
+        -------
+        list of dict
+            Per channel: its ``channel`` name, ``saturation``, ``flat``,
+            ``flat_s``, ``variance`` and ``line_noise``.
+        """
+        n = max(self.n_samples, 1)
+        freqs, psd = self._welch.freqs, self._welch.psd()
+        broadband = (freqs >= BROADBAND[0]) & (freqs <= BROADBAND[1])
+        line = np.abs(freqs - LINE_FREQ) <= LINE_WIDTH
+        with np.errstate(invalid="ignore", divide="ignore"):
+            line_noise = psd[:, line].sum(axis=1) / psd[:, broadband].sum(axis=1)
+
+        return [
+            {
+                "channel": name,
+                "saturation": float(self._saturated[i] / n),
+                "flat": float(self._flat[i] / n),
+                "flat_s": float(self._longest_run[i] / self.sfreq),
+                "variance": float(self._m2[i] / n),
+                "line_noise": float(line_noise[i]),
+            }
+            for i, name in enumerate(self.ch_names)
+        ]
+
+    @staticmethod
+    def is_bad(row, max_saturation, max_flat_s, max_line_noise=None):
+        """Reasons why the channel of a table row is bad, empty if good."""
+        reasons = []
+        if row["saturation"] > max_saturation:
+            reasons.append(f"{row['saturation']:.1%} saturated")
+        if row["flat_s"] >= max_flat_s or row["variance"] == 0:
+            reasons.append(f"flat for {row['flat_s']:.2f} s")
+        if max_line_noise is not None and not row["line_noise"] <= max_line_noise:
+            reasons.append(f"line noise {row['line_noise']:.2f}")
+        return reasons
+
+    def bad_channels(self, max_saturation, max_flat_s, max_line_noise=None):
+        """
+        Channels outside the limits, see ``is_bad``.
+
+        Returns
+        -------
+        dict
+            Reasons per bad channel name, in channel order.
+        """
+        bads = {}
+        for row in self.table():
+            reasons = self.is_bad(row, max_saturation, max_flat_s, max_line_noise)
+            if reasons:
+                bads[row["channel"]] = reasons
+        return bads
+
+    def log_summary(self, name, bads):
+        """Log the bad channels with the reasons found by bad_channels."""
+        if not bads:
+            logging.info("%s: all %d channels pass", name, len(self.ch_names))
+        for channel, reasons in bads.items():
+            logging.warning("%s: bad channel %s: %s", name, channel, ", ".join(reasons))
@@ -0,0 +1,70 @@
+"""Wall time, CPU time and memory of the named processing stages of a recording"""
+
+import time
+import tracemalloc
+from collections import namedtuple
+from contextlib import contextmanager, nullcontext
+
+StageRecord = namedtuple(
+    "StageRecord", ["stage", "wall_s", "cpu_s", "delta_bytes", "peak_bytes"]
+)
+
+
+class StageTimer:
+    """
+    Records how long each stage takes. Used as ``with timer("filter"): ...``
+    around the stages of ``EEGCSVLoader``. Stages may be nested, e.g. the
+    filter stage inside the load stage; every stage gets its own record,
+    written when it ends.
+
+    With ``trace_memory`` the memory traced by ``tracemalloc`` is recorded
+    too: its change over the stage (``delta_bytes``) and its peak during the
+    stage relative to the start (``peak_bytes``). Tracing slows down Python
+    heavy stages (e.g. plotting), so time and memory are best measured in
+    separate runs.
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.records = []  # StageRecord per finished stage
+        self._peaks = []  # Highest traced memory seen so far per open stage
+
+    @contextmanager
+    def __call__(self, stage):
+        start_bytes = None
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            start_bytes, peak = tracemalloc.get_traced_memory()
+            if self._peaks:
+                # reset_peak also resets it for the enclosing stage
+                self._peaks[-1] = max(self._peaks[-1], peak)
+            tracemalloc.reset_peak()
+            self._peaks.append(start_bytes)
+
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - start_wall
+            cpu = time.process_time() - start_cpu
+            delta = peak = None
+            if start_bytes is not None:
+                end_bytes, peak_bytes = tracemalloc.get_traced_memory()
+                peak_bytes = max(peak_bytes, self._peaks.pop())
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak_bytes)
+                delta = end_bytes - start_bytes
+                peak = peak_bytes - start_bytes
+            self.records.append(StageRecord(stage, wall, cpu, delta, peak))
+
+    def stop(self):
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+def stage(stages, name):
+    """Context of processing stage name, timed if stages (e.g. a StageTimer)
+    were given."""
+    return stages(name) if stages is not None else nullcontext()
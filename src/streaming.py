@@ -0,0 +1,230 @@
+"""Building blocks for analysing recordings in fixed-size chunks"""
+
+from functools import lru_cache
+
+import mne
+import numpy as np
+from scipy.signal import fftconvolve, oaconvolve, spectrogram
+
+
+def design_bandpass(sfreq, l_freq, h_freq):
+    """FIR kernel of ``raw.filter(l_freq, h_freq)`` with MNE defaults."""
+    return mne.filter.create_filter(
+        None,
+        sfreq,
+        l_freq,
+        h_freq,
+        method="fir",
+        phase="zero",
+        fir_window="hamming",
+        fir_design="firwin",
+        verbose=False,
+    )
+
+
+def design_notch(sfreq, freqs, trans_bandwidth=1.0):
+    """FIR kernel of ``raw.notch_filter(freqs, method="fir")`` with MNE defaults."""
+    freqs = np.atleast_1d(np.asarray(freqs, dtype=float))
+    half_width = freqs / 200.0 / 2.0 + trans_bandwidth / 2.0
+
+    return mne.filter.create_filter(
+        None,
+        sfreq,
+        list(freqs + half_width),
+        list(freqs - half_width),
+        l_trans_bandwidth=trans_bandwidth / 2.0,
+        h_trans_bandwidth=trans_bandwidth / 2.0,
+        method="fir",
+        phase="zero",
+        fir_window="hamming",
+        fir_design="firwin",
+        verbose=False,
+    )
+
+
+@lru_cache(maxsize=None)
+def design_filter_bank(sfreq, l_freq, h_freq, notch_freqs=()):
+    """
+    Single FIR kernel for ``raw.filter(l_freq, h_freq)`` followed by
+    ``raw.notch_filter(notch_freqs, method="fir")``: the convolution of both
+    kernels. It is designed once per sampling rate, band and notch set and
+    shared, so it is read-only. ``notch_freqs`` must be a tuple.
+    """
+    h = design_bandpass(sfreq, l_freq, h_freq)
+    if notch_freqs:
+        h = np.convolve(h, design_notch(sfreq, notch_freqs))
+    h.setflags(write=False)
+
+    return h
+
+
+def fir_filter(h, x):
+    """
+    Zero-phase filter a complete signal of shape (n_channels, n_samples) with
+    FIR kernel h, padding the edges like MNE ("reflect_limited"). All channels
+    are convolved in one overlap-add pass.
+    """
+    n_edge = min(len(h), x.shape[1]) - 1
+    ext = np.concatenate(
+        (
+            2 * x[:, :1] - x[:, n_edge:0:-1],
+            x,
+            2 * x[:, -1:] - x[:, -2 : -n_edge - 2 : -1],
+        ),
+        axis=1,
+    )
+    out = oaconvolve(ext, np.asarray(h)[np.newaxis, :], mode="full", axes=1)
+    start = n_edge + (len(h) - 1) // 2
+
+    return out[:, start : start + x.shape[1]]
+
+
+class StreamingFIR:
+    """
+    Zero-phase FIR filter applied to a signal that arrives in chunks.
+
+    Reproduces MNE's single-pass zero-phase FIR filtering, including the
+    "reflect_limited" edge padding, while only keeping the last ``len(h)``
+    input samples between chunks. The output lags the input by the filter
+    delay; ``finish()`` flushes the remaining samples at the end of the
+    recording.
+    """
+
+    def __init__(self, h):
+        self.h = np.asarray(h, dtype=float)
+        self.n_h = len(self.h)
+        self.n_edge = self.n_h - 1
+        self.n_in = 0
+        self.n_out = 0
+
+        self._pending = []  # Input held back until the left edge can be padded
+        self._history = None  # Last n_h - 1 samples fed to the convolution
+        self._tail = None  # Last n_h input samples, for the right edge padding
+        self._skip = self.n_edge + self.n_edge // 2
+
+    def _convolve(self, x):
+        """Filter the padded signal x, continuing from the previous call."""
+        ext = np.concatenate((self._history, x), axis=1)
+        self._history = ext[:, ext.shape[1] - self.n_edge :]
+        out = fftconvolve(ext, self.h[np.newaxis, :], mode="valid", axes=1)
+
+        # Drop the outputs of the left padding and the filter delay
+        skip = min(self._skip, out.shape[1])
+        self._skip -= skip
+        return out[:, skip:]
+
+    def _emit(self, out):
+        """Limit the output to the length of the input seen so far."""
+        out = out[:, : self.n_in - self.n_out]
+        self.n_out += out.shape[1]
+        return out
+
+    def process(self, x):
+        """Feed a chunk of shape (n_channels, n_samples), return what is ready."""
+        self.n_in += x.shape[1]
+
+        if self._history is None:
+            self._pending.append(x)
+            if self.n_in <= self.n_edge:
+                return np.empty((x.shape[0], 0))
+
+            x = np.concatenate(self._pending, axis=1)
+            self._pending = None
+            self._history = np.zeros((x.shape[0], self.n_edge))
+            left = 2 * x[:, :1] - x[:, self.n_edge : 0 : -1]
+            x = np.concatenate((left, x), axis=1)
+
+        self._tail = (
+            np.concatenate((self._tail, x), axis=1) if self._tail is not None else x
+        )
+        self._tail = self._tail[:, -self.n_h :]
+
+        return self._emit(self._convolve(x))
+
+    def finish(self):
+        """Pad the right edge and return the remaining filtered samples."""
+        if self._history is None:
+            if not self._pending:
+                return np.empty((0, 0))
+            # Shorter than the filter, filter in one block
+            x = np.concatenate(self._pending, axis=1)
+            self.n_out = self.n_in
+            return self._filter_block(x)
+
+        right = 2 * self._tail[:, -1:] - self._tail[:, -2 : -self.n_h - 1 : -1]
+
+        return self._emit(self._convolve(right))
+
+    def _filter_block(self, x):
+        """Filter a complete signal, padding the edges like MNE."""
+        return fir_filter(self.h, x)
+
+
+class WelchAccumulator:
+    """
+    Welch PSD of a stream, averaged over non-overlapping Hamming-windowed
+    segments of ``n_fft`` samples, as ``compute_psd(method="welch")`` does.
+    Only the last incomplete segment is buffered.
+    """
+
+    def __init__(self, sfreq, n_channels, n_fft=256):
+        self.sfreq = sfreq
+        self.n_fft = n_fft
+        self.freqs = np.fft.rfftfreq(n_fft, 1 / sfreq)
+        self.n_segments = 0
+        self._sum = np.zeros((n_channels, len(self.freqs)))
+        self._buffer = np.empty((n_channels, 0))
+
+    def add(self, x):
+        """Add a chunk of shape (n_channels, n_samples)."""
+        x = np.concatenate((self._buffer, x), axis=1)
+        n_complete = x.shape[1] // self.n_fft * self.n_fft
+        self._buffer = x[:, n_complete:]
+
+        if n_complete:
+            _, _, psd = spectrogram(
+                x[:, :n_complete],
+                fs=self.sfreq,
+                window="hamming",
+                nperseg=self.n_fft,
+                noverlap=0,
+                detrend="constant",
+                mode="psd",
+            )
+            self._sum += psd.sum(axis=-1)
+            self.n_segments += psd.shape[-1]
+
+    def psd(self):
+        """Mean PSD over all complete segments, shape (n_channels, n_freqs)."""
+        if self.n_segments == 0:
+            return np.full(self._sum.shape, np.nan)
+        return self._sum / self.n_segments
+
+
+class EpochPSDStats:
+    """Running mean and standard deviation of per-epoch PSDs per condition."""
+
+    def __init__(self):
+        self.count = {}
+        self._mean = {}
+        self._m2 = {}
+
+    def add(self, label, psd):
+        """Add the PSD of one epoch (Welford update)."""
+        n = self.count.get(label, 0) + 1
+        mean = self._mean.get(label, np.zeros_like(psd))
+        delta = psd - mean
+        mean = mean + delta / n
+
+        self.count[label] = n
+        self._mean[label] = mean
+        self._m2[label] = self._m2.get(label, np.zeros_like(psd)) + delta * (psd - mean)
+
+    def mean(self, label):
+        return self._mean[label]
+
+    def std(self, label):
+        n = self.count[label]
+        if n < 2:
+            return np.full(self._m2[label].shape, np.nan)
+        return np.sqrt(self._m2[label] / (n - 1))
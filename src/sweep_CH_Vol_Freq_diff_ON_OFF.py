@@ -3,12 +3,19 @@
 #!/usr/bin/env python
 
 import argparse
+import glob
 import logging
+import os
+import re
 import time
 from datetime import datetime
-import serial
 import yaml
-from brainflow.board_shim import BoardShim, BrainFlowInputParams, BoardIds
+from acquisition import Acquisition
+from scheduler import DeadlineScheduler
+from session_file import SessionWriter, EXTENSION as SESSION_EXTENSION
+from sweep_progress import SweepProgress, verify_csv
+from timing_log import TimingLog, SUFFIX as TIMING_SUFFIX
+from vhp_serial import SerialCommunicator
 
 
 class Config:
@@ -28,15 +35,31 @@ class Config:
         self.measurements_duration_on = measurement['Measurements']['Duration_on']
         self.measurements_duration_off = measurement['Measurements']['Duration_off']
         self.measurements_prestart = measurement['Measurements']['Pre-start_EEG_measurement']
+        self.measurements_setup = measurement['Measurements'].get('Setup_time', 1)
+        self.adaptive_params = measurement.get('Adaptive', {})
         self.board_id = device['Board']['Id']
         self.board_master = device['Board']['Master']
         self.board_mac = device['Board']['Mac']
         self.board_file = device['Board']['File']
         self.board_serial = device['Board']['Serial']
-        self.keep_ble_alive = device['Board']['Keep_ble_alive']
+        self.drain_interval = device['Board'].get(
+            'Drain_interval', Acquisition.INTERVAL_SEC)
+        self.ring_seconds = device['Board'].get('Ring_seconds',
+                                                Acquisition.RING_SEC)
+        self.live_channels = device['Board'].get('Channels')
         self.serial_port = device['VHP']['Serial']
+        self.serial_reply_timeout = device['VHP'].get(
+            'Reply_timeout', SerialCommunicator.REPLY_TIMEOUT_SEC)
         self.verbose = args.verbose
+        self.session_file = args.session_file
+        self.resume = args.resume
+        self.live = args.live
+        self.adaptive = args.adaptive
+        self.dry_run = args.dry_run
+        self.rig = getattr(args, 'rig', None)
         self.timestamp = datetime.now().strftime("%y%m%d-%H%M")
+        if self.rig:  # Keeps the files of rigs started together apart
+            self.timestamp += f"_{self.rig}"
 
     def __str__(self):
         return (f"Volume Range: {self.volume_start} to {self.volume_end}, "
@@ -50,89 +73,6 @@ class Config:
                 f"Mac = {self.board_mac}, Serial = {self.board_serial}")
 
 
-class SerialCommunicator:
-    """Handles serial communication with VHP device"""
-
-    BAUDRATE = 115200
-    TIMEOUT_SEC = 1
-
-    def __init__(self, port):
-        self.port = port
-        self.ser = serial.Serial(
-            port=self.port,
-            baudrate=self.BAUDRATE,
-            timeout=self.TIMEOUT_SEC
-        )
-        if not self.ser.is_open:
-            self.ser.open()
-
-        # Wait a bit for Arduino reset
-        time.sleep(2)
-
-    def __del__(self):
-        if hasattr(self, 'ser'):
-            if self.ser.is_open:
-                self.ser.close()
-                logging.info("Serial closed")
-
-    def _send_command(self, command):
-        self.ser.write((command + '\n').encode('utf-8'))
-        logging.debug("Serial VHP Sent: %s", command)
-
-        # Wait a little to receive Arduino reply
-        time.sleep(0.05)
-
-        # Read and print all available replies
-        while self.ser.in_waiting > 0:
-            response = self.ser.readline().decode('utf-8', errors='ignore').strip()
-            logging.debug("Serial VHP Received: %s", response)
-
-    def set_duration(self, duration):
-        duration = max(1, min(65535, duration))
-        self._send_command(f'D{duration}')
-
-    def set_cycle_period(self, cycle_period):
-        cycle_period = max(1, min(65535, cycle_period))
-        self._send_command(f'Y{cycle_period}')
-
-    def set_pause_cycle_period(self, pause_cycle_period):
-        pause_cycle_period = max(0, min(100, pause_cycle_period))
-        self._send_command(f'P{pause_cycle_period}')
-
-    def set_paused_cycles(self, paused_cycles):
-        paused_cycles = max(0, min(100, paused_cycles))
-        self._send_command(f'Q{paused_cycles}')
-
-    def set_jitter(self, jitter):
-        jitter = max(0, min(1000, jitter))
-        self._send_command(f'J{jitter}')
-
-    def set_test_mode(self, enabled):
-        self._send_command(f'M{1 if enabled else 0}')
-
-    def set_channel(self, channel):
-        channel = max(0, min(8, channel))
-        self._send_command(f'C{channel}')
-
-    def set_volume(self, volume):
-        volume = max(0, min(100, volume))
-        self._send_command(f'V{volume}')
-
-    def set_frequency(self, frequency):
-        self._send_command(f'F{frequency}')
-
-    def start_stream(self):
-        self._send_command('1')
-
-    def stop_stream(self):
-        self._send_command('0')
-
-    def get_fw(self):
-        self._send_command('S')
-
-    def get_par(self):
-        self._send_command('X')
-
 def parse_yaml_file(file_path):
     with open(file_path, 'r') as file:
         return yaml.safe_load(file)
@@ -147,6 +87,22 @@ def parse_cmdline():
                         "configuration file")
     parser.add_argument('-v', '--verbose', action='count', default=0,
                         help="verbose level, up until 5 allowed")
+    parser.add_argument('-s', '--session-file', action='store_true',
+                        help="Record all conditions into one binary session "
+                        "file instead of a CSV per condition")
+    parser.add_argument('-l', '--live', action='store_true',
+                        help="Log the ON/OFF response at the stimulation "
+                        "frequency of every condition as soon as it is done")
+    parser.add_argument('-a', '--adaptive', action='store_true',
+                        help="Stop repeating a condition once its response "
+                        "has converged, see the Adaptive configuration")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Run the sweep on a virtual clock against a "
+                        "simulated VHP and a synthetic board")
+    parser.add_argument('--resume', nargs='?', const='latest',
+                        metavar='PROGRESS',
+                        help="Resume an interrupted sweep from its progress "
+                        "file (default: the latest one in ./Recordings)")
     args = parser.parse_args()
 
     # Parse the specified YAML file
@@ -160,6 +116,7 @@ def parse_cmdline():
 
 
 def setup_brainflow_board(config):
+    from brainflow.board_shim import BoardShim, BrainFlowInputParams, BoardIds
 
     params = BrainFlowInputParams()
 
@@ -183,33 +140,221 @@ def setup_brainflow_board(config):
     return board_shim
 
 
-def do_measurement(com, board_shim, config, channel, frequency, volume):
-    logging.info("Measuring Chan=%i Freq=%i Vol=%i", channel, frequency, volume)
+def open_session_writer(config):
+    """Session file recorder, board layout from the (master) board id"""
+    from brainflow.board_shim import BoardIds
 
-    fname = (f"./Recordings/{config.timestamp}_{config.board_id}_"
-             f"c{channel}_f{frequency}_v{volume}.csv")
+    fname = (f"./Recordings/{config.timestamp}_{config.board_id}"
+             f"{SESSION_EXTENSION}")
+    board = config.board_master or config.board_id
+    metadata = {"config": str(config)}
+    if config.dry_run:
+        from dry_run import SyntheticBoard
 
-    streamer_params = f"file://{fname}:w"
-    board_shim.add_streamer(streamer_params) #start writing to file
+        if board in SyntheticBoard.SAMPLING_RATES:
+            metadata["sampling_rate"] = SyntheticBoard.SAMPLING_RATES[board]
 
-    time.sleep(0.002)
+    logging.info("Recording session to %s", fname)
+    return SessionWriter.for_board(fname, BoardIds[board].value, metadata)
 
-    board_shim.insert_marker(333) # insert "creating baseline until 1st stimulus_ON, with VHP powered ON" marker
 
-    time.sleep(config.measurements_prestart)
+def condition_name(config, channel, frequency, volume):
+    return (f"{config.timestamp}_{config.board_id}_"
+            f"c{channel}_f{frequency}_v{volume}")
+
+
+def baseline_name(config):
+    return (f"{config.timestamp}_{config.board_id}"
+            "_baseline_with_VHP_powered_OFF_on_persons_head_YES_NO")
+
+
+def progress_path(config):
+    return f"./Recordings/{config.timestamp}_{config.board_id}_progress.json"
 
-    for i in range(config.measurements_number):
-        board_shim.insert_marker(1) # insert stimulus_ON marker
-        com.start_stream()
 
-        time.sleep(config.measurements_duration_on)
+def start_progress(config):
+    """Progress manifest and session recorder of a new sweep"""
+    recorder = open_session_writer(config) if config.session_file else None
+    progress = SweepProgress(progress_path(config), config.timestamp,
+                             config.board_id,
+                             recorder.path if recorder else None)
+    progress.save()
 
-        board_shim.insert_marker(11) # insert stimulus_OFF marker
+    return progress, recorder
+
+
+def resume_progress(config, conditions):
+    """
+    Load the progress manifest of the sweep to resume and continue with its
+    timestamp prefix. Completed conditions whose recording is damaged are
+    recorded again. Partial CSV recordings are set aside as *.csv.partial;
+    partial conditions in the session file are dropped from its index.
+    """
+    path = config.resume
+    if path == 'latest':
+        # Exactly this rig's sweeps: without a rig, none of multi_rig.py
+        rig = f"_{re.escape(config.rig)}" if config.rig else ""
+        own = re.compile(rf"\d{{6}}-\d{{4}}{rig}_{re.escape(config.board_id)}"
+                         r"_progress\.json")
+        manifests = [
+            fname for fname in glob.glob("./Recordings/*_progress.json")
+            if own.fullmatch(os.path.basename(fname))]
+        if not manifests:
+            raise FileNotFoundError("No sweep to resume in ./Recordings")
+        path = max(manifests, key=os.path.getmtime)
+
+    progress = SweepProgress.load(path)
+    if progress.board_id != config.board_id:
+        raise ValueError(f"{path} is a sweep of board {progress.board_id}")
+    config.timestamp = progress.timestamp
+    config.session_file = progress.session_file is not None
+    names = [baseline_name(config)] + [condition_name(config, *condition)
+                                       for condition in conditions]
+
+    recorder = None
+    if config.session_file:
+        try:
+            recorder = SessionWriter.reopen(progress.session_file)
+            for name in recorder.dropped:
+                logging.warning("Dropped partial condition %s", name)
+        except (OSError, ValueError) as e:
+            # All conditions were in the damaged file, record them again
+            logging.warning("Session file %s is damaged (%s), setting it aside",
+                            progress.session_file, e)
+            os.replace(progress.session_file,
+                       f"{progress.session_file}.damaged")
+            recorder = open_session_writer(config)
+            progress.session_file = recorder.path
+            progress.completed = []
+        for name in names:
+            if name in progress and name not in recorder.conditions:
+                logging.warning("%s missing from session file, recording "
+                                "again", name)
+                progress.discard(name)
+            elif name in recorder.conditions and name not in progress:
+                progress.complete(name)
+    else:
+        for name in names:
+            fname = f"./Recordings/{name}.csv"
+            if name in progress and not verify_csv(fname):
+                logging.warning("%s is damaged, recording again", fname)
+                progress.discard(name)
+            if name not in progress and os.path.exists(fname):
+                logging.warning("Setting partial %s aside", fname)
+                os.replace(fname, f"{fname}.partial")
+
+    progress.save()
+    logging.info("Resuming sweep %s, %d of %d conditions already recorded",
+                 config.timestamp, sum(name in progress for name in names[1:]),
+                 len(conditions))
+
+    return progress, recorder
+
+
+class Recording:
+    """
+    Records one condition to its CSV, or into the session file of the
+    acquisition if it has one
+    """
+
+    def __init__(self, board_shim, name, acquisition, **params):
+        self.board_shim = board_shim
+        self.acquisition = acquisition
+        self.recorder = acquisition.recorder
+
+        if self.recorder is not None:
+            acquisition.drain()  # Keep data from before out of the condition
+            self.recorder.begin_condition(name, **params)
+        else:
+            self.streamer_params = f"file://./Recordings/{name}.csv:w"
+            board_shim.add_streamer(self.streamer_params) #start writing to file
+
+    def flush(self):
+        """Move buffered board data into the session file"""
+        if self.recorder is not None:
+            self.acquisition.drain()
+
+    def stop(self):
+        if self.recorder is not None:
+            self.acquisition.drain()
+            self.recorder.end_condition()
+        else:
+            self.board_shim.delete_streamer(self.streamer_params) #stop writing to file
+
+
+EVALUATION_MARGIN_SEC = 0.05  # Judge a cycle this long before its OFF ends
+
+
+def do_measurement(com, board_shim, config, channel, frequency, volume,
+                   scheduler, plan, timing, acquisition, analysis=None,
+                   adaptive=None):
+    """
+    Record one condition, firing its edges at the deadlines in plan. In
+    adaptive mode the condition ends early once adaptive says so.
+
+    Returns the deadline at which the condition ended.
+    """
+    logging.info("Measuring Chan=%i Freq=%i Vol=%i", channel, frequency, volume)
+
+    name = condition_name(config, channel, frequency, volume)
+    recording = Recording(board_shim, name, acquisition, channel=channel,
+                          frequency=frequency, volume=volume)
+    label = f"c{channel}_f{frequency}_v{volume}"
+    acquisition.drain()
+    cursor = acquisition.ring.n_written  # First sample of the condition
+
+    def stim_on():
+        timing.insert_marker(board_shim, 1) # insert stimulus_ON marker
+        com.start_stream()
+
+    def stim_off():
+        timing.insert_marker(board_shim, 11) # insert stimulus_OFF marker
         com.stop_stream()
+        recording.flush()
+
+    # insert "creating baseline until 1st stimulus_ON, with VHP powered ON" marker
+    scheduler.fire(plan["start"], "BASELINE",
+                   lambda: timing.insert_marker(board_shim, 333), label)
+
+    def judge_cycle(deadline):
+        """Add the last cycle to the statistic, True when it is enough"""
+        scheduler.wait_until(deadline - EVALUATION_MARGIN_SEC)
+        acquisition.drain()
+        data, _, _ = acquisition.ring.read(cursor)
+        try:
+            statistic.add(*analysis.cycle_power(data, frequency))
+        except ValueError as e:
+            logging.warning("Adaptive %s: %s", label, e)
+        return adaptive.done(statistic)
+
+    statistic = adaptive.new_condition() if adaptive is not None else None
+    end = plan["end"]
+    for deadline, kind, cycle in plan["edges"]:
+        if statistic is not None and kind == "ON" and cycle > 0:
+            if judge_cycle(deadline):
+                end = deadline
+                break
+        scheduler.fire(deadline, kind, stim_on if kind == "ON" else stim_off,
+                       f"{label} #{cycle}")
+    else:
+        if statistic is not None:
+            judge_cycle(end)
 
-        time.sleep(config.measurements_duration_off)
+    scheduler.wait_until(end)
+    recording.stop()
 
-    board_shim.delete_streamer(streamer_params) #stop writing to file
+    if statistic is not None:
+        adaptive.finish(label, channel, frequency, volume, statistic)
+
+    if config.live and analysis is not None:
+        acquisition.drain()
+        data, _, lost = acquisition.ring.read(cursor)
+        if lost:
+            logging.warning("Live %s: first %d samples no longer in the ring",
+                            label, lost)
+        analysis.submit(label, data, frequency)
+
+    return end
 
 def write_metadata(args, config, fname1):
     fname = (f"./Recordings/{config.timestamp}_metadata.txt")
@@ -238,109 +383,244 @@ def write_metadata(args, config, fname1):
         f.write(f"EEG measurements baseline with VHP powered OFF {fname1} \n")
                  
 
-def is_vhp_connected(port, baudrate=115200, timeout=1):
+def is_vhp_connected(port, baudrate=115200, timeout=1, sleep=time.sleep):
+    import serial
+
     try:
         with serial.Serial(port, baudrate=baudrate, timeout=timeout) as ser:
-            time.sleep(1)  # wait for possible board reset
+            sleep(1)  # wait for possible board reset
             return True
     except (serial.SerialException, OSError):
         return False
-    
-# Function to keep BLE link alive
-def keep_ble_alive(board_shim, interval=1):
-    while True:
-        try:
-            board_shim.get_board_data()
-            time.sleep(interval)
-        except Exception as e:
-            logging.warning(f"BLE keepalive thread error: {e}")
-            break
 
-def main():
-    fname1 = "no power OFF VHP CYCLE"
-    args, config = parse_cmdline()
 
-    BoardShim.enable_dev_board_logger()
+def run_sweep(args, config, sleep=time.sleep):
+    """
+    Record the whole sweep of config. sleep may be replaced, e.g. by one that
+    raises to stop the sweep from another thread; the sweep then stops as
+    after Ctrl+C and can be resumed.
 
-    logging.basicConfig(
-        format="[%(asctime)s] [%(name)s] [%(levelname)s] %(message)s",
-        level=config.verbose*10)  # doesn't work?
-    logging.info("Config loaded: %s", config)
+    Returns a dict with the number of recorded and skipped conditions, the
+    acquired samples, the board overruns, the lateness per edge kind and the
+    error that stopped the sweep, if any.
+    """
+    # BrainFlow, and SciPy for live/adaptive mode, are imported only now, so
+    # --help and errors in the configuration show up without delay
+    from brainflow.board_shim import BoardIds
 
-    # Connect to board
-    board_shim = setup_brainflow_board(config)
+    fname1 = "no power OFF VHP CYCLE"
+    stats = {"conditions": 0, "skipped": 0, "samples": 0, "sfreq": None,
+             "board_overruns": 0, "jitter": {}, "error": None}
+
+    conditions = [(chan, freq, vol)
+                  for chan in range(config.channel_start,
+                                    config.channel_end + 1,
+                                    config.channel_steps)
+                  for freq in range(config.frequency_start,
+                                    config.frequency_end + 1,
+                                    config.frequency_steps)
+                  for vol in range(config.volume_start,
+                                   config.volume_end + 1,
+                                   config.volume_steps)]
+
+    if config.resume:
+        progress, recorder = resume_progress(config, conditions)
+    else:
+        progress, recorder = start_progress(config)
+
+    clock = time.perf_counter
+    if config.dry_run:
+        from dry_run import FakeVHP, SyntheticBoard, VirtualClock, log_dry_run
+
+        dry_run_started = time.perf_counter()
+        virtual_clock = VirtualClock()
+        clock, sleep = virtual_clock.now, virtual_clock.sleep
+        vhp = FakeVHP()
+        config.serial_port = vhp.port
+        board_shim = SyntheticBoard(
+            BoardIds[config.board_master or config.board_id].value,
+            virtual_clock, vhp, config.live_channels)
+        logging.info("Dry run, simulated VHP on %s", vhp.port)
+    else:
+        # Connect to board
+        board_shim = setup_brainflow_board(config)
     # Prepare session before streaming
     board_shim.prepare_session()
-    board_shim.start_stream()    # start eeg stream  
-
-    if config.keep_ble_alive:
-        logging.info("Starting BLE keep-alive thread...")
-        from threading import Thread
-        Thread(target=keep_ble_alive, args=(board_shim,), daemon=True).start()
+    board_shim.start_stream(Acquisition.BOARD_BUFFER)    # start eeg stream  
 
-    try:
-        if not is_vhp_connected(config.serial_port):
+    timing = TimingLog(f"./Recordings/{config.timestamp}_{config.board_id}"
+                       f"{TIMING_SUFFIX}", append=config.resume is not None)
 
-            # Create unique file for EEG measurements baseline with VHP powered OFF
-            fname1 = f"./Recordings/{config.timestamp}_{config.board_id}_baseline_with_VHP_powered_OFF_on_persons_head_YES_NO.csv"
-            streamer_params = f"file://{fname1}:w"
+    analysis = None
+    adaptive = None
+    ring_seconds = config.ring_seconds
+    if config.live or config.adaptive:
+        from adaptive import AdaptiveSweep
+        from live_analysis import LiveAnalysis
 
-            board_shim.add_streamer(streamer_params) #start writing to file
+        try:
+            board_id = board_shim.get_board_id()
+            analysis = LiveAnalysis.for_board(
+                board_id, config.live_channels,
+                board_shim.get_sampling_rate(board_id))
+        except ValueError as e:
+            logging.warning("Live analysis and adaptive mode disabled: %s", e)
+        if config.adaptive and analysis is not None:
+            params = config.adaptive_params
+            adaptive = AdaptiveSweep(
+                params.get('Min_cycles', 3),
+                params.get('Max_cycles', config.measurements_number),
+                params.get('Confidence', 0.95),
+                params.get('Null_db', 1.0),
+                params.get('Saturation_db'))
+        # The ring must hold a whole condition
+        cycles = adaptive.max_cycles if adaptive else config.measurements_number
+        ring_seconds = max(ring_seconds, config.measurements_setup
+                           + config.measurements_prestart
+                           + cycles * (config.measurements_duration_on
+                                       + config.measurements_duration_off) + 5)
+
+    # Drains the board continuously, which also keeps a BLE link alive
+    acquisition = Acquisition(board_shim, recorder, config.drain_interval,
+                              ring_seconds)
+    acquisition.start()
 
-            time.sleep(0.003)
-            board_shim.insert_marker(3) # insert VHP_OFF marker
+    try:
+        if not is_vhp_connected(config.serial_port, sleep=sleep):
 
-            while not is_vhp_connected(config.serial_port):
-                print("While waiting for VHP board, EEG _baseline_with_VHP_powered_OFF_on_persons_head_YES_NO.csv is being recorded...")
+            # Create unique file for EEG measurements baseline with VHP powered OFF
+            name = baseline_name(config)
+            fname1 = recorder.path if recorder else f"./Recordings/{name}.csv"
+            recording = None
+            if name not in progress:  # Not recorded before resuming
+                recording = Recording(board_shim, name, acquisition)
+
+                sleep(0.003)
+                timing.insert_marker(board_shim, 3) # insert VHP_OFF marker
+
+            while not is_vhp_connected(config.serial_port, sleep=sleep):
+                if recording is not None:
+                    print("While waiting for VHP board, EEG _baseline_with_VHP_powered_OFF_on_persons_head_YES_NO.csv is being recorded...")
+                    recording.flush()
                 print("Switch VHP board ON after few seconds.")
-                time.sleep(2)
+                sleep(2)
 
             print("VHP board is powered ON / connected.")
-            board_shim.insert_marker(33) # insert VHP_ON marker
-            time.sleep(config.measurements_prestart)
-            board_shim.delete_streamer(streamer_params) # stop writing to file
-
-        vhpcom = SerialCommunicator(config.serial_port)
-
-        vhpcom.set_duration(8000)
-        vhpcom.set_cycle_period(64000)
-        vhpcom.set_pause_cycle_period(1)
-        vhpcom.set_paused_cycles(0)
-        vhpcom.set_jitter(0)
-        vhpcom.set_test_mode(1)
+            if recording is not None:
+                timing.insert_marker(board_shim, 33) # insert VHP_ON marker
+                sleep(config.measurements_prestart)
+                recording.stop()
+                progress.complete(name)
+
+        vhpcom = SerialCommunicator(config.serial_port,
+                                    config.serial_reply_timeout, timing, sleep)
+
+        with vhpcom.pipeline():
+            vhpcom.set_duration(8000)
+            vhpcom.set_cycle_period(64000)
+            vhpcom.set_pause_cycle_period(1)
+            vhpcom.set_paused_cycles(0)
+            vhpcom.set_jitter(0)
+            vhpcom.set_test_mode(1)
    
-        for chan in range(config.channel_start, config.channel_end + 1,
-                          config.channel_steps):
-            for freq in range(config.frequency_start, config.frequency_end + 1,
-                              config.frequency_steps):
-                for vol in range(config.volume_start, config.volume_end+1,
-                                 config.volume_steps):
-
-
-
-                    vhpcom.set_channel(chan)
-                    vhpcom.set_volume(vol)
-                    vhpcom.set_frequency(freq)
-
-                    do_measurement(vhpcom, board_shim, config,
-                                   chan, freq, vol)
-
+        conditions = [(chan, freq, vol) for chan, freq, vol in conditions
+                      if condition_name(config, chan, freq, vol) not in progress]
+
+        # Absolute deadlines for every edge of the whole sweep. In adaptive
+        # mode a condition may end early, so each is planned when it starts.
+        scheduler = DeadlineScheduler(clock, sleep,
+                                      0 if config.dry_run else
+                                      DeadlineScheduler.SPIN_SEC)
+        plans = scheduler.plan(len(conditions), config.measurements_setup,
+                               config.measurements_prestart,
+                               config.measurements_duration_on,
+                               config.measurements_duration_off,
+                               config.measurements_number)
+        end = None
+        skipped = 0
+        stats["jitter"] = scheduler.jitter
+
+        for (chan, freq, vol), plan in zip(conditions, plans):
+            if adaptive is not None:
+                if adaptive.saturated(chan, freq):
+                    skipped += 1
+                    continue
+                plan = scheduler.plan(1, config.measurements_setup,
+                                      config.measurements_prestart,
+                                      config.measurements_duration_on,
+                                      config.measurements_duration_off,
+                                      adaptive.max_cycles, t0=end)[0]
+            scheduler.wait_until(plan["setup"])
+
+            with vhpcom.pipeline():
+                vhpcom.set_channel(chan)
+                vhpcom.set_volume(vol)
+                vhpcom.set_frequency(freq)
+
+            end = do_measurement(vhpcom, board_shim, config, chan, freq, vol,
+                                 scheduler, plan, timing, acquisition,
+                                 analysis, adaptive)
+            progress.complete(condition_name(config, chan, freq, vol))
+            stats["conditions"] += 1
+
+        stats["skipped"] = skipped
+        scheduler.log_summary()
+
+        acquisition.stop()
+        acquisition.log_summary()
+        if analysis is not None:
+            analysis.close()
+        if adaptive is not None:
+            adaptive.log_summary(skipped)
         board_shim.stop_stream()
         board_shim.release_session()
         print("Stream stopped and session released.")
+
+        vhpcom.log_latency_summary()
+        if config.dry_run:
+            log_dry_run(virtual_clock, vhp, dry_run_started)
+
+        if recorder is not None:
+            recorder.close()
         
         write_metadata(args, config, fname1)
 
     except BaseException as e:
         logging.warning('Exception', exc_info=True)
+        stats["error"] = f"{type(e).__name__}: {e}"
         print(f"Error: {e}")
+        print(f"Continue the sweep with --resume {progress.path}")
+        acquisition.stop()
         if board_shim.is_prepared():
             board_shim.stop_stream()
             board_shim.release_session()
     finally:
+        acquisition.stop()
+        stats["samples"] = acquisition.ring.n_written
+        stats["sfreq"] = acquisition.sampling_rate
+        stats["board_overruns"] = acquisition.board_overruns
         if board_shim.is_prepared():
             logging.info('Releasing session')
             board_shim.release_session()
+        if recorder is not None:
+            recorder.close()
+        timing.close()
+
+    return stats
+
+
+def main():
+    args, config = parse_cmdline()
+
+    from brainflow.board_shim import BoardShim
+    BoardShim.enable_dev_board_logger()
+
+    logging.basicConfig(
+        format="[%(asctime)s] [%(name)s] [%(levelname)s] %(message)s",
+        level=config.verbose*10)  # doesn't work?
+    logging.info("Config loaded: %s", config)
+
+    run_sweep(args, config)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,89 @@
+"""Progress manifest of a sweep, so an interrupted sweep can be resumed"""
+
+import json
+import os
+
+
+class SweepProgress:
+    """
+    Names of the completely recorded conditions of a sweep, together with
+    the timestamp prefix of its files and its session file, if any.
+
+    The manifest is rewritten atomically after every completed condition, so
+    it never lists a condition whose recording was not finished.
+    """
+
+    def __init__(self, path, timestamp, board_id, session_file=None, completed=()):
+        self.path = path
+        self.timestamp = timestamp
+        self.board_id = board_id
+        self.session_file = session_file
+        self.completed = list(completed)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            manifest = json.load(f)
+        return cls(
+            path,
+            manifest["timestamp"],
+            manifest["board_id"],
+            manifest.get("session_file"),
+            manifest["completed"],
+        )
+
+    def __contains__(self, name):
+        return name in self.completed
+
+    def save(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(
+                {
+                    "timestamp": self.timestamp,
+                    "board_id": self.board_id,
+                    "session_file": self.session_file,
+                    "completed": self.completed,
+                },
+                f,
+                indent=2,
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def complete(self, name):
+        """Record that condition name was completely recorded."""
+        if name not in self.completed:
+            self.completed.append(name)
+        self.save()
+
+    def discard(self, name):
+        """Forget condition name, e.g. because its recording is damaged."""
+        if name in self.completed:
+            self.completed.remove(name)
+            self.save()
+
+
+def verify_csv(path):
+    """
+    Check that a BrainFlow CSV recording is intact: it exists, is not empty,
+    and every line has the same number of tab-separated fields.
+    """
+    try:
+        with open(path, "r") as f:
+            n_fields = None
+            for line in f:
+                fields = line.rstrip("\n").split("\t")
+                if n_fields is None:
+                    n_fields = len(fields)
+                if not line.endswith("\n") or len(fields) != n_fields:
+                    return False
+                try:
+                    float(fields[-1])
+                except ValueError:
+                    return False
+    except OSError:
+        return False
+
+    return n_fields is not None
@@ -0,0 +1,215 @@
+"""ON/OFF band power of all conditions of a sweep in one table"""
+
+import logging
+import re
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from scipy.signal import welch
+
+CONDITION = re.compile(r"_c(\d+)_f(\d+)_v(\d+)$")
+EVENT_ID = {"ON": 1, "OFF": 11}
+HARMONICS = 3  # Stimulation frequency and its first harmonics
+HALF_BANDWIDTH_HZ = 1.0
+
+
+def parse_condition(name):
+    """
+    Channel, frequency and volume of a recording named ``..._c{ch}_f{freq}_v{vol}``.
+
+    Returns
+    -------
+    dict or None
+        ``{"channel", "frequency", "volume"}``, None if name is not a condition
+        (e.g. the baseline).
+    """
+    match = CONDITION.search(name)
+    if match is None:
+        return None
+    channel, frequency, volume = (int(g) for g in match.groups())
+    return {"channel": channel, "frequency": frequency, "volume": volume}
+
+
+def band_power(epochs, sfreq, frequencies, harmonics=HARMONICS):
+    """
+    Power around every harmonic of the stimulation frequency, for a batch of
+    epochs in one vectorized Welch.
+
+    Parameters
+    ----------
+    epochs : ndarray, shape (n_epochs, n_channels, n_samples)
+    sfreq : float
+    frequencies : ndarray, shape (n_epochs,)
+        Stimulation frequency of each epoch.
+
+    Returns
+    -------
+    ndarray, shape (n_epochs, n_channels, harmonics)
+        Power within HALF_BANDWIDTH_HZ of k * frequency, for k = 1..harmonics;
+        NaN above the Nyquist frequency.
+    """
+    nperseg = min(int(sfreq), epochs.shape[-1])
+    freqs, psd = welch(
+        epochs, sfreq, nperseg=nperseg, nfft=max(nperseg, int(sfreq)), axis=-1
+    )
+
+    targets = np.asarray(frequencies, dtype=float)[:, None] * np.arange(
+        1, harmonics + 1
+    )  # (n_epochs, harmonics)
+    band = np.abs(freqs - targets[..., None]) <= HALF_BANDWIDTH_HZ
+    power = np.einsum("ecf,ekf->eck", psd, band.astype(float)) * (freqs[1] - freqs[0])
+    power[np.broadcast_to(targets[:, None, :] > freqs[-1], power.shape)] = np.nan
+
+    return power
+
+
+def summarize(recordings):
+    """
+    Tidy table of the ON and OFF band power of every condition.
+
+    Parameters
+    ----------
+    recordings : list of dict
+        Per recording: ``name``, ``channel``, ``frequency``, ``volume``,
+        ``sfreq``, ``ch_names`` and its ON/OFF ``epochs`` and ``labels``.
+
+    Returns
+    -------
+    DataFrame
+        One row per recording, EEG channel and harmonic, with the mean ``on``
+        and ``off`` power, ``on_off_db`` and the epoch counts.
+    """
+    # Epochs of equal sampling rate and length are analysed in one batch
+    batches = {}
+    for i, rec in enumerate(recordings):
+        key = (rec["sfreq"], rec["epochs"].shape[-1])
+        batches.setdefault(key, []).append(i)
+
+    rows = []
+    for (sfreq, _), members in batches.items():
+        epochs = np.concatenate([recordings[i]["epochs"] for i in members])
+        frequencies = np.concatenate(
+            [
+                np.full(len(recordings[i]["labels"]), recordings[i]["frequency"])
+                for i in members
+            ]
+        )
+        power = band_power(epochs, sfreq, frequencies)
+
+        start = 0
+        for i in members:
+            rec = recordings[i]
+            stop = start + len(rec["labels"])
+            rows.extend(_condition_rows(rec, power[start:stop]))
+            start = stop
+
+    columns = [
+        "name",
+        "channel",
+        "frequency",
+        "volume",
+        "eeg_channel",
+        "harmonic",
+        "band_hz",
+        "on",
+        "off",
+        "on_off_db",
+        "n_on",
+        "n_off",
+    ]
+    table = pd.DataFrame(rows, columns=columns)
+    return table.sort_values(
+        ["channel", "frequency", "volume"],
+        kind="stable",
+        ignore_index=True,
+    )
+
+
+def _condition_rows(rec, power):
+    is_on = rec["labels"] == EVENT_ID["ON"]
+    is_off = rec["labels"] == EVENT_ID["OFF"]
+    on = power[is_on].mean(axis=0) if is_on.any() else np.full(power.shape[1:], np.nan)
+    off = (
+        power[is_off].mean(axis=0) if is_off.any() else np.full(power.shape[1:], np.nan)
+    )
+
+    for c, eeg_channel in enumerate(rec["ch_names"]):
+        for k in range(power.shape[-1]):
+            yield {
+                "name": rec["name"],
+                "channel": rec["channel"],
+                "frequency": rec["frequency"],
+                "volume": rec["volume"],
+                "eeg_channel": eeg_channel,
+                "harmonic": k + 1,
+                "band_hz": (k + 1) * rec["frequency"],
+                "on": on[c, k],
+                "off": off[c, k],
+                "on_off_db": 10 * np.log10(on[c, k] / off[c, k]),
+                "n_on": int(is_on.sum()),
+                "n_off": int(is_off.sum()),
+            }
+
+
+def plot_heatmaps(table, out_base, dpi=300):
+    """
+    Per stimulation channel, save a volume-response and a frequency-response
+    heatmap of the ON/OFF ratio at the stimulation frequency per EEG channel,
+    averaged over frequencies and volumes respectively.
+    """
+    fundamental = table[table["harmonic"] == 1]
+    fnames = []
+    for channel, rows in fundamental.groupby("channel"):
+        fig, axes = plt.subplots(nrows=1, ncols=2, figsize=(14, 6))
+        for ax, (across, mean_over) in zip(
+            axes, [("volume", "frequencies"), ("frequency", "volumes")]
+        ):
+            grid = rows.pivot_table(
+                index="eeg_channel", columns=across, values="on_off_db"
+            ).reindex(rows["eeg_channel"].unique())
+            limit = np.nanmax(np.abs(grid.to_numpy())) if grid.size else 1.0
+            image = ax.imshow(
+                grid.to_numpy(),
+                aspect="auto",
+                cmap="RdBu_r",
+                vmin=-limit,
+                vmax=limit,
+            )
+            ax.set_xticks(range(grid.shape[1]), [str(v) for v in grid.columns])
+            ax.set_yticks(range(grid.shape[0]), grid.index)
+            ax.set_xlabel(across.capitalize())
+            ax.set_title(
+                f"Channel {channel}: {across} response (mean over {mean_over})"
+            )
+            fig.colorbar(image, ax=ax, label="ON/OFF at stimulation frequency (dB)")
+
+        fname = f"{out_base}_c{channel}.png"
+        fig.tight_layout()
+        fig.savefig(fname, dpi=dpi)
+        plt.close(fig)
+        fnames.append(fname)
+
+    return fnames
+
+
+def write_summary(recordings, out_base):
+    """Write the summary table (CSV, and Parquet if possible) and heatmaps."""
+    if not recordings:
+        logging.warning("No sweep conditions with ON/OFF epochs to summarize")
+        return None
+
+    table = summarize(recordings)
+    table.to_csv(out_base + ".csv", index=False)
+    logging.info(
+        "Sweep summary of %d condition(s) written to %s.csv", len(recordings), out_base
+    )
+    try:
+        table.to_parquet(out_base + ".parquet", index=False)
+    except ImportError:
+        logging.debug("No Parquet engine installed, only CSV written")
+
+    for fname in plot_heatmaps(table, out_base):
+        logging.info("Heatmaps written to %s", fname)
+
+    return table
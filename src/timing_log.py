@@ -0,0 +1,51 @@
+"""High-resolution log of marker insertions and VHP serial traffic"""
+
+import csv
+import os
+import threading
+import time
+
+SUFFIX = "_timing.csv"
+
+
+class TimingLog:
+    """
+    Appends timestamped events to a per-session CSV file.
+
+    Every row holds the ``time.perf_counter_ns()`` of the event, its kind
+    (``marker``, ``serial_write``, ``serial_reply`` or ``serial_timeout``), a
+    key (marker value or command type) and free text. The first row anchors
+    the performance counter to wall-clock time, so events can be related to
+    the BrainFlow timestamps of the recording. A resumed sweep appends to
+    its log, starting with a new anchor row.
+    """
+
+    FIELDS = ["perf_ns", "event", "key", "info"]
+
+    def __init__(self, path, append=False):
+        self.path = path
+        self._lock = threading.Lock()
+        new = not (append and os.path.exists(path))
+        self._file = open(path, "w" if new else "a", newline="", buffering=1)
+        self._writer = csv.writer(self._file)
+        if new:
+            self._writer.writerow(self.FIELDS)
+        self.record("anchor", "unix_time", f"{time.time():.6f}")
+
+    def record(self, event, key, info="", t_ns=None):
+        """Write one event, timestamped now unless t_ns is given."""
+        if t_ns is None:
+            t_ns = time.perf_counter_ns()
+        with self._lock:
+            if not self._file.closed:
+                self._writer.writerow([t_ns, event, key, info])
+
+    def insert_marker(self, board_shim, value):
+        """Insert a marker into the board stream and log when it happened."""
+        t_ns = time.perf_counter_ns()
+        board_shim.insert_marker(value)
+        self.record("marker", value, t_ns=t_ns)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,235 @@
+"""Latency report of the timing logs written by the sweep scripts"""
+
+import argparse
+import logging
+import sys
+from collections import defaultdict, deque
+
+import numpy as np
+import pandas as pd
+
+STIMULUS_MARKERS = {1: "ON", 11: "OFF"}
+
+
+def read_timing_log(path):
+    """
+    Read a timing log, returning the events of each run of the sweep (a
+    resumed sweep appends a run, starting with an anchor row) sorted by time.
+    """
+    log = pd.read_csv(path, dtype={"key": str, "info": str}, keep_default_na=False)
+    run = (log["event"] == "anchor").cumsum()
+    return [
+        events.sort_values("perf_ns", kind="stable").reset_index(drop=True)
+        for _, events in log.groupby(run)
+    ]
+
+
+def command_latencies(log):
+    """
+    Pair every serial write with its reply or timeout.
+
+    Replies of one command type arrive in the order the commands were
+    written, so writes and replies are matched first in, first out.
+
+    Returns
+    -------
+    list of dict
+        Per write: ``key``, ``command``, ``write_ns``, and ``reply_ns`` (None
+        on a timeout).
+    """
+    pending = defaultdict(deque)
+    commands = []
+    for row in log.itertuples(index=False):
+        if row.event == "serial_write":
+            command = {
+                "key": row.key,
+                "command": row.info,
+                "write_ns": row.perf_ns,
+                "reply_ns": None,
+            }
+            pending[row.key].append(command)
+            commands.append(command)
+        elif row.event in ("serial_reply", "serial_timeout") and pending[row.key]:
+            command = pending[row.key].popleft()
+            if row.event == "serial_reply":
+                command["reply_ns"] = row.perf_ns
+
+    return commands
+
+
+def marker_latencies(log, commands, window=1.0):
+    """
+    Delay from each marker to the first serial write that follows it within
+    ``window`` seconds, and to the reply of that write. Markers not followed
+    by a write before the next marker (e.g. the baseline marker) are skipped.
+
+    Returns
+    -------
+    list of dict
+        Per marker: ``marker``, ``command``, ``to_write`` and ``to_reply`` in
+        seconds (``to_reply`` is NaN on a timeout).
+    """
+    write_ns = np.array([c["write_ns"] for c in commands], dtype=np.int64)
+    markers = log[log["event"] == "marker"]
+    next_ns = np.append(markers["perf_ns"].to_numpy()[1:], np.iinfo(np.int64).max)
+    latencies = []
+    for row, next_marker_ns in zip(markers.itertuples(index=False), next_ns):
+        i = np.searchsorted(write_ns, row.perf_ns)
+        if (
+            i == len(write_ns)
+            or write_ns[i] >= next_marker_ns
+            or write_ns[i] - row.perf_ns > window * 1e9
+        ):
+            continue
+        command = commands[i]
+        to_reply = np.nan
+        if command["reply_ns"] is not None:
+            to_reply = (command["reply_ns"] - row.perf_ns) / 1e9
+        latencies.append(
+            {
+                "marker": row.key,
+                "command": command["command"],
+                "to_write": (command["write_ns"] - row.perf_ns) / 1e9,
+                "to_reply": to_reply,
+            }
+        )
+
+    return latencies
+
+
+def describe(values):
+    """n, mean, p50, p99 and max in milliseconds of the finite values."""
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)] * 1000
+    if values.size == 0:
+        return [0, np.nan, np.nan, np.nan, np.nan]
+    return [
+        values.size,
+        values.mean(),
+        np.percentile(values, 50),
+        np.percentile(values, 99),
+        values.max(),
+    ]
+
+
+def summarize(log, window=1.0):
+    """Table of latency distributions per command type and marker."""
+    commands = command_latencies(log)
+    rows = []
+
+    by_key = defaultdict(list)
+    for c in commands:
+        rtt = np.nan if c["reply_ns"] is None else (c["reply_ns"] - c["write_ns"]) / 1e9
+        by_key[c["key"]].append(rtt)
+    for key in sorted(by_key):
+        rtt = by_key[key]
+        rows.append(["round_trip", key, int(np.isnan(rtt).sum())] + describe(rtt))
+
+    by_marker = defaultdict(list)
+    for m in marker_latencies(log, commands, window):
+        by_marker[m["marker"]].append(m)
+    for marker in sorted(by_marker, key=float):
+        latencies = by_marker[marker]
+        timeouts = int(sum(np.isnan(m["to_reply"]) for m in latencies))
+        name = STIMULUS_MARKERS.get(int(float(marker)), marker)
+        rows.append(
+            ["marker_to_write", name, 0] + describe([m["to_write"] for m in latencies])
+        )
+        rows.append(
+            ["marker_to_reply", name, timeouts]
+            + describe([m["to_reply"] for m in latencies])
+        )
+
+    return pd.DataFrame(
+        rows,
+        columns=[
+            "metric",
+            "key",
+            "timeouts",
+            "n",
+            "mean_ms",
+            "p50_ms",
+            "p99_ms",
+            "max_ms",
+        ],
+    )
+
+
+def _concat(logs, window):
+    """
+    Concatenate logs of several sweep runs. Their perf_counter values are not
+    comparable, so each log is shifted past the previous one, leaving more
+    than the pairing window between them.
+    """
+    offset = 0
+    shifted = []
+    for log in logs:
+        log = log.copy()
+        log["perf_ns"] += offset - log["perf_ns"].min()
+        offset = log["perf_ns"].max() + int((window + 1) * 1e9)
+        shifted.append(log)
+
+    return pd.concat(shifted, ignore_index=True)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Summarize marker and VHP serial latencies of timing logs."
+    )
+    parser.add_argument(
+        "timing_logs", nargs="+", help="Timing log(s) (*_timing.csv) of a sweep"
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        help="Also write the summary table to this CSV file",
+    )
+    parser.add_argument(
+        "-w",
+        "--window",
+        type=float,
+        default=1.0,
+        help="Max seconds between a marker and its serial write (default: 1.0)",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbosity",
+        type=str,
+        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+        default="INFO",
+        help="Logging verbosity level (default: INFO).",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(
+        level=getattr(logging, args.verbosity),
+        format="[%(asctime)s] %(levelname)s: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+
+    logs = []
+    for path in args.timing_logs:
+        try:
+            logs.extend(read_timing_log(path))
+        except (OSError, ValueError, KeyError) as exc:
+            logging.error("Cannot read %s: %s", path, exc)
+    if not logs:
+        sys.exit(1)
+
+    summary = summarize(_concat(logs, args.window), args.window)
+    with pd.option_context(
+        "display.width", 120, "display.float_format", "{:.3f}".format
+    ):
+        print(summary.to_string(index=False))
+
+    if args.output:
+        summary.to_csv(args.output, index=False)
+        logging.info("Summary written to %s", args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,9 +4,10 @@ import argparse
 import logging
 import time
 from datetime import datetime
-import serial
 import yaml
-from brainflow.board_shim import BoardShim, BrainFlowInputParams, BoardIds
+from session_file import SessionWriter, EXTENSION as SESSION_EXTENSION
+from timing_log import TimingLog, SUFFIX as TIMING_SUFFIX
+from vhp_serial import SerialCommunicator
 
 
 class Config:
@@ -18,7 +19,8 @@ class Config:
                  board_id, board_master, board_mac, board_file,
                  board_serial,
                  serial_port,
-                 verbose):
+                 verbose, session_file=False,
+                 serial_reply_timeout=SerialCommunicator.REPLY_TIMEOUT_SEC):
         self.volume_start = volume_start
         self.volume_end = volume_end
         self.volume_steps = volume_steps
@@ -33,7 +35,9 @@ class Config:
         self.board_file = board_file
         self.board_serial = board_serial
         self.serial_port = serial_port
+        self.serial_reply_timeout = serial_reply_timeout
         self.verbose = verbose
+        self.session_file = session_file
         self.timestamp = datetime.now().strftime("%y%m%d-%H%M")
 
     def __str__(self):
@@ -47,57 +51,6 @@ class Config:
                 f"Mac = {self.board_mac}, Serial = {self.board_serial}")
 
 
-class SerialCommunicator:
-    """Handles serial communication with VHP device"""
-
-    BAUDRATE = 115200
-    TIMEOUT_SEC = 1
-
-    def __init__(self, port):
-        self.port = port
-        self.ser = serial.Serial(
-            port=self.port,
-            baudrate=self.BAUDRATE,
-            timeout=self.TIMEOUT_SEC
-        )
-        if not self.ser.is_open:
-            self.ser.open()
-
-        # Wait a bit for Arduino reset
-        time.sleep(2)
-
-    def __del__(self):
-        if hasattr(self, 'ser'):
-            if self.ser.is_open:
-                self.ser.close()
-                logging.info("Serial closed")
-
-    def _send_command(self, command):
-        self.ser.write((command + '\n').encode('utf-8'))
-        logging.debug("Serial VHP Sent: %s", command)
-
-        # Wait a little to receive Arduino reply
-        time.sleep(0.05)
-
-        # Read and print all available replies
-        while self.ser.in_waiting > 0:
-            response = self.ser.readline().decode('utf-8', errors='ignore').strip()
-            logging.debug("Serial VHP Received: %s", response)
-
-    def set_volume(self, volume):
-        volume = max(0, min(100, volume))
-        self._send_command(f'V{volume}')
-
-    def set_frequency(self, frequency):
-        self._send_command(f'F{frequency}')
-
-    def start_stream(self):
-        self._send_command('1')
-
-    def stop_stream(self):
-        self._send_command('0')
-
-
 def parse_yaml_file(file_path):
     with open(file_path, 'r') as file:
         return yaml.safe_load(file)
@@ -112,6 +65,9 @@ def parse_cmdline():
                         "configuration file")
     parser.add_argument('-v', '--verbose', action='count', default=0,
                         help="verbose level, up until 5 allowed")
+    parser.add_argument('-s', '--session-file', action='store_true',
+                        help="Record all measurements into one binary session "
+                        "file instead of a CSV per measurement")
     args = parser.parse_args()
 
     # Parse the specified YAML file
@@ -135,13 +91,17 @@ def parse_cmdline():
         board_file=device['Board']['File'],
         board_serial=device['Board']['Serial'],
         serial_port=device['VHP']['Serial'],
-        verbose=args.verbose
+        serial_reply_timeout=device['VHP'].get(
+            'Reply_timeout', SerialCommunicator.REPLY_TIMEOUT_SEC),
+        verbose=args.verbose,
+        session_file=args.session_file
     )
 
     return config
 
 
 def setup_brainflow_board(config):
+    from brainflow.board_shim import BoardShim, BrainFlowInputParams, BoardIds
 
     params = BrainFlowInputParams()
 
@@ -165,18 +125,31 @@ def setup_brainflow_board(config):
     return board_shim
 
 
-def do_measurement(com, board_shim, config, frequency, volume):
+def open_session_writer(config):
+    fname = (f"../Recordings/{config.timestamp}_{config.board_id}"
+             f"{SESSION_EXTENSION}")
+    from brainflow.board_shim import BoardIds
+    board_id = BoardIds[config.board_master or config.board_id].value
+
+    logging.info("Recording session to %s", fname)
+    return SessionWriter.for_board(fname, board_id, {"config": str(config)})
+
+
+def do_measurement(com, board_shim, config, frequency, volume, timing,
+                   recorder=None):
     logging.info("Measuring Freq=%i Vol=%i", frequency, volume)
 
-    fname = (f"../Recordings/{config.timestamp}_{config.board_id}_"
-             f"f{frequency}_v{volume}.csv")
+    name = f"{config.timestamp}_{config.board_id}_f{frequency}_v{volume}"
 
-    streamer_params = f"file://{fname}:w"
-    board_shim.add_streamer(streamer_params)
+    if recorder is not None:
+        recorder.begin_condition(name, frequency=frequency, volume=volume)
+    else:
+        streamer_params = f"file://../Recordings/{name}.csv:w"
+        board_shim.add_streamer(streamer_params)
     board_shim.start_stream()
 
     for i in range(config.measurements_number):
-        board_shim.insert_marker(i+1)
+        timing.insert_marker(board_shim, i+1)
 
         com.start_stream()
 
@@ -188,12 +161,18 @@ def do_measurement(com, board_shim, config, frequency, volume):
         time.sleep(config.measurements_duration)
 
     board_shim.stop_stream()
-    board_shim.delete_streamer(streamer_params)
+    if recorder is not None:
+        recorder.drain(board_shim)
+        recorder.end_condition()
+    else:
+        board_shim.delete_streamer(streamer_params)
 
 
 def main():
     config = parse_cmdline()
 
+    # Imported only now, so --help and configuration errors show up at once
+    from brainflow.board_shim import BoardShim
     BoardShim.enable_dev_board_logger()
 
     logging.basicConfig(
@@ -203,21 +182,31 @@ def main():
 
     # Connect to board
     board_shim = setup_brainflow_board(config)
+    recorder = None
+    timing = TimingLog(f"../Recordings/{config.timestamp}_{config.board_id}"
+                       f"{TIMING_SUFFIX}")
     try:
-        vhpcom = SerialCommunicator(config.serial_port)
+        vhpcom = SerialCommunicator(config.serial_port,
+                                    config.serial_reply_timeout, timing)
 
         board_shim.prepare_session()
 
+        if config.session_file:
+            recorder = open_session_writer(config)
+
         for freq in range(config.frequency_start, config.frequency_end + 1,
                           config.frequency_steps):
             for vol in range(config.volume_start, config.volume_end+1,
                              config.volume_steps):
 
-                vhpcom.set_volume(vol)
-                vhpcom.set_frequency(freq)
+                with vhpcom.pipeline():
+                    vhpcom.set_volume(vol)
+                    vhpcom.set_frequency(freq)
 
                 do_measurement(vhpcom, board_shim, config,
-                               freq, vol)
+                               freq, vol, timing, recorder)
+
+        vhpcom.log_latency_summary()
 
     except BaseException:
         logging.warning('Exception', exc_info=True)
@@ -225,6 +214,9 @@ def main():
         if board_shim.is_prepared():
             logging.info('Releasing session')
             board_shim.release_session()
+        if recorder is not None:
+            recorder.close()
+        timing.close()
 
 
 if __name__ == "__main__":
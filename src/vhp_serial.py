@@ -0,0 +1,210 @@
+"""Serial protocol of the F2Heal VHP device"""
+
+import logging
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import serial
+
+
+class SerialCommunicator:
+    """
+    Handles serial communication with VHP device
+
+    Every command is acknowledged by the firmware with a reply line. Instead of
+    sleeping a fixed time after a write, ``_send_command`` waits for that
+    reply, up to ``reply_timeout`` seconds. Inside a ``pipeline()`` block
+    commands are only queued; they are written together when the block ends,
+    after which all replies are awaited at once.
+
+    The round-trip time of every acknowledged command is kept per command
+    type (its first character), see ``latency_summary``. With a ``TimingLog``
+    every write, reply and timeout is also logged with its timestamp.
+
+    A reply that arrives after its timeout must not be taken for the reply
+    to the next command, so after a timeout all input received up to the
+    next write is discarded.
+    """
+
+    BAUDRATE = 115200
+    TIMEOUT_SEC = 1
+    REPLY_TIMEOUT_SEC = 0.5
+    POLL_SEC = 0.01  # Read timeout of the port while waiting for a reply
+
+    def __init__(self, port, reply_timeout=REPLY_TIMEOUT_SEC, timing_log=None,
+                 sleep=time.sleep):
+        self.port = port
+        self.reply_timeout = reply_timeout
+        self.timing_log = timing_log
+        self.latencies = {}
+        self.timeouts = {}
+        self._queue = None
+        self._rx = b""
+        self._missed = False  # A reply timed out, it may still arrive
+
+        self.ser = serial.Serial(
+            port=self.port,
+            baudrate=self.BAUDRATE,
+            timeout=self.TIMEOUT_SEC
+        )
+        if not self.ser.is_open:
+            self.ser.open()
+
+        # Wait a bit for Arduino reset, then drop its boot messages so they
+        # are not taken for replies
+        sleep(2)
+        while self.ser.in_waiting > 0:
+            line = self.ser.readline().decode('utf-8', errors='ignore').strip()
+            logging.debug("Serial VHP Discarded: %s", line)
+
+        # Set once: pyserial reconfigures the port on every timeout change.
+        # readline returns as soon as a line is complete, so this only
+        # bounds how late a missing reply is noticed.
+        self.ser.timeout = self.POLL_SEC
+
+    def __del__(self):
+        if hasattr(self, 'ser'):
+            if self.ser.is_open:
+                self.ser.close()
+                logging.info("Serial closed")
+
+    def _read_line(self, deadline):
+        """Return the next reply line, or None when the deadline passed."""
+        while b'\n' not in self._rx:
+            if time.perf_counter() >= deadline:
+                return None
+            self._rx += self.ser.readline()
+
+        line, self._rx = self._rx.split(b'\n', 1)
+        return line.decode('utf-8', errors='ignore').strip()
+
+    def _discard_late_replies(self):
+        """Drop the input after a timeout, e.g. the late reply it missed."""
+        late = self._rx + self.ser.read(self.ser.in_waiting)
+        self._rx = b""
+        self._missed = False
+        for line in late.decode('utf-8', errors='ignore').splitlines():
+            if line.strip():
+                logging.warning("Serial VHP late reply discarded: %s",
+                                line.strip())
+
+    def _write(self, commands):
+        """Write commands in one go and wait for one reply line each."""
+        if self._missed:
+            self._discard_late_replies()
+        sent_ns = time.perf_counter_ns()
+        self.ser.write(''.join(c + '\n' for c in commands).encode('utf-8'))
+        for command in commands:
+            logging.debug("Serial VHP Sent: %s", command)
+            self._log_timing("serial_write", command, command, sent_ns)
+
+        deadline = sent_ns / 1e9 + self.reply_timeout
+        for command in commands:
+            response = self._read_line(deadline)
+            if response is None:
+                self.timeouts[command[:1]] = self.timeouts.get(command[:1], 0) + 1
+                logging.warning("Serial VHP no reply to %s within %.3f s",
+                                command, self.reply_timeout)
+                self._log_timing("serial_timeout", command, command)
+                self._missed = True
+                continue
+            received_ns = time.perf_counter_ns()
+            rtt = (received_ns - sent_ns) / 1e9
+            self.latencies.setdefault(command[:1], []).append(rtt)
+            logging.debug("Serial VHP Received: %s (%.1f ms)", response,
+                          rtt * 1000)
+            self._log_timing("serial_reply", command, response, received_ns)
+
+        # Log additional lines (e.g. multi-line S/X output) without waiting
+        while self.ser.in_waiting > 0 or b'\n' in self._rx:
+            response = self._read_line(time.perf_counter() + self.reply_timeout)
+            if response is None:
+                break
+            logging.debug("Serial VHP Received: %s", response)
+
+    def _log_timing(self, event, command, info, t_ns=None):
+        if self.timing_log is not None:
+            self.timing_log.record(event, command[:1], info, t_ns)
+
+    def _send_command(self, command):
+        if self._queue is not None:
+            self._queue.append(command)
+        else:
+            self._write([command])
+
+    @contextmanager
+    def pipeline(self):
+        """Queue the commands sent in this block and write them together."""
+        self._queue = []
+        try:
+            yield self
+        finally:
+            commands, self._queue = self._queue, None
+            if commands:
+                self._write(commands)
+
+    def latency_summary(self):
+        """Per command type: (count, timeouts, mean, p50, p99, max) in seconds."""
+        summary = {}
+        for key in sorted(set(self.latencies) | set(self.timeouts)):
+            rtt = np.array(self.latencies.get(key, [np.nan]))
+            summary[key] = (len(self.latencies.get(key, [])),
+                            self.timeouts.get(key, 0),
+                            np.mean(rtt), np.percentile(rtt, 50),
+                            np.percentile(rtt, 99), np.max(rtt))
+        return summary
+
+    def log_latency_summary(self):
+        for key, (n, n_timeout, mean, p50, p99, rtt_max) in \
+                self.latency_summary().items():
+            logging.info("Serial VHP %s: %d replies, %d timeouts, round trip "
+                         "mean %.1f p50 %.1f p99 %.1f max %.1f ms", key, n,
+                         n_timeout, mean * 1000, p50 * 1000, p99 * 1000,
+                         rtt_max * 1000)
+
+    def set_duration(self, duration):
+        duration = max(1, min(65535, duration))
+        self._send_command(f'D{duration}')
+
+    def set_cycle_period(self, cycle_period):
+        cycle_period = max(1, min(65535, cycle_period))
+        self._send_command(f'Y{cycle_period}')
+
+    def set_pause_cycle_period(self, pause_cycle_period):
+        pause_cycle_period = max(0, min(100, pause_cycle_period))
+        self._send_command(f'P{pause_cycle_period}')
+
+    def set_paused_cycles(self, paused_cycles):
+        paused_cycles = max(0, min(100, paused_cycles))
+        self._send_command(f'Q{paused_cycles}')
+
+    def set_jitter(self, jitter):
+        jitter = max(0, min(1000, jitter))
+        self._send_command(f'J{jitter}')
+
+    def set_test_mode(self, enabled):
+        self._send_command(f'M{1 if enabled else 0}')
+
+    def set_channel(self, channel):
+        channel = max(0, min(8, channel))
+        self._send_command(f'C{channel}')
+
+    def set_volume(self, volume):
+        volume = max(0, min(100, volume))
+        self._send_command(f'V{volume}')
+
+    def set_frequency(self, frequency):
+        self._send_command(f'F{frequency}')
+
+    def start_stream(self):
+        self._send_command('1')
+
+    def stop_stream(self):
+        self._send_command('0')
+
+    def get_fw(self):
+        self._send_command('S')
+
+    def get_par(self):
+        self._send_command('X')
@@ -0,0 +1,38 @@
+"""The scripts in src/ import each other as top-level modules"""
+
+import os
+import sys
+from types import SimpleNamespace
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SRC)
+
+from measure_report import PLOTS  # noqa: E402
+from signal_quality import MAX_FLAT_S, MAX_SATURATION  # noqa: E402
+
+
+def make_cfg(output_dir, **options):
+    """measure_report options with their defaults, as process_file gets them."""
+    os.makedirs(output_dir, exist_ok=True)
+    cfg = SimpleNamespace(
+        mentalab=False,
+        resample=False,
+        output_dir=os.path.join(str(output_dir), ""),
+        cache=False,
+        cache_dir=None,
+        stream=False,
+        chunk_size=65536,
+        summary=False,
+        plots=PLOTS,
+        max_saturation=MAX_SATURATION,
+        max_flat=MAX_FLAT_S,
+        max_line_noise=None,
+        max_bad_channels=None,
+        exclude_bad=False,
+    )
+    cfg.__dict__.update(options)
+    return cfg
@@ -0,0 +1,76 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+from session_file import SessionReader, SessionWriter
+
+N_ROWS, TIMESTAMP_ROW, MARKER_ROW = 12, 10, 11
+
+
+def board_data(n_samples, seed):
+    data = np.random.default_rng(seed).normal(size=(N_ROWS, n_samples))
+    data[TIMESTAMP_ROW] = 1.7e9 + np.arange(n_samples) / 1000
+    data[MARKER_ROW] = 0
+    data[MARKER_ROW, ::500] = 1
+    return data
+
+
+def record(path, names, open_name=None):
+    writer = SessionWriter(path, N_ROWS, TIMESTAMP_ROW, MARKER_ROW)
+    for i, name in enumerate(names):
+        writer.begin_condition(name, volume=i)
+        writer.append(board_data(5000, i))
+        writer.end_condition()
+    if open_name is not None:
+        writer.begin_condition(open_name)
+        writer.append(board_data(SessionWriter.CHUNK_SAMPLES, 99))
+        writer.write_chunks()
+    return writer
+
+
+def test_index_overhead_is_linear(tmp_path):
+    path = str(tmp_path / "session.msync")
+    names = [f"c{i}" for i in range(40)]
+    record(path, names).close()
+
+    reader = SessionReader(path)
+    assert reader.conditions == names
+    assert reader.condition("c7")["params"] == {"volume": 7}
+    np.testing.assert_allclose(
+        reader.read("c7", [1, TIMESTAMP_ROW, MARKER_ROW]),
+        board_data(5000, 7)[[1, TIMESTAMP_ROW, MARKER_ROW]].T,
+        rtol=1e-6,
+    )
+
+    data_size = sum(
+        d_len + t_len
+        for name in names
+        for _, _, d_len, _, t_len in reader.condition(name)["chunks"]
+    )
+    index_size = len(json.dumps(reader.index))
+    assert os.path.getsize(path) - data_size < 2 * index_size
+
+
+def test_interrupted_condition_is_lost(tmp_path):
+    path = str(tmp_path / "session.msync")
+    writer = record(path, ["c0", "c1"], open_name="c2")
+    crashed = str(tmp_path / "crashed.msync")
+    shutil.copy(path, crashed)  # As left by a crash while c2 is recorded
+    writer.close()
+
+    assert SessionReader(crashed).conditions == ["c0", "c1"]
+    reader = SessionReader(path)
+    assert reader.conditions == ["c0", "c1"]
+    assert not reader.condition("c2")["complete"]
+
+    writer = SessionWriter.reopen(crashed)
+    assert writer.dropped == ["c2"]
+    writer.begin_condition("c2")
+    writer.append(board_data(100, 2))
+    writer.end_condition()
+    writer.close()
+    reader = SessionReader(crashed)
+    assert reader.conditions == ["c0", "c1", "c2"]
+    assert reader.condition("c2")["n_samples"] == 100
@@ -0,0 +1,75 @@
+import glob
+import os
+
+import mne
+import numpy as np
+import pytest
+
+from conftest import make_cfg
+from eeg_loader import EEGCSVLoader
+from measure_report import FMAX, FMIN, process_file
+
+RECORDINGS = os.path.join(os.path.dirname(__file__), "..", "Recordings")
+SAMPLES = sorted(glob.glob(os.path.join(RECORDINGS, "*_FREEEEG32_BOARD_c*.csv")))
+SAMPLE = SAMPLES[0] if SAMPLES else None
+
+# Recordings/ is not under version control
+pytestmark = pytest.mark.skipif(not SAMPLES, reason="no sample recording")
+
+
+@pytest.fixture(autouse=True)
+def matplotlib_browser():
+    mne.viz.set_browser_backend("matplotlib")
+
+
+def test_sample_recording_has_saturated_channels(tmp_path):
+    loader = EEGCSVLoader(make_cfg(tmp_path), SAMPLE, FMIN, FMAX)
+
+    assert list(loader.bads) == ["T8", "C3", "FC4", "CP3", "CP4"]
+    assert os.path.exists(loader.out_base + "_quality.csv")
+
+
+def test_default_output_is_unchanged(tmp_path):
+    """By default bad channels are only reported: the filtered data and the
+    plots are those of a run that finds no bad channels."""
+    screened = EEGCSVLoader(make_cfg(tmp_path / "a"), SAMPLE, FMIN, FMAX)
+    unscreened = EEGCSVLoader(
+        make_cfg(tmp_path / "b", max_saturation=1.0, max_flat=np.inf),
+        SAMPLE,
+        FMIN,
+        FMAX,
+    )
+
+    assert screened.bads and not unscreened.bads
+    assert screened.raw.info["bads"] == unscreened.raw.info["bads"] == []
+    np.testing.assert_array_equal(screened.raw.get_data(), unscreened.raw.get_data())
+
+    artifacts = {
+        name: sorted(os.path.basename(a) for a in process_file(cfg, SAMPLE)[0])
+        for name, cfg in (
+            ("screened", make_cfg(tmp_path / "c")),
+            ("unscreened", make_cfg(tmp_path / "d", max_saturation=1.0)),
+        )
+    }
+    assert artifacts["screened"] == artifacts["unscreened"]
+    assert any(a.endswith("_C3-C4_epochs_PSD.png") for a in artifacts["screened"])
+
+
+def test_exclude_bad_filters_all_channels(tmp_path):
+    default = EEGCSVLoader(make_cfg(tmp_path / "a"), SAMPLE, FMIN, FMAX)
+    excluded = EEGCSVLoader(
+        make_cfg(tmp_path / "b", exclude_bad=True), SAMPLE, FMIN, FMAX
+    )
+
+    assert sorted(excluded.raw.info["bads"]) == sorted(list(excluded.bads) + ["C3-C4"])
+    np.testing.assert_array_equal(default.raw.get_data(), excluded.raw.get_data())
+
+
+def test_max_bad_channels_skips_before_filtering(tmp_path):
+    loader = EEGCSVLoader(make_cfg(tmp_path, max_bad_channels=4), SAMPLE, FMIN, FMAX)
+
+    assert loader.skipped
+    assert not hasattr(loader, "raw")
+    assert [os.path.basename(a) for a in loader.artifacts] == [
+        os.path.basename(loader.out_base) + "_quality.csv"
+    ]
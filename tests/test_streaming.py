@@ -0,0 +1,79 @@
+"""The streaming path (--stream) against the in-memory one, on a synthetic
+FreeEEG32 recording"""
+
+import mne
+import numpy as np
+import pytest
+
+from benchmark_report import write_recording
+from conftest import make_cfg
+from eeg_loader import EEGCSVLoader, EEGCSVStreamer
+from marker_epochs import OFF, ON
+from measure_report import FMAX, FMIN
+
+DURATION = 95  # s, ends within an ON period
+CYCLE = 10  # s
+CHUNK_SIZE = 5000  # Samples, not a multiple of the epoch length or n_fft
+
+
+@pytest.fixture(scope="module")
+def loaders(tmp_path_factory):
+    tmp_path = tmp_path_factory.mktemp("streaming")
+    fname = str(tmp_path / "synthetic_FREEEEG32_BOARD.csv")
+    write_recording(fname, "freeeeg32", DURATION, CYCLE)
+
+    memory = EEGCSVLoader(make_cfg(tmp_path / "memory"), fname, FMIN, FMAX)
+    stream = EEGCSVStreamer(
+        make_cfg(tmp_path / "stream", stream=True, chunk_size=CHUNK_SIZE),
+        fname,
+        FMIN,
+        FMAX,
+    )
+    return memory, stream
+
+
+def test_same_epochs(loaders):
+    memory, stream = loaders
+    ch_names, epochs, labels = memory.onoff_epochs()
+    n_fft = stream.EPOCH_N_FFT
+
+    assert stream.psd_names == ch_names
+    np.testing.assert_array_equal(
+        stream.marker_epochs.events(), memory.marker_epochs.events()
+    )
+    assert stream.marker_epochs.n_samples == memory.marker_epochs.n_samples
+    for value in (ON, OFF):
+        assert stream.epoch_stats.count[value] == np.sum(labels == value) > 0
+
+        psd, freqs = mne.time_frequency.psd_array_welch(
+            epochs[labels == value], memory.sfreq, n_fft=n_fft, verbose=False
+        )
+        np.testing.assert_allclose(stream.epoch_freqs, freqs)
+        np.testing.assert_allclose(
+            stream.epoch_stats.mean(value), psd.mean(axis=0), rtol=1e-6
+        )
+
+
+def test_same_recording_psd(loaders):
+    memory, stream = loaders
+    spectrum = memory.raw.compute_psd(picks="eeg", n_fft=stream.RAW_N_FFT)
+
+    assert spectrum.ch_names == stream.psd_names
+    np.testing.assert_allclose(stream.psd_all.freqs, spectrum.freqs)
+    np.testing.assert_allclose(stream.psd_all.psd(), spectrum.get_data(), rtol=1e-6)
+
+
+def test_same_epoch_spread(loaders):
+    memory, stream = loaders
+    _, epochs, labels = memory.onoff_epochs()
+
+    for value in (ON, OFF):
+        psd, _ = mne.time_frequency.psd_array_welch(
+            epochs[labels == value],
+            memory.sfreq,
+            n_fft=stream.EPOCH_N_FFT,
+            verbose=False,
+        )
+        np.testing.assert_allclose(
+            stream.epoch_stats.std(value), psd.std(axis=0, ddof=1), rtol=1e-5
+        )